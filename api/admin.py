@@ -1,6 +1,8 @@
 from django.contrib import admin
 
 from api.models import Order, OrderItem, User
+from api.outbox import record_order_created, record_status_change
+from api.rollups import stored_sales_lines, update_sales_rollups
 
 # Register your models here.
 
@@ -14,6 +16,20 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [
         OrderItemInline,
     ]
+    readonly_fields = ('total_price', 'item_count')
+
+    def save_related(self, request, form, formsets, change):
+        order = form.instance
+        # The order itself is saved by now; its items are not.
+        sales = stored_sales_lines(order, form.initial.get('status')) if change else {}
+        super().save_related(request, form, formsets, change)
+        order.recalculate_totals()
+        update_sales_rollups(sales, stored_sales_lines(order))
+        # The admin saves the order and its items in one transaction.
+        if not change:
+            record_order_created(order, order.items.all())
+        elif 'status' in form.changed_data:
+            record_status_change(order, form.initial['status'])
 
 
 admin.site.register(Order, OrderAdmin)
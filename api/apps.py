@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from api import signals  # noqa: F401 pylint: disable=unused-import,import-outside-toplevel
+        # Registers the drf-spectacular extensions.
+        from api import schema  # noqa: F401 pylint: disable=unused-import,import-outside-toplevel
@@ -0,0 +1,156 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import exceptions, filters
+from rest_framework.request import Request
+
+from api.authentication import AsyncJWTAuthentication
+from api.catalog import aget_product_summary
+from api.fast_serializers import serialize
+from api.filters import InStockFilterBackend, ProductFilter
+from api.models import Order, Product
+from api.pagination import KeysetPagination, ProductCursorPagination
+from api.renderers import FastJSONRenderer
+from api.search import FullTextSearchFilter
+from api.serializers import (OrderSerializer, ProductInfoSerializer,
+                             ProductSerializer)
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of DRF's ``APIView`` for read endpoints.
+
+    Handlers are coroutines that receive a DRF ``Request`` and return
+    response data, rendered with ``FastJSONRenderer``. Users are authenticated
+    with a bearer JWT or, failing that, the session (``request.auser()``),
+    the same order as ``DEFAULT_AUTHENTICATION_CLASSES``; API errors are
+    returned the way DRF formats them. Serializers are only given rows
+    that are already loaded, so no query runs outside the async ORM.
+    """
+    authentication = AsyncJWTAuthentication()
+    renderer = FastJSONRenderer()
+    requires_authentication = False
+    filter_backends = []
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        if method not in self.http_method_names or not hasattr(self, method):
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        try:
+            drf_request = Request(request)
+            drf_request.user = await self.authenticate(request)
+            if (self.requires_authentication
+                    and not drf_request.user.is_authenticated):
+                raise exceptions.NotAuthenticated()
+            data = await getattr(self, method)(drf_request, *args, **kwargs)
+        except Http404 as exc:
+            return self.error_response(exceptions.NotFound(*exc.args))
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+        return HttpResponse(
+            self.renderer.render(data), content_type='application/json')
+
+    async def authenticate(self, request):
+        result = await self.authentication.aauthenticate(request)
+        if result is not None:
+            return result[0]
+        return await request.auser()
+
+    def error_response(self, exc):
+        detail = exc.detail
+        data = detail if isinstance(detail, (list, dict)) else {'detail': detail}
+        response = HttpResponse(
+            self.renderer.render(data), status=exc.status_code,
+            content_type='application/json')
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = \
+                self.authentication.authenticate_header(request=None)
+        return response
+
+    def get_serializer_context(self, request):
+        return {'request': request, 'format': None, 'view': self}
+
+    def filter_queryset(self, request, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+
+class AsyncProductListView(AsyncAPIView):
+    """
+    Async ``GET /products/``, with the same filters, search, ordering and
+    keyset pages as ``ProductListCreateAPIView``.
+    """
+    filterset_class = ProductFilter
+    filter_backends = [
+        DjangoFilterBackend,
+        FullTextSearchFilter,
+        filters.OrderingFilter,
+        InStockFilterBackend
+    ]
+    search_fields = ['name', 'description']
+    ordering_fields = ['name', 'price', 'stock']
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Product.objects.all()  # pylint: disable=no-member
+
+    async def get(self, request):
+        queryset = self.filter_queryset(request, self.get_queryset())
+        paginator = self.pagination_class()
+        products = await paginator.apaginate_queryset(queryset, request, view=self)
+        data = serialize(
+            ProductSerializer, products, many=True,
+            context=self.get_serializer_context(request))
+        return paginator.get_paginated_response(data).data
+
+
+class AsyncProductDetailView(AsyncAPIView):
+    """Async ``GET /products/<pk>/``."""
+
+    async def get(self, request, pk):
+        try:
+            product = await Product.objects.aget(pk=pk)  # pylint: disable=no-member
+        except Product.DoesNotExist as e:  # pylint: disable=no-member
+            raise Http404('No Product matches the given query.') from e
+        return serialize(
+            ProductSerializer, product,
+            context=self.get_serializer_context(request))
+
+
+class AsyncProductInfoView(AsyncAPIView):
+    """
+    Async ``GET /products/info/``. The summary comes from ``aaggregate``;
+    DRF's cursor paginator has no async API, so its page query still runs
+    through ``sync_to_async``.
+    """
+    pagination_class = ProductCursorPagination
+
+    async def get(self, request):
+        paginator = self.pagination_class()
+        products = await sync_to_async(paginator.paginate_queryset)(
+            Product.objects.all(), request, view=self)  # pylint: disable=no-member
+        return ProductInfoSerializer({
+            "products": products,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            **await aget_product_summary(),
+        }).data
+
+
+class AsyncUserOrdersView(AsyncAPIView):
+    """Async ``GET /user-orders/``: the user's orders with their items."""
+    requires_authentication = True
+    chunk_size = 2000
+
+    async def get(self, request):
+        queryset = Order.objects.prefetch_items().filter(  # pylint: disable=no-member
+            user=request.user)
+        orders = [
+            order async for order in queryset.aiterator(chunk_size=self.chunk_size)
+        ]
+        return serialize(
+            OrderSerializer, orders, many=True,
+            context=self.get_serializer_context(request))
@@ -0,0 +1,271 @@
+import atexit
+import copy
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer as BaseTokenObtainPairSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from api.cache import LocMemLRUBackend
+from api.db import bulk_update_rows
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_APP = 'rest_framework_simplejwt.token_blacklist'
+
+DEFAULTS = {
+    # Seconds a cached user is trusted without reloading it. Saves in this
+    # process invalidate it at once; saves elsewhere within this long.
+    'USER_TTL': 60,
+    'MAX_USERS': 10000,
+    # Seconds between reloads of the token blacklist.
+    'BLACKLIST_REFRESH_INTERVAL': 30,
+    # Seconds between writes of buffered last_login times.
+    'LAST_LOGIN_FLUSH_INTERVAL': 10,
+}
+
+
+def auth_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_AUTH_CACHE', {})}
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide LRU of authenticated users, keyed by id."""
+    global _user_cache  # pylint: disable=global-statement
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = LocMemLRUBackend(
+                    max_entries=auth_cache_settings()['MAX_USERS'])
+    return _user_cache
+
+
+def invalidate_user(user_id):
+    get_user_cache().delete(str(user_id))
+
+
+class TokenBlacklist:
+    """
+    In-memory set of blacklisted token ids from simplejwt's
+    ``token_blacklist`` tables, so a check is a set lookup rather than a
+    query. The set is reloaded when it is older than
+    ``BLACKLIST_REFRESH_INTERVAL`` seconds, or after ``invalidate()``,
+    which ``api.signals`` calls whenever a token is blacklisted in this
+    process. Always empty when the app is not installed.
+    """
+
+    def __init__(self):
+        self._jtis = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        self.refresh_if_stale()
+        return jti in self._jtis
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def refresh_if_stale(self):
+        if not apps.is_installed(BLACKLIST_APP):
+            return
+        interval = auth_cache_settings()['BLACKLIST_REFRESH_INTERVAL']
+        if self._loaded_at is not None \
+                and time.monotonic() - self._loaded_at < interval:
+            return
+        with self._lock:
+            if self._loaded_at is None \
+                    or time.monotonic() - self._loaded_at >= interval:
+                self.refresh()
+
+    def refresh(self):
+        from rest_framework_simplejwt.token_blacklist.models import \
+            BlacklistedToken  # pylint: disable=import-outside-toplevel
+        # Stamped first: a blacklisting during the query invalidates again.
+        self._loaded_at = time.monotonic()
+        self._jtis = frozenset(
+            BlacklistedToken.objects.filter(  # pylint: disable=no-member
+                token__expires_at__gt=timezone.now(),
+            ).values_list('token__jti', flat=True))
+
+
+blacklist = TokenBlacklist()
+
+
+class LastLoginBuffer:
+    """
+    Coalesces ``last_login`` writes. Logins record their time in memory and
+    a background thread writes the latest time per user every
+    ``LAST_LOGIN_FLUSH_INTERVAL`` seconds, as one batch. With
+    ``background=False`` nothing is written until ``flush`` is called.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, user):
+        user.last_login = timezone.now()
+        with self._lock:
+            self._pending[user.pk] = user.last_login
+            if self.background and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='last-login-flusher', daemon=True)
+                self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            time.sleep(auth_cache_settings()['LAST_LOGIN_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to write last_login times')
+
+    def flush(self):
+        """Write out every buffered login time."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            user_model = apps.get_model(settings.AUTH_USER_MODEL)
+            bulk_update_rows(
+                [user_model(pk=pk, last_login=last_login)
+                 for pk, last_login in pending.items()],
+                ['last_login'])
+
+
+last_logins = LastLoginBuffer()
+atexit.register(last_logins.flush)
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """
+    simplejwt's ``TokenObtainPairSerializer`` with ``UPDATE_LAST_LOGIN``
+    handled by ``last_logins`` instead of a write per login.
+    """
+
+    def validate(self, attrs):
+        # Skip the base class's validate, which writes last_login itself.
+        data = super(BaseTokenObtainPairSerializer, self).validate(attrs)
+
+        refresh = self.get_token(self.user)
+        data['refresh'] = str(refresh)
+        data['access'] = str(refresh.access_token)
+
+        if api_settings.UPDATE_LAST_LOGIN:
+            last_logins.record(self.user)
+
+        return data
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that takes the user from a per-process TTL cache
+    (``API_AUTH_CACHE``) instead of loading it on every request, and
+    rejects tokens whose id is in the token ``blacklist``. With a warm
+    cache, authenticating runs no queries.
+
+    Cached users are invalidated when saved or deleted in this process
+    (see ``api.signals``); each request gets its own copy. The active and
+    password-change checks run on every request, as with the stock class.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if validated_token.get(api_settings.JTI_CLAIM) in blacklist:
+            raise InvalidToken(_('Token is blacklisted'))
+        return validated_token
+
+    def get_user(self, validated_token):
+        key = str(self.get_user_id(validated_token))
+        user = get_user_cache().get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            get_user_cache().set(
+                key, copy.copy(user), auth_cache_settings()['USER_TTL'])
+            return user
+        self.check_user(user, validated_token)
+        return copy.copy(user)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+    def check_user(self, user, validated_token):
+        """The checks ``JWTAuthentication.get_user`` makes on a loaded user."""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    ``CachedJWTAuthentication`` with an ``aauthenticate`` coroutine for
+    async views. Token validation is pure computation; only a user cache
+    miss touches the database, and it goes through the async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        # Reload a stale blacklist here, off the event loop.
+        await sync_to_async(blacklist.refresh_if_stale)()
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        key = str(user_id)
+        user = get_user_cache().get(key)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(
+                    **{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                ) from e
+            self.check_user(user, validated_token)
+            get_user_cache().set(
+                key, copy.copy(user), auth_cache_settings()['USER_TTL'])
+            return user
+        self.check_user(user, validated_token)
+        return copy.copy(user)
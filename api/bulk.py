@@ -0,0 +1,160 @@
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.settings import api_settings
+
+from api.catalog import (bump_catalog_version_on_commit,
+                         coalesce_catalog_bumps)
+from api.db import bulk_update_rows
+from api.models import Product
+from api.search import get_search_backend
+from api.serializers import ProductSerializer
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class ProductBulkWriter:
+    """
+    Applies rows of product changes in chunks of ``chunk_size``, one
+    transaction per chunk.
+
+    A row without an ``id`` creates a product; a row with one updates the
+    fields it carries, or deletes the product with ``"op": "delete"``
+    (``op`` may also name ``create`` or ``update`` explicitly). Rows are
+    validated with ``ProductSerializer``, partially for updates, and
+    written with ``bulk_create`` and one ``bulk_update_rows`` per set of
+    changed fields, so an update never rewrites a column its row did not
+    send. Deletes go through the ORM so related rows cascade as usual.
+    An invalid row is reported and skipped without affecting the rest of
+    its chunk. The search index is updated per chunk and the catalog
+    version is bumped once, at the end.
+    """
+    serializer_class = ProductSerializer
+    chunk_size = 1000
+
+    def __init__(self, chunk_size=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+
+    def apply(self, rows):
+        """
+        Apply ``rows`` and return the number of rows created, updated,
+        deleted and rejected, with a result for every row in input order.
+        """
+        rows = iter(rows)
+        results = []
+        with coalesce_catalog_bumps():
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                results.extend(self.apply_chunk(len(results), chunk))
+        counts = Counter(result['status'] for result in results)
+        return {
+            'created': counts['created'],
+            'updated': counts['updated'],
+            'deleted': counts['deleted'],
+            'errors': counts['error'],
+            'results': results,
+        }
+
+    def apply_chunk(self, offset, chunk):
+        results = {}
+        planned = []
+        for index, row in enumerate(chunk, start=offset):
+            try:
+                planned.append((index, row, *self.parse_row(row)))
+            except APIException as exc:
+                results[index] = self.error(index, exc.detail)
+
+        # One serializer per mode for the chunk: building a ModelSerializer's
+        # fields costs more than validating a row with them.
+        validators = {
+            'create': self.serializer_class(),
+            'update': self.serializer_class(partial=True),
+        }
+        with transaction.atomic():
+            existing = Product.objects.in_bulk(  # pylint: disable=no-member
+                {pk for _, _, op, pk in planned if op != 'create'})
+            now = timezone.now()
+            created, deleted = [], set()
+            updated = defaultdict(dict)
+            for index, row, op, pk in planned:
+                if op != 'create' and pk not in existing:
+                    results[index] = self.error(index, {'id': [
+                        f'Invalid pk "{pk}" - object does not exist.']})
+                    continue
+                if op == 'delete':
+                    deleted.add(pk)
+                    results[index] = self.result(index, 'deleted', pk)
+                    continue
+                serializer = validators[op]
+                serializer.instance = existing.get(pk)
+                try:
+                    validated_data = serializer.run_validation(row)
+                except ValidationError as exc:
+                    results[index] = self.error(index, exc.detail)
+                    continue
+                if op == 'create':
+                    created.append((index, Product(**validated_data)))
+                else:
+                    product = existing[pk]
+                    for attr, value in validated_data.items():
+                        setattr(product, attr, value)
+                    product.updated_at = now
+                    updated[frozenset(validated_data)][pk] = product
+                    results[index] = self.result(index, 'updated', pk)
+
+            products = [product for _, product in created]
+            if products:
+                Product.objects.bulk_create(products)  # pylint: disable=no-member
+            for fields, group in updated.items():
+                bulk_update_rows(group.values(), [*sorted(fields), 'updated_at'])
+            # Bulk writes skip the Product signals that keep these current.
+            get_search_backend().index_many([
+                *products,
+                *{pk: product for group in updated.values()
+                  for pk, product in group.items()}.values(),
+            ])
+            if deleted:
+                Product.objects.filter(pk__in=deleted).delete()  # pylint: disable=no-member
+            bump_catalog_version_on_commit()
+
+        for index, product in created:
+            results[index] = self.result(index, 'created', product.pk)
+        return [results[index] for index in sorted(results)]
+
+    def parse_row(self, row):
+        """Return the row's operation and product id (None to create)."""
+        if isinstance(row, APIException):
+            raise row
+        if not isinstance(row, dict):
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['Expected an object.']})
+        op = row.get('op') or (
+            'create' if row.get('id') is None else 'update')
+        if op not in OPERATIONS:
+            raise ValidationError({'op': [f'"{op}" is not a valid choice.']})
+        if op == 'create':
+            return op, None
+        try:
+            pk = Product._meta.pk.to_python(row.get('id'))  # pylint: disable=protected-access
+        except DjangoValidationError:
+            pk = None
+        if pk is None:
+            raise ValidationError({'id': ['A valid product id is required.']})
+        return op, pk
+
+    @staticmethod
+    def result(index, status, pk):
+        return {'index': index, 'status': status, 'id': pk}
+
+    @staticmethod
+    def error(index, detail):
+        if not isinstance(detail, dict):
+            detail = {api_settings.NON_FIELD_ERRORS_KEY: [detail]}
+        return {'index': index, 'status': 'error', 'errors': detail}
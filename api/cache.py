@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocMemLRUBackend:
+    """
+    Per-process response store with LRU eviction.
+
+    Values are kept as-is rather than pickled, so cached data must not be
+    mutated by callers.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Response store backed by one of the ``CACHES`` aliases, for sharing
+    cached responses between processes (e.g. through Redis or Memcached).
+    """
+
+    def __init__(self, alias='default', key_prefix='api:response:'):
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.cache.get(self.key_prefix + key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(self.key_prefix + key, value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(self.key_prefix + key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized response data.
+
+    Keys combine the request path, its normalized query parameters and the
+    catalog version, so any catalog change invalidates every entry at once
+    by moving readers to a new key space. Hits and misses are counted per
+    process.
+    """
+    # Parameters that change how a response is rendered but not its data.
+    ignored_params = ('format',)
+
+    def __init__(self, backend, timeout=300):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, request, version):
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if name not in self.ignored_params
+        )
+        raw = repr((version, request.get_host(), request.path, params))
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide ``ResponseCache`` built from settings."""
+    global _response_cache  # pylint: disable=global-statement
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                config = getattr(settings, 'API_RESPONSE_CACHE', {})
+                backend_class = import_string(config.get(
+                    'BACKEND', 'api.cache.LocMemLRUBackend'))
+                _response_cache = ResponseCache(
+                    backend_class(**config.get('OPTIONS', {})),
+                    timeout=config.get('TIMEOUT', 300),
+                )
+    return _response_cache
@@ -0,0 +1,151 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+
+from api.models import Product
+from api.routers import primary_reads
+
+CATALOG_VERSION_KEY = 'api:catalog-version'
+# Cache backends that keep their data inside one process.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+PRODUCT_SUMMARY_CACHE_KEY = 'api:product-summary:{version}'
+PRODUCT_SUMMARY_CACHE_TIMEOUT = getattr(
+    settings, 'PRODUCT_SUMMARY_CACHE_TIMEOUT', 300)
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version. Cached catalog data is keyed on it,
+    so bumping the version invalidates all of it at once.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a flushed cache never reuses old versions.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def catalog_version_is_shared():
+    """
+    Whether every process sees the same catalog version, i.e. the default
+    cache is not local to one process.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    return backend not in PROCESS_LOCAL_CACHES
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_catalog_version_cache(app_configs, **kwargs):
+    """
+    The catalog version lives in the default cache. When that cache is
+    local to a process, other worker processes never see a bump and serve
+    their cached catalog data until it expires.
+    """
+    if catalog_version_is_shared():
+        return []
+    return [checks.Warning(
+        'The catalog version is kept in a per-process cache, so a catalog '
+        'change in one worker process does not invalidate the cached '
+        'catalog data of the others.',
+        hint="Point CACHES['default'] at a shared cache such as Redis or "
+             "Memcached when running more than one process.",
+        id='api.W001',
+    )]
+
+
+_coalescing = threading.local()
+
+
+def bump_catalog_version():
+    if getattr(_coalescing, 'active', False):
+        _coalescing.pending = True
+        return
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def bump_catalog_version_on_commit():
+    """
+    Bump the catalog version once the current transaction commits (at
+    once outside of one). Bumping before the commit would let a concurrent
+    read cache the old rows under the new version.
+    """
+    if getattr(_coalescing, 'active', False):
+        _coalescing.pending = True
+        return
+    transaction.on_commit(bump_catalog_version)
+
+
+@contextmanager
+def coalesce_catalog_bumps():
+    """
+    Hold back the catalog version bumps made in this thread inside the
+    block, e.g. by product signals during a bulk write, and bump once on
+    the way out, after the enclosing transaction commits, if there were any.
+    """
+    if getattr(_coalescing, 'active', False):
+        yield
+        return
+    _coalescing.active, _coalescing.pending = True, False
+    try:
+        yield
+    finally:
+        _coalescing.active = False
+        if _coalescing.pending:
+            transaction.on_commit(bump_catalog_version)
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+PRODUCT_SUMMARY_AGGREGATES = {
+    'count': Count('pk'),
+    'in_stock_count': Count('pk', filter=Q(stock__gt=0)),
+    'max_price': Max('price'),
+    'min_price': Min('price'),
+    'avg_price': Avg('price'),
+}
+
+
+def get_product_summary():
+    """
+    Return catalog-wide product statistics, computed with a single
+    aggregate query and cached until a product changes.
+    """
+    key = PRODUCT_SUMMARY_CACHE_KEY.format(version=get_catalog_version())
+    summary = cache.get(key)
+    if summary is None:
+        with primary_reads():
+            summary = Product.objects.aggregate(  # pylint: disable=no-member
+                **PRODUCT_SUMMARY_AGGREGATES)
+        cache.set(key, summary, PRODUCT_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+async def aget_product_summary():
+    """Async ``get_product_summary``, sharing its cache entries."""
+    key = PRODUCT_SUMMARY_CACHE_KEY.format(version=await aget_catalog_version())
+    summary = await cache.aget(key)
+    if summary is None:
+        with primary_reads():
+            summary = await Product.objects.aaggregate(  # pylint: disable=no-member
+                **PRODUCT_SUMMARY_AGGREGATES)
+        await cache.aset(key, summary, PRODUCT_SUMMARY_CACHE_TIMEOUT)
+    return summary
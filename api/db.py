@@ -0,0 +1,30 @@
+from django.db import connections, router
+
+
+def bulk_update_rows(objs, field_names):
+    """
+    Write ``field_names`` of ``objs``, which must share a model, with one
+    ``executemany`` of plain ``UPDATE ... WHERE pk = %s`` statements.
+
+    Used instead of ``QuerySet.bulk_update``, whose ``CASE WHEN`` per field
+    and batch costs several times more than the writes themselves at feed
+    sizes.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    model = type(objs[0])
+    meta = model._meta  # pylint: disable=protected-access
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in field_names]
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        quote(meta.db_table),
+        ', '.join(f'{quote(field.column)} = %s' for field in fields),
+        quote(meta.pk.column))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection)
+             for field in fields] + [obj.pk]
+            for obj in objs
+        ])
@@ -0,0 +1,203 @@
+import decimal
+import inspect
+import threading
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import (FieldDoesNotExist, ImproperlyConfigured,
+                                    ObjectDoesNotExist)
+from django.db import models
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import SkipField, is_simple_callable
+from rest_framework.relations import PKOnlyObject
+
+# Fields whose to_representation is exactly str(value) / int(value) / float(value).
+STR_FIELDS = (fields.CharField, fields.EmailField, fields.SlugField,
+              fields.URLField, fields.RegexField)
+# Representations that need the request in the serializer context.
+CONTEXT_FIELDS = (fields.FileField, relations.HyperlinkedRelatedField)
+
+
+def _identity(value):
+    return value
+
+
+def _pk(value):
+    return value.pk if isinstance(value, PKOnlyObject) else value
+
+
+def _property_getter(name):
+    def get(instance):
+        value = getattr(instance, name)
+        return value() if is_simple_callable(value) else value
+    return get
+
+
+def _decimal_converter(field):
+    """
+    ``DecimalField.to_representation`` with its quantize context built once
+    instead of per value.
+    """
+    if (field.localize or field.normalize_output
+            or not getattr(field, 'coerce_to_string', True)
+            or field.decimal_places is None):
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(
+            value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _model_path(model, attrs):
+    """
+    Whether ``attrs`` walks forward relations to a concrete column, so that
+    a plain ``attrgetter`` reads the same value DRF would.
+    """
+    for position, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)  # pylint: disable=protected-access
+        except FieldDoesNotExist:
+            return False
+        if position == len(attrs) - 1:
+            return model_field.concrete and not model_field.is_relation
+        if not (model_field.many_to_one or model_field.one_to_one) \
+                or not model_field.concrete:
+            return False
+        model = model_field.related_model
+    return False
+
+
+class CompiledSerializer:
+    """
+    Read-only plan for a ``ModelSerializer`` class, compiled once from its
+    fields: one getter and one converter per field, with DRF's generic
+    ``get_attribute``/``to_representation`` dispatch resolved ahead of time.
+    Nested serializers are compiled too.
+
+    Output is the same as ``serializer_class(instance).data``. Fields whose
+    output depends on the request (file URLs, hyperlinks) are rejected, and
+    ``SerializerMethodField`` methods must not use the serializer context.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        serializer = serializer_class()
+        model = serializer.Meta.model
+        self.plan = [
+            self.compile_field(serializer, model, field)
+            for field in serializer._readable_fields  # pylint: disable=protected-access
+        ]
+
+    def compile_field(self, serializer, model, field):
+        if isinstance(field, CONTEXT_FIELDS):
+            raise ImproperlyConfigured(
+                f'{self.serializer_class.__name__}.{field.field_name} needs the '
+                'request to render and cannot be compiled.')
+        return (field.field_name, self.getter(model, field),
+                field.get_attribute, self.converter(serializer, field))
+
+    def getter(self, model, field):
+        if field.source == '*':
+            return _identity
+        attrs = field.source_attrs
+        if isinstance(field, relations.RelatedField) \
+                and field.use_pk_only_optimization() and len(attrs) == 1:
+            model_field = model._meta.get_field(attrs[0])  # pylint: disable=protected-access
+            if model_field.many_to_one or model_field.one_to_one:
+                return attrgetter(model_field.attname)
+        if _model_path(model, attrs):
+            return attrgetter('.'.join(attrs))
+        if len(attrs) == 1 and isinstance(
+                inspect.getattr_static(model, attrs[0], None), property):
+            return _property_getter(attrs[0])
+        # Properties, methods and reverse relations: DRF's own lookup.
+        return field.get_attribute
+
+    def converter(self, serializer, field):
+        field_type = type(field)
+        if isinstance(field, serializers.SerializerMethodField):
+            return getattr(serializer, field.method_name)
+        if isinstance(field, serializers.ListSerializer) \
+                and isinstance(field.child, serializers.ModelSerializer):
+            child = compiled_serializer(type(field.child))
+
+            def convert_many(value):
+                if isinstance(value, models.manager.BaseManager):
+                    value = value.all()
+                return [child.to_representation(item) for item in value]
+            return convert_many
+        if isinstance(field, serializers.ModelSerializer):
+            return compiled_serializer(field_type).to_representation
+        if field_type in STR_FIELDS:
+            return str
+        if field_type is fields.IntegerField:
+            return int
+        if field_type is fields.FloatField:
+            return float
+        if field_type is fields.UUIDField and field.uuid_format == 'hex_verbose':
+            return str
+        if field_type is fields.DecimalField:
+            return _decimal_converter(field)
+        if field_type is fields.ReadOnlyField:
+            return _identity
+        if field_type is relations.PrimaryKeyRelatedField and field.pk_field is None:
+            return _pk
+        return field.to_representation
+
+    def to_representation(self, instance):
+        ret = {}
+        for name, get, get_slow, convert in self.plan:
+            try:
+                value = get(instance)
+            except (AttributeError, ObjectDoesNotExist):
+                # e.g. a null relation on the way: let DRF decide.
+                try:
+                    value = get_slow(instance)
+                except SkipField:
+                    continue
+            if value is None or (
+                    isinstance(value, PKOnlyObject) and value.pk is None):
+                ret[name] = None
+            else:
+                ret[name] = convert(value)
+        return ret
+
+    def many(self, instances):
+        to_representation = self.to_representation
+        return [to_representation(instance) for instance in instances]
+
+
+_compiled = {}
+# Re-entrant: nested serializers are compiled while the lock is held.
+_compiled_lock = threading.RLock()
+
+
+def compiled_serializer(serializer_class):
+    """Return the cached ``CompiledSerializer`` for ``serializer_class``."""
+    compiled = _compiled.get(serializer_class)
+    if compiled is None:
+        with _compiled_lock:
+            compiled = _compiled.get(serializer_class)
+            if compiled is None:
+                compiled = CompiledSerializer(serializer_class)
+                _compiled[serializer_class] = compiled
+    return compiled
+
+
+def serialize(serializer_class, instance, many=False, context=None):
+    """
+    Representation of ``instance`` for read endpoints, through the compiled
+    plan unless ``API_COMPILED_SERIALIZERS`` is off.
+    """
+    if getattr(settings, 'API_COMPILED_SERIALIZERS', True):
+        compiled = compiled_serializer(serializer_class)
+        return compiled.many(instance) if many else compiled.to_representation(instance)
+    return serializer_class(instance, many=many, context=context).data
@@ -1,5 +1,8 @@
+from datetime import datetime, time, timedelta
+
 import django_filters
-from api.models import Product, Order
+from django.utils import timezone
+from api.models import DailySales, Product, Order
 from rest_framework import filters
 
 
@@ -32,8 +35,10 @@ class OrderFilter(django_filters.FilterSet):
     """
     Filter for orders.
     """
-    # This enables filtering by date of order.
-    created_at = django_filters.DateFilter(field_name='created_at__date')
+    # This enables filtering by date of order. It is matched as a half-open
+    # datetime range rather than with created_at__date, which wraps the
+    # column in a function and so cannot use an index.
+    created_at = django_filters.DateFilter(method='filter_created_on')
 
     class Meta:
         """
@@ -45,3 +50,42 @@ class OrderFilter(django_filters.FilterSet):
             'created_at': ['exact', 'lt', 'gt', 'range'],
             'user': ['exact'],
         }
+
+    def filter_created_on(self, queryset, name, value):
+        start = timezone.make_aware(
+            datetime.combine(value, time.min), timezone.get_current_timezone())
+        return queryset.filter(**{
+            f'{name}__gte': start,
+            f'{name}__lt': start + timedelta(days=1),
+        })
+
+
+class DateRangeFilter(django_filters.BaseRangeFilter, django_filters.DateFilter):
+    """Comma-separated ``start,end`` dates, inclusive."""
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Comma-separated numbers."""
+
+
+class SalesFilter(django_filters.FilterSet):
+    """
+    Filter for sales rollups, taking ``OrderFilter``'s date and status
+    parameters. Rollups are daily, so the dates are whole days. Products
+    are matched by id, without looking them up.
+    """
+    product = django_filters.NumberFilter(field_name='product_id')
+    product__in = NumberInFilter(field_name='product_id', lookup_expr='in')
+    created_at = django_filters.DateFilter(field_name='date')
+    created_at__lt = django_filters.DateFilter(field_name='date', lookup_expr='lt')
+    created_at__gt = django_filters.DateFilter(field_name='date', lookup_expr='gt')
+    created_at__range = DateRangeFilter(field_name='date', lookup_expr='range')
+
+    class Meta:
+        """
+        Meta class for SalesFilter.
+        """
+        model = DailySales
+        fields = {
+            'status': ['exact'],
+        }
@@ -0,0 +1,266 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from api.catalog import bump_catalog_version
+from api.models import Product
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Rendition name -> longest edge in pixels. Each size is built as JPEG
+    # (``<name>``) and WebP (``<name>_webp``), never enlarged.
+    'SIZES': {'thumb': 160, 'medium': 800},
+    'QUALITY': 82,
+    # Processes building renditions; None for one per CPU.
+    'WORKERS': None,
+    # Storage directory of the content-addressed renditions.
+    'PREFIX': 'renditions',
+}
+
+FORMATS = {
+    # suffix -> (Pillow format, extension, save options)
+    '': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+    '_webp': ('WEBP', 'webp', {'method': 4}),
+}
+
+
+def image_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_IMAGES', {})}
+
+
+def rendition_paths(digest, config=None):
+    """Storage path of each rendition of the image with ``digest``."""
+    config = config or image_settings()
+    directory = f"{config['PREFIX']}/{digest[:2]}/{digest}"
+    return {
+        f'{name}{suffix}': f'{directory}/{name}.{extension}'
+        for name in config['SIZES']
+        for suffix, (_, extension, _) in FORMATS.items()
+    }
+
+
+def rendition_urls(digest):
+    return {
+        name: default_storage.url(path)
+        for name, path in rendition_paths(digest).items()
+    }
+
+
+def render_renditions(data, sizes, quality):
+    """
+    Encode every rendition of the image in ``data``. Runs in the worker
+    processes, so it only touches Pillow.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    rendered = {}
+    for name, edge in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for suffix, (image_format, _, options) in FORMATS.items():
+            mode = 'RGBA' if has_alpha and image_format == 'WEBP' else 'RGB'
+            buffer = io.BytesIO()
+            resized.convert(mode).save(
+                buffer, image_format, quality=quality, **options)
+            rendered[f'{name}{suffix}'] = buffer.getvalue()
+    return rendered
+
+
+class RenditionBuilder:
+    """
+    Builds the renditions of product images across a pool of
+    ``WORKERS`` processes, one image per task.
+
+    Renditions are stored under the SHA-256 of the original's bytes, so a
+    product whose image was uploaded before, under any name, reuses the
+    stored renditions without rendering them again. Once an image's
+    renditions are stored its digest is written to ``Product.image_digest``,
+    which is what ``ProductSerializer`` builds the rendition URLs from.
+    """
+
+    def __init__(self, workers=None):
+        self.config = image_settings()
+        self.workers = workers or self.config['WORKERS'] or os.cpu_count()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def pool(self):
+        # Spawned, not forked: the builder also runs on a thread of the web
+        # process, where a fork could copy locks held by other threads.
+        # Workers set Django up to import this module.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup)
+        return self._pool
+
+    def build(self, products):
+        """
+        Build the missing renditions of ``products`` and record their
+        digests. Return a ``Counter`` of products ``rendered``,
+        ``deduplicated`` (renditions already stored), ``unchanged`` and
+        ``failed``.
+        """
+        outcomes = Counter()
+        digests, jobs = {}, {}
+        for product in products:
+            try:
+                with default_storage.open(product.image.name, 'rb') as file:
+                    data = file.read()
+            except (OSError, ValueError):
+                logger.exception('Cannot read the image of product %s', product.pk)
+                outcomes['failed'] += 1
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in jobs and not self.stored(digest):
+                jobs[digest] = data
+            digests[product] = digest
+
+        written = self.write(self.render(jobs))
+        unclaimed = set(written)
+        updated = False
+        for product, digest in digests.items():
+            if digest in jobs and digest not in written:
+                outcomes['failed'] += 1
+                continue
+            if digest != product.image_digest:
+                # Unless the image was replaced meanwhile.
+                updated |= bool(Product.objects.filter(  # pylint: disable=no-member
+                    pk=product.pk, image=product.image.name,
+                ).update(image_digest=digest))
+            if digest in unclaimed:
+                unclaimed.discard(digest)
+                outcomes['rendered'] += 1
+            elif digest == product.image_digest:
+                outcomes['unchanged'] += 1
+            else:
+                outcomes['deduplicated'] += 1
+        if updated:
+            # Queryset updates bypass the Product signals.
+            bump_catalog_version()
+        return outcomes
+
+    def stored(self, digest):
+        return all(default_storage.exists(path)
+                   for path in rendition_paths(digest, self.config).values())
+
+    def render(self, jobs):
+        """
+        Render each image in ``jobs`` (digest -> bytes) in the process pool,
+        even a single one, so decoding and resizing never hold the GIL of
+        the web process. Only a builder of one worker renders inline.
+        """
+        args = (self.config['SIZES'], self.config['QUALITY'])
+        if self.workers > 1:
+            futures = {
+                digest: self.pool().submit(render_renditions, data, *args)
+                for digest, data in jobs.items()
+            }
+            results = {}
+            for digest, future in futures.items():
+                try:
+                    results[digest] = future.result()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Cannot render image %s', digest)
+            return results
+        results = {}
+        for digest, data in jobs.items():
+            try:
+                results[digest] = render_renditions(data, *args)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Cannot render image %s', digest)
+        return results
+
+    def write(self, results):
+        """Store rendered images and return the set of their digests."""
+        for digest, rendered in results.items():
+            for name, path in rendition_paths(digest, self.config).items():
+                if not default_storage.exists(path):
+                    default_storage.save(path, ContentFile(rendered[name]))
+        return set(results)
+
+
+class RenditionQueue:
+    """
+    Products whose image was uploaded, waiting for their renditions. A
+    background thread hands them to a ``RenditionBuilder`` in batches, so
+    uploads never wait on image processing. With ``background=False``
+    nothing is built until ``flush`` is called.
+
+    The queue is in memory: products still queued when the process exits
+    are picked up by ``build_image_renditions --missing``.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._builder = None
+
+    def push(self, product_id):
+        with self._lock:
+            self._pending.append(product_id)
+            if self.background and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='image-renditions', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to build image renditions')
+
+    def flush(self):
+        """Build the renditions of every queued product."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return Counter()
+        if self._builder is None:
+            self._builder = RenditionBuilder()
+        products = Product.objects.filter(  # pylint: disable=no-member
+            pk__in=pending).exclude(image='').only('image', 'image_digest')
+        return self._builder.build(products)
+
+
+renditions = RenditionQueue()
+
+
+def queue_renditions(product_id):
+    renditions.push(product_id)
@@ -0,0 +1,108 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Now
+
+from api.catalog import bump_catalog_version_on_commit
+from api.models import Order, OrderItem, Product
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a reservation cannot be covered by available stock."""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(
+            f"Insufficient stock for products: {self.product_ids}")
+
+
+def adjust_stock(deltas):
+    """
+    Apply per-product stock deltas, where a positive delta reserves stock
+    and a negative one releases it.
+
+    Reservations are conditional ``UPDATE ... SET stock = stock - q WHERE
+    stock >= q`` statements, so stock can never go negative and no row is
+    read before it is written. Rows are touched in ascending product id
+    order so that concurrent checkouts lock shared products in the same
+    order and cannot deadlock. Must run inside ``transaction.atomic()``;
+    if any product is short, ``InsufficientStock`` is raised after every
+    product has been tried and the caller's transaction rolls back.
+    """
+    short = []
+    for product_id in sorted(deltas):
+        delta = deltas[product_id]
+        products = Product.objects.filter(pk=product_id)  # pylint: disable=no-member
+        if delta > 0:
+            if not products.filter(stock__gte=delta).update(
+                    stock=F('stock') - delta, updated_at=Now()):
+                short.append(product_id)
+        elif delta < 0:
+            products.update(stock=F('stock') - delta, updated_at=Now())
+    if short:
+        raise InsufficientStock(short)
+    if deltas:
+        # Queryset updates bypass the Product signals.
+        bump_catalog_version_on_commit()
+
+
+# Statuses whose goods have left the warehouse: cancelling or deleting
+# such an order does not put them back into stock.
+FULFILLED_STATUSES = (Order.StatusChoices.SHIPPED, Order.StatusChoices.DELIVERED)
+
+
+def reserved_quantities(status, items, previous_status=None):
+    """
+    Quantities held back from stock by an order in ``status`` with
+    ``items``. Cancelled orders hold nothing, except one being cancelled
+    from a ``previous_status`` in ``FULFILLED_STATUSES``, which keeps what
+    it took.
+    """
+    quantities = Counter()
+    if (status != Order.StatusChoices.CANCELLED
+            or previous_status in FULFILLED_STATUSES):
+        for item in items:
+            quantities[item.product_id] += item.quantity
+    return quantities
+
+
+def released_quantities(status, items):
+    """
+    ``reserved_quantities`` of an order in ``status`` once it is deleted:
+    an open order's stock is released, a fulfilled order's is not.
+    """
+    return reserved_quantities(Order.StatusChoices.CANCELLED, items, status)
+
+
+def rebalance(before, after):
+    """
+    Move stock from one reservation to another, touching only the
+    products whose reserved quantity changed.
+    """
+    deltas = {
+        product_id: after.get(product_id, 0) - before.get(product_id, 0)
+        for product_id in before.keys() | after.keys()
+    }
+    adjust_stock({pk: delta for pk, delta in deltas.items() if delta})
+
+
+def recount_stock(event):
+    """
+    Outbox handler: re-read the stock of the products in the event's order
+    once the order has committed, and warn about those down to
+    ``API_LOW_STOCK_THRESHOLD`` or less so they can be restocked.
+    """
+    threshold = getattr(settings, 'API_LOW_STOCK_THRESHOLD', 5)
+    product_ids = {item['product'] for item in event.payload.get('items', ())}
+    product_ids.update(OrderItem.objects.filter(  # pylint: disable=no-member
+        order_id=event.order_id).values_list('product_id', flat=True))
+    low = Product.objects.filter(  # pylint: disable=no-member
+        pk__in=product_ids, stock__lte=threshold,
+    ).order_by('pk').values_list('pk', 'name', 'stock')
+    for product_id, name, stock in low:
+        logger.warning(
+            'Product %s (%s) is down to %d in stock', product_id, name, stock)
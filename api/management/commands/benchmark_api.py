@@ -0,0 +1,323 @@
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Product
+
+User = get_user_model()
+
+
+def browse(rng, catalog):
+    if catalog['product_ids'] and rng.random() < 0.5:
+        return 'GET', f"/products/{rng.choice(catalog['product_ids'])}/", None
+    ordering = rng.choice(['pk', 'price', '-price', 'name'])
+    return 'GET', f'/products/?ordering={ordering}', None
+
+
+def search(rng, catalog):
+    return 'GET', f"/products/?search={rng.choice(catalog['terms'])}", None
+
+
+def order_create(rng, catalog):
+    picked = rng.sample(
+        catalog['product_ids'], min(len(catalog['product_ids']), rng.randint(1, 3)))
+    items = [{'product': pk, 'quantity': 1} for pk in picked]
+    return 'POST', '/orders/', {'items': items}
+
+
+def order_list(rng, catalog):
+    status = rng.choice(['pending', 'confirmed', 'cancelled'])
+    return 'GET', f'/orders/?status={status}&ordering=-created_at', None
+
+
+WORKLOADS = {
+    'browse': browse,
+    'search': search,
+    'order_create': order_create,
+    'order_list': order_list,
+}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+class WSGITransport:
+    """Sends requests through Django's WSGI handler in this process."""
+    reports_queries = True
+
+    def __init__(self, token):
+        self.client = Client(
+            headers={'Authorization': f'Bearer {token}'},
+            raise_request_exception=False)
+
+    def request(self, method, path, data):
+        if method == 'POST':
+            response = self.client.post(path, data, content_type='application/json')
+        else:
+            response = self.client.get(path)
+        return response.status_code, _query_count(response)
+
+    def close(self):
+        connections.close_all()
+
+
+class ASGITransport:
+    """Sends requests through Django's ASGI handler in this process."""
+    reports_queries = True
+
+    def __init__(self, token):
+        self.client = AsyncClient(
+            headers={'Authorization': f'Bearer {token}'},
+            raise_request_exception=False)
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method, path, data):
+        if method == 'POST':
+            call = self.client.post(path, data, content_type='application/json')
+        else:
+            call = self.client.get(path)
+        response = self.loop.run_until_complete(call)
+        return response.status_code, _query_count(response)
+
+    def close(self):
+        self.loop.close()
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Sends requests to a running server over HTTP."""
+    reports_queries = False
+
+    def __init__(self, token, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def request(self, method, path, data):
+        response = self.session.request(
+            method, self.base_url + path, json=data, timeout=30)
+        return response.status_code, None
+
+    def close(self):
+        self.session.close()
+
+
+def _query_count(response):
+    metrics = getattr(response, 'query_metrics', None)
+    return metrics.count if metrics is not None else None
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent API workloads and report latency, throughput and queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workload', action='append', choices=sorted(WORKLOADS),
+            help='Workload to run; repeat for several (default: all)')
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Number of concurrent clients per workload')
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Requests sent by each client per workload')
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Untimed requests sent by each client first')
+        parser.add_argument(
+            '--app', choices=['wsgi', 'asgi'], default='wsgi',
+            help='In-process handler to benchmark when no --base-url is given')
+        parser.add_argument(
+            '--base-url', type=str,
+            help='Benchmark a running server instead, e.g. http://localhost:8000')
+        parser.add_argument(
+            '--username', type=str, default='benchmark',
+            help='User the requests authenticate as (created if missing)')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed for the generated requests')
+        parser.add_argument(
+            '--output', type=str,
+            help='Write results as JSON to this file')
+        parser.add_argument(
+            '--baseline', type=str,
+            help='Compare against results previously written with --output')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.10,
+            help='Allowed fractional slowdown against the baseline')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=options['username'])
+        token = str(RefreshToken.for_user(user).access_token)
+        catalog = self.load_catalog()
+        hosts = None
+        if options['base_url']:
+            base_url = options['base_url'].rstrip('/')
+            target = base_url
+
+            def make_transport():
+                return HTTPTransport(token, base_url)
+        else:
+            target = f"in-process {options['app']}"
+            # The test clients send Host: testserver.
+            hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+            transport_class = {
+                'wsgi': WSGITransport, 'asgi': ASGITransport}[options['app']]
+
+            def make_transport():
+                return transport_class(token)
+
+        results = {
+            'target': target,
+            'concurrency': options['concurrency'],
+            'requests_per_client': options['requests'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'workloads': {},
+        }
+        self.stdout.write(f'Target: {target}')
+        self.stdout.write("-" * 78)
+        self.stdout.write(
+            f"{'workload':<14}{'requests':>9}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>10}")
+        with override_settings(ALLOWED_HOSTS=hosts or settings.ALLOWED_HOSTS):
+            for name in options['workload'] or list(WORKLOADS):
+                result = self.run_workload(
+                    WORKLOADS[name], catalog, make_transport, options)
+                results['workloads'][name] = result
+                self.write_result(name, result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def load_catalog(self):
+        product_ids = list(
+            Product.objects.filter(stock__gt=0)  # pylint: disable=no-member
+            .order_by('pk').values_list('pk', flat=True)[:1000])
+        if not product_ids:
+            raise CommandError('No products in stock; run populate_db first')
+        names = Product.objects.filter(  # pylint: disable=no-member
+            pk__in=product_ids[:200]).values_list('name', flat=True)
+        terms = sorted({
+            word.lower() for name in names for word in name.split()
+            if len(word) > 3 and word.isalpha()
+        }) or ['product']
+        return {'product_ids': product_ids, 'terms': terms}
+
+    def run_workload(self, workload, catalog, make_transport, options):
+        lock = threading.Lock()
+        latencies, queries = [], []
+        errors = 0
+
+        def client(seed):
+            nonlocal errors
+            rng = random.Random(seed)
+            transport = make_transport()
+            try:
+                for _ in range(options['warmup']):
+                    transport.request(*workload(rng, catalog))
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    try:
+                        status, count = transport.request(*workload(rng, catalog))
+                    except Exception:  # pylint: disable=broad-except
+                        status, count = None, None
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed * 1000)
+                        if status is None or status >= 400:
+                            errors += 1
+                        if count is not None:
+                            queries.append(count)
+            finally:
+                transport.close()
+
+        seeds = [options['seed'] + i for i in range(options['concurrency'])]
+        start = time.perf_counter()
+        if len(seeds) == 1:
+            # Keep a single client on this thread and its DB connection.
+            client(seeds[0])
+        else:
+            threads = [threading.Thread(target=client, args=(seed,)) for seed in seeds]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'seconds': round(elapsed, 3),
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': _round(percentile(latencies, 50)),
+                'p95': _round(percentile(latencies, 95)),
+                'p99': _round(percentile(latencies, 99)),
+            },
+            'queries_per_request': (
+                round(sum(queries) / len(queries), 2) if queries else None),
+        }
+
+    def write_result(self, name, result):
+        latency = result['latency_ms']
+        queries = result['queries_per_request']
+        self.stdout.write(
+            f"{name:<14}{result['requests']:>9}{result['errors']:>8}"
+            f"{result['throughput']:>10}{latency['p50']:>9}{latency['p95']:>9}"
+            f"{latency['p99']:>9}{'-' if queries is None else queries:>10}")
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, before in baseline['workloads'].items():
+            after = results['workloads'].get(name)
+            if after is None:
+                continue
+            if after['throughput'] < before['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f"{name}: throughput {after['throughput']} req/s, "
+                    f"baseline {before['throughput']}")
+            if after['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: p95 {after['latency_ms']['p95']} ms, "
+                    f"baseline {before['latency_ms']['p95']}")
+            # Query counts are deterministic, so any increase is a regression.
+            if None not in (after['queries_per_request'], before['queries_per_request']) \
+                    and after['queries_per_request'] > before['queries_per_request']:
+                regressions.append(
+                    f"{name}: {after['queries_per_request']} queries per request, "
+                    f"baseline {before['queries_per_request']}")
+
+        self.stdout.write("-" * 78)
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(
+                f'{len(regressions)} regression(s) against baseline {path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.management.commands.benchmark_api import percentile
+from api.models import Product
+
+User = get_user_model()
+
+ENDPOINTS = {
+    'product_list': '/products/?ordering=price',
+    'product_detail': '/products/{pk}/',
+    'product_info': '/products/info/',
+    'user_orders': '/user-orders/',
+}
+
+
+async def asgi_get(app, path, headers):
+    """
+    Send one GET through the ASGI application, the way a server would,
+    and return its status code.
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost'), *headers],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    body_sent = False
+    status = None
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Nothing more to send; wait until the handler stops listening.
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = 'Compare sync and async read views under concurrent ASGI load'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint', action='append', choices=sorted(ENDPOINTS),
+            help='Endpoint to compare; repeat for several (default: all)')
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Requests in flight at once on the single event loop')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per endpoint and mode')
+        parser.add_argument(
+            '--username', type=str, default='benchmark',
+            help='User the requests authenticate as (created if missing)')
+        parser.add_argument(
+            '--output', type=str,
+            help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by('pk').first()  # pylint: disable=no-member
+        if product is None:
+            raise CommandError('No products; run populate_db first')
+        user, _ = User.objects.get_or_create(username=options['username'])
+        token = str(RefreshToken.for_user(user).access_token)
+        # Authenticated requests skip the anonymous catalog cache, so both
+        # modes do the same work.
+        headers = [(b'authorization', f'Bearer {token}'.encode())]
+
+        self.stdout.write(
+            f"{options['concurrency']} concurrent requests on one event loop")
+        self.stdout.write("-" * 72)
+        self.stdout.write(
+            f"{'endpoint':<16}{'mode':<7}{'requests':>9}{'errors':>8}"
+            f"{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost']):
+            app = get_asgi_application()
+            for name in options['endpoint'] or list(ENDPOINTS):
+                path = ENDPOINTS[name].format(pk=product.pk)
+                results[name] = {}
+                for mode, prefix in (('sync', ''), ('async', '/async')):
+                    result = asyncio.run(self.run_load(
+                        app, prefix + path, headers, options))
+                    results[name][mode] = result
+                    self.write_result(name, mode, result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    async def run_load(self, app, path, headers, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        errors = 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                status = await asgi_get(app, path, headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if status is None or status >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': round(len(latencies) / elapsed, 2),
+            'latency_ms': {
+                name: round(percentile(latencies, p), 2)
+                for name, p in (('p50', 50), ('p95', 95), ('p99', 99))
+            },
+        }
+
+    def write_result(self, name, mode, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f"{name:<16}{mode:<7}{result['requests']:>9}{result['errors']:>8}"
+            f"{result['throughput']:>10}{latency['p50']:>9}"
+            f"{latency['p95']:>9}{latency['p99']:>9}")
@@ -0,0 +1,101 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import CachedJWTAuthentication, get_user_cache
+from api.management.commands.benchmark_api import percentile
+from api.metrics import QueryRecorder
+from api.middleware import wrap_connections
+from api.views import UserOrdersAPIView
+
+User = get_user_model()
+
+AUTHENTICATION_CLASSES = {
+    'stock': JWTAuthentication,
+    'cached': CachedJWTAuthentication,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the stock and cached JWT authentication classes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=2000,
+            help='Authentications (and API requests) per class')
+        parser.add_argument(
+            '--path', type=str, default='/user-orders/?fields=order_id',
+            help='Endpoint of UserOrdersAPIView used for the request timings')
+        parser.add_argument(
+            '--username', type=str, default='benchmark',
+            help='User the requests authenticate as (created if missing)')
+        parser.add_argument(
+            '--output', type=str,
+            help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=options['username'])
+        token = str(RefreshToken.for_user(user).access_token)
+        request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.stdout.write(f"{options['requests']} runs per class")
+        self.stdout.write("-" * 64)
+        self.stdout.write(
+            f"{'class':<8}{'what':<10}{'p50 us':>10}{'p95 us':>10}"
+            f"{'per s':>12}{'queries':>10}")
+        results = {}
+        for name, authentication_class in AUTHENTICATION_CLASSES.items():
+            get_user_cache().clear()
+            authentication = authentication_class()
+            results[name] = {
+                'authenticate': self.measure(
+                    lambda: authentication.authenticate(request), options),
+                'request': self.measure_requests(
+                    authentication_class, token, options),
+            }
+            for what, result in results[name].items():
+                self.stdout.write(
+                    f"{name:<8}{what:<10}{result['p50_us']:>10}"
+                    f"{result['p95_us']:>10}{result['throughput']:>12}"
+                    f"{result['queries_per_run']:>10}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def measure_requests(self, authentication_class, token, options):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        original = UserOrdersAPIView.authentication_classes
+        UserOrdersAPIView.authentication_classes = [authentication_class]
+        try:
+            with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                return self.measure(
+                    lambda: client.get(options['path']), options)
+        finally:
+            UserOrdersAPIView.authentication_classes = original
+
+    def measure(self, run, options):
+        run()  # warm up, and fill the user cache
+        recorder = QueryRecorder()
+        timings = []
+        with wrap_connections(recorder):
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        return {
+            'p50_us': round(percentile(timings, 50), 1),
+            'p95_us': round(percentile(timings, 95), 1),
+            'throughput': round(len(timings) / (sum(timings) / 1e6), 1),
+            'queries_per_run': round(recorder.count / len(timings), 2),
+        }
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from api.inventory import InsufficientStock, adjust_stock
+from api.models import Product
+
+
+def naive_reserve(quantities):
+    """Read-check-write reservation, kept only as a baseline to compare."""
+    for product_id in sorted(quantities):
+        product = Product.objects.get(pk=product_id)
+        if product.stock < quantities[product_id]:
+            raise InsufficientStock([product_id])
+        product.stock -= quantities[product_id]
+        product.save(update_fields=['stock'])
+
+
+STRATEGIES = {
+    'conditional': adjust_stock,
+    'naive': naive_reserve,
+}
+
+
+class Command(BaseCommand):
+    help = 'Hammer a few hot products with concurrent stock reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Number of concurrent workers')
+        parser.add_argument(
+            '--attempts', type=int, default=200,
+            help='Reservation attempts per worker')
+        parser.add_argument(
+            '--products', type=int, default=3,
+            help='Number of hot products all workers compete for')
+        parser.add_argument(
+            '--stock', type=int, default=500,
+            help='Starting stock of each hot product')
+        parser.add_argument(
+            '--max-quantity', type=int, default=3,
+            help='Largest quantity reserved per product per attempt')
+        parser.add_argument(
+            '--strategy', choices=sorted(STRATEGIES), default='conditional',
+            help='Reservation strategy to benchmark')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed for the generated workload')
+
+    def handle(self, *args, **options):
+        reserve = STRATEGIES[options['strategy']]
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'inventory-benchmark-{i}',
+                description='Created by benchmark_inventory',
+                price=Decimal('1.00'),
+                stock=options['stock'],
+            )
+            for i in range(options['products'])
+        ])
+        product_ids = [product.pk for product in products]
+
+        lock = threading.Lock()
+        reserved = Counter()
+        outcomes = Counter()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['attempts']):
+                    picked = rng.sample(
+                        product_ids, rng.randint(1, len(product_ids)))
+                    quantities = {
+                        pk: rng.randint(1, options['max_quantity'])
+                        for pk in picked
+                    }
+                    try:
+                        with transaction.atomic():
+                            reserve(quantities)
+                    except InsufficientStock:
+                        outcome = 'rejected'
+                    except OperationalError:
+                        outcome = 'errors'
+                    else:
+                        outcome = 'committed'
+                    with lock:
+                        outcomes[outcome] += 1
+                        if outcome == 'committed':
+                            reserved.update(quantities)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(options['seed'] + i,))
+            for i in range(options['threads'])
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        remaining = dict(
+            Product.objects.filter(pk__in=product_ids)
+            .values_list('pk', 'stock'))
+        oversold = sum(
+            max(0, reserved[pk] - options['stock']) for pk in product_ids)
+        lost_updates = sum(
+            options['stock'] - remaining[pk] != reserved[pk]
+            for pk in product_ids)
+        Product.objects.filter(pk__in=product_ids).delete()
+
+        total = sum(outcomes.values())
+        self.stdout.write(f"Strategy: {options['strategy']}")
+        self.stdout.write("-" * 50)
+        self.stdout.write(
+            f"Attempts: {total} ({options['threads']} threads) "
+            f"in {elapsed:.2f}s")
+        self.stdout.write(f"Throughput: {total / elapsed:.1f} attempts/s")
+        self.stdout.write(
+            f"Committed: {outcomes['committed']}  "
+            f"Rejected: {outcomes['rejected']}  "
+            f"Errors: {outcomes['errors']}")
+        self.stdout.write(
+            f"Units reserved: {sum(reserved.values())} of "
+            f"{options['stock'] * len(product_ids)} available")
+
+        style = self.style.ERROR if oversold or lost_updates else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Oversold units: {oversold}  "
+            f"Products with lost updates: {lost_updates}"))
@@ -0,0 +1,82 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import renderers
+from api.fast_serializers import serialize
+from api.management.commands.benchmark_api import percentile
+from api.models import Order
+from api.serializers import OrderSerializer
+
+
+def renderer_candidates():
+    """JSON renderers to compare, by name; orjson only when installed."""
+    candidates = {
+        'drf': JSONRenderer().render,
+        'python': renderers.python_dumps,
+    }
+    if renderers.JSON_ACCELERATOR == 'orjson':
+        candidates['orjson'] = renderers.orjson_dumps
+    candidates['fast'] = renderers.FastJSONRenderer().render
+    return candidates
+
+
+class Command(BaseCommand):
+    help = 'Time the JSON renderers on order list payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders', type=int, default=500,
+            help='Orders (with their items) in the rendered payload')
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Renders per renderer')
+        parser.add_argument(
+            '--output', type=str,
+            help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        orders = list(
+            Order.objects.prefetch_items().order_by('-created_at')[  # pylint: disable=no-member
+                :options['orders']])
+        if not orders:
+            raise CommandError('No orders; run populate_db first')
+        # The same list of dicts the order list endpoints hand the renderer.
+        payload = serialize(OrderSerializer, orders, many=True)
+        expected = JSONRenderer().render(payload)
+
+        self.stdout.write(
+            f"{len(orders)} orders, {len(expected) / 1024:.0f} KiB of JSON, "
+            f"{options['repeat']} renders each")
+        self.stdout.write("-" * 60)
+        self.stdout.write(
+            f"{'renderer':<10}{'p50 ms':>9}{'p95 ms':>9}{'MB/s':>10}"
+            f"{'speedup':>10}{'same bytes':>12}")
+        results = {}
+        for name, render in renderer_candidates().items():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                output = render(payload)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p50 = percentile(timings, 50)
+            results[name] = {
+                'p50_ms': round(p50, 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'throughput_mb_s': round(len(output) / 1e3 / p50, 1),
+                'identical': output == expected,
+            }
+            result = results[name]
+            speedup = results['drf']['p50_ms'] / result['p50_ms']
+            self.stdout.write(
+                f"{name:<10}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                f"{result['throughput_mb_s']:>10}{speedup:>9.2f}x"
+                f"{'yes' if result['identical'] else 'NO':>12}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
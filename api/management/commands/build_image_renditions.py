@@ -0,0 +1,42 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.images import RenditionBuilder
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Build the image renditions of every product with an image, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            help='Processes rendering images (default: API_IMAGES WORKERS)')
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Products read and rendered per batch')
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only products whose renditions have not been built')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(  # pylint: disable=no-member
+            image__isnull=True).only('image', 'image_digest').order_by('pk')
+        if options['missing']:
+            products = products.filter(image_digest='')
+
+        totals = Counter()
+        last_pk = 0
+        with RenditionBuilder(workers=options['workers']) as builder:
+            while True:
+                batch = list(products.filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                totals.update(builder.build(batch))
+                last_pk = batch[-1].pk
+                self.stdout.write(f"  {sum(totals.values())} products")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['rendered']} rendered, {totals['deduplicated']} deduplicated, "
+            f"{totals['unchanged']} unchanged, {totals['failed']} failed"))
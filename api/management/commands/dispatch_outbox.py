@@ -0,0 +1,48 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending order events from the outbox to their handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Events claimed per batch (default: API_OUTBOX BATCH_SIZE)')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Threads handling each batch (default: API_OUTBOX WORKERS)')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no events are due instead of polling')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait between polls when no events are due')
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(
+            batch_size=options['batch_size'], workers=options['workers'])
+        totals = Counter()
+        try:
+            while True:
+                outcomes = dispatcher.dispatch_batch()
+                totals.update(outcomes)
+                if outcomes:
+                    if options['verbosity'] > 1:
+                        self.stdout.write(self.summary(outcomes))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(self.summary(totals)))
+
+    @staticmethod
+    def summary(outcomes):
+        return (f"{outcomes['dispatched']} dispatched, "
+                f"{outcomes['retried']} to retry, {outcomes['failed']} failed")
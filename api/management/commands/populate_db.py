@@ -1,60 +1,263 @@
+import math
+import multiprocessing
 import random
+import uuid
 from decimal import Decimal
+from itertools import accumulate
 from faker import Faker
 
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from api.models import User, Product, Order, OrderItem
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.catalog import bump_catalog_version
+from api.models import DailySales, User, Product, Order, OrderItem
+from api.search import get_search_backend
+
+CUSTOMER_PREFIX = 'customer'
+
+STATUS_WEIGHTS = {
+    Order.StatusChoices.PENDING: 10,
+    Order.StatusChoices.CONFIRMED: 15,
+    Order.StatusChoices.SHIPPED: 15,
+    Order.StatusChoices.DELIVERED: 50,
+    Order.StatusChoices.CANCELLED: 10,
+}
+
+# Filled in each worker by init_order_worker.
+_order_context = {}
+
+
+def batch_rng(seed, kind, index):
+    """
+    Every batch gets its own generator, so the data only depends on the
+    seed and not on how batches are spread over workers.
+    """
+    return random.Random(f'{seed}-{kind}-{index}')
+
+
+def batch_faker(rng):
+    fake = Faker()
+    fake.seed_instance(rng.getrandbits(64))
+    return fake
+
+
+def user_rows(seed, index, start, count):
+    fake = batch_faker(batch_rng(seed, 'users', index))
+    return [
+        (f'{CUSTOMER_PREFIX}{start + i}', fake.first_name(), fake.last_name())
+        for i in range(count)
+    ]
+
+
+def product_rows(seed, index, start, count):
+    rng = batch_rng(seed, 'products', index)
+    fake = batch_faker(rng)
+    return [
+        (fake.company() + " " + fake.bs(), fake.text(),
+         rng.randrange(100, 10000), rng.randint(0, 100))
+        for _ in range(count)
+    ]
+
+
+def init_order_worker(context):
+    _order_context.update(context)
+
+
+def order_rows(seed, index, start, count):
+    """
+    Orders as plain tuples: (order id, user id, status, [(product id,
+    quantity, unit price in cents), ...]).
+    """
+    rng = batch_rng(seed, 'orders', index)
+    context = _order_context
+    products, hot = context['products'], context['hot_count']
+    statuses = list(STATUS_WEIGHTS)
+    user_ids = rng.choices(
+        context['user_ids'], cum_weights=context['user_weights'], k=count)
+    rows = []
+    for user_id in user_ids:
+        lines = {}
+        for _ in range(rng.randint(1, 5)):
+            if hot == len(products) or rng.random() < context['hot_share']:
+                product_id, cents = products[rng.randrange(hot)]
+            else:
+                product_id, cents = products[rng.randrange(hot, len(products))]
+            lines[product_id] = (product_id, rng.choice((1, 1, 1, 2, 3, 5)), cents)
+        rows.append((
+            uuid.UUID(int=rng.getrandbits(128), version=4),
+            user_id,
+            rng.choices(statuses, weights=list(STATUS_WEIGHTS.values()))[0],
+            list(lines.values()),
+        ))
+    return rows
 
 
 class Command(BaseCommand):
     help = 'Creates more realistic application data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Number of customers to create')
+        parser.add_argument(
+            '--products', type=int, default=50,
+            help='Number of products to create')
+        parser.add_argument(
+            '--orders', type=int, default=15,
+            help='Number of orders to create')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Rows generated and inserted per batch')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Processes generating rows in parallel')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed for the generated data; the same seed gives the same rows')
+        parser.add_argument(
+            '--hot-products', type=float, default=0.05,
+            help='Fraction of products that are hot sellers')
+        parser.add_argument(
+            '--hot-share', type=float, default=0.6,
+            help='Fraction of order lines that go to hot products')
+        parser.add_argument(
+            '--customer-skew', type=float, default=1.1,
+            help='Zipf exponent for orders per customer (0 spreads them evenly)')
+
+    def handle(self, *args, **options):
+        if options['orders'] and not options['products']:
+            raise CommandError('Orders need at least one product')
+        self.options = options
         # get or create superuser
         user = User.objects.filter(username='admin').first()
         if not user:
             user = User.objects.create_superuser(
                 username='admin', password='test')
 
-        # Clean up existing data to avoid duplicates on re-run
+        # Clean up existing data to avoid duplicates on re-run. The rollups
+        # are truncated (and rebuilt below), and the items go first, so
+        # deleting the orders has no sales left to take out of them.
+        DailySales.objects.all().delete()
         OrderItem.objects.all().delete()
         Order.objects.all().delete()
         Product.objects.all().delete()
+        User.objects.filter(
+            username__startswith=CUSTOMER_PREFIX, is_staff=False).delete()
 
         self.stdout.write("Cleared existing data...")
 
-        fake = Faker()
+        self.stdout.write("Creating users...")
+        password = make_password('test')
+        self.generate('users', options['users'], user_rows, lambda rows: (
+            User.objects.bulk_create([
+                User(username=username, first_name=first_name,
+                     last_name=last_name, password=password,
+                     email=f'{username}@example.com')
+                for username, first_name, last_name in rows
+            ], batch_size=options['batch_size'])
+        ))
 
-        # create products
-        products = []
         self.stdout.write("Creating products...")
-        for _ in range(50):  # Create 50 products
-            products.append(
-                Product(
-                    name=fake.company() + " " + fake.bs(),
-                    description=fake.text(),
-                    price=Decimal(random.randrange(100, 10000)) / 100,
-                    stock=random.randint(0, 100)
-                )
-            )
-
-        Product.objects.bulk_create(products)
-        products = Product.objects.all()
-        self.stdout.write(f"Created {len(products)} products.")
+        self.generate('products', options['products'], product_rows, lambda rows: (
+            Product.objects.bulk_create([
+                Product(name=name, description=description,
+                        price=Decimal(cents) / 100, stock=stock)
+                for name, description, cents, stock in rows
+            ], batch_size=options['batch_size'])
+        ))
+        # bulk_create skips the signals that keep the search index and the
+        # catalog caches in sync
+        get_search_backend().rebuild()
+        bump_catalog_version()
 
-        # create some dummy orders tied to the superuser
         self.stdout.write("Creating orders...")
-        for _ in range(15):
-            # create an Order with a random number of items (1 to 5)
-            order = Order.objects.create(user=user)
-            num_items = random.randint(1, 5)
-            # Ensure we don't try to sample more products than exist
-            sample_size = min(num_items, len(products))
-            for product in random.sample(list(products), sample_size):
-                OrderItem.objects.create(
-                    order=order, product=product, quantity=random.randint(1, 5)
-                )
+        self.generate(
+            'orders', options['orders'], order_rows, self.insert_orders,
+            initializer=init_order_worker,
+            initargs=(self.order_context(user),))
+        # Orders are bulk inserted, past the sales rollup updates.
+        call_command('rebuild_sales_rollups', stdout=self.stdout)
 
         self.stdout.write(self.style.SUCCESS(
             'Successfully populated the database with realistic data.'))
+
+    def order_context(self, admin):
+        """
+        Shuffled product and customer pools. The first ``hot_count``
+        products take ``hot_share`` of order lines, and customers are
+        weighted by a Zipf law so a few whales place most orders.
+        """
+        rng = batch_rng(self.options['seed'], 'context', 0)
+        products = [
+            (pk, int(price * 100)) for pk, price in
+            Product.objects.order_by('pk').values_list('pk', 'price')
+        ]
+        user_ids = [admin.pk] + list(
+            User.objects.filter(username__startswith=CUSTOMER_PREFIX)
+            .order_by('pk').values_list('pk', flat=True))
+        rng.shuffle(products)
+        rng.shuffle(user_ids)
+        skew = self.options['customer_skew']
+        return {
+            'products': products,
+            'hot_count': min(len(products), max(
+                1, math.ceil(len(products) * self.options['hot_products']))),
+            'hot_share': self.options['hot_share'],
+            'user_ids': user_ids,
+            'user_weights': list(accumulate(
+                1 / (rank ** skew) for rank in range(1, len(user_ids) + 1))),
+        }
+
+    def insert_orders(self, rows):
+        orders, items = [], []
+        for order_id, user_id, status, lines in rows:
+            orders.append(Order(
+                order_id=order_id, user_id=user_id, status=status,
+                total_price=Decimal(sum(qty * cents for _, qty, cents in lines)) / 100,
+                item_count=len(lines),
+            ))
+            items.extend(
+                OrderItem(order_id=order_id, product_id=product_id,
+                          quantity=quantity, unit_price=Decimal(cents) / 100)
+                for product_id, quantity, cents in lines
+            )
+        with transaction.atomic():
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create(items)
+
+    def generate(self, kind, total, make_rows, insert, initializer=None, initargs=()):
+        """
+        Generate ``total`` rows in batches, across ``--workers`` processes
+        when asked, and insert each batch from this process as it arrives.
+        """
+        size = self.options['batch_size']
+        tasks = [
+            (self.options['seed'], index, start, min(size, total - start))
+            for index, start in enumerate(range(0, total, size))
+        ]
+        if self.options['workers'] > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(
+                self.options['workers'], initializer, initargs)
+            batches = pool.imap(_star, [(make_rows, task) for task in tasks])
+        else:
+            pool = None
+            if initializer:
+                initializer(*initargs)
+            batches = (make_rows(*task) for task in tasks)
+        try:
+            done = 0
+            for rows in batches:
+                insert(rows)
+                done += len(rows)
+                self.stdout.write(f"  {done}/{total} {kind}")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.stdout.write(f"Created {total} {kind}.")
+
+
+def _star(args):
+    make_rows, task = args
+    return make_rows(*task)
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from api.models import DailySales, Order
+from api.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from the order tables, in chunks of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=31,
+            help='Days of orders rebuilt per chunk, each in its own transaction')
+        parser.add_argument(
+            '--since', type=date.fromisoformat,
+            help='First day to rebuild (default: the first order)')
+        parser.add_argument(
+            '--until', type=date.fromisoformat,
+            help='Last day to rebuild (default: the last order)')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        bounds = Order.objects.aggregate(  # pylint: disable=no-member
+            first=Min('created_at'), last=Max('created_at'))
+        since, until = options['since'], options['until']
+        if bounds['first'] is None and since is None and until is None:
+            DailySales.objects.all().delete()  # pylint: disable=no-member
+            self.stdout.write(self.style.SUCCESS('No orders; cleared the sales rollups.'))
+            return
+        if since is None:
+            since = timezone.localdate(bounds['first'])
+        if until is None:
+            until = timezone.localdate(bounds['last'])
+        if since > until:
+            raise CommandError('--since is after --until')
+        if options['since'] is None and options['until'] is None:
+            # Rows of days without orders any more, e.g. after deletes.
+            DailySales.objects.exclude(  # pylint: disable=no-member
+                date__range=(since, until)).delete()
+
+        rows = chunks = 0
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days=options['days'] - 1), until)
+            written = rebuild_sales_rollups(start, end)
+            rows += written
+            chunks += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{start} to {end}: {written} rows')
+            start = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rows} sales rollup rows for {since} to {until} '
+            f'in {chunks} chunk(s).'))
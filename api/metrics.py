@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from api.cache import get_response_cache
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_VALUES_LIST = re.compile(r'VALUES (?:\((?:%s, )*%s\), )*\((?:%s, )*%s\)')
+
+
+def query_shape(sql):
+    """
+    Reduce a parameterized statement to its shape, collapsing ``IN`` and
+    multi-row ``VALUES`` lists so batches of different sizes compare equal.
+    """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub('VALUES (...)', sql)
+
+
+def is_profiler_query(sql):
+    """Statements issued by Silk for its own bookkeeping and EXPLAINs."""
+    return sql.startswith('EXPLAIN') or 'silk_' in sql
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` callable that counts and times the
+    queries run while it is installed and groups them by shape.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if is_profiler_query(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        """Shapes run at least ``threshold`` times: likely N+1 queries."""
+        return {
+            shape: count for shape, count in self.shapes.items()
+            if count >= threshold
+        }
+
+
+class RequestQueryMetrics:
+    """Query statistics for one request, as attached to its response."""
+
+    def __init__(self, view, method, recorder, budget, threshold):
+        self.view = view
+        self.method = method
+        self.count = recorder.count
+        self.duration = recorder.duration
+        self.budget = budget
+        self.repeated = recorder.repeated_shapes(threshold)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+
+def view_query_budget(view_class, method):
+    """
+    The query budget a view declares for ``method``, if any. Views set
+    ``query_budget`` to an int for every method or to a dict keyed by
+    HTTP method.
+    """
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class MetricsRegistry:
+    """Process-wide per-view query counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.queries = Counter()
+            self.query_seconds = defaultdict(float)
+            self.n_plus_one = Counter()
+            self.over_budget = Counter()
+
+    def record(self, metrics):
+        key = (metrics.view, metrics.method)
+        with self._lock:
+            self.requests[key] += 1
+            self.queries[key] += metrics.count
+            self.query_seconds[key] += metrics.duration
+            if metrics.repeated:
+                self.n_plus_one[key] += 1
+            if metrics.over_budget:
+                self.over_budget[key] += 1
+
+    def render_prometheus(self):
+        """Render the counters in the Prometheus text exposition format."""
+        with self._lock:
+            series = [
+                ('api_requests_total', 'Requests handled per view.',
+                 self.requests),
+                ('api_db_queries_total', 'Database queries run per view.',
+                 self.queries),
+                ('api_db_query_seconds_total',
+                 'Time spent in database queries per view.',
+                 self.query_seconds),
+                ('api_n_plus_one_requests_total',
+                 'Requests that repeated a query shape (likely N+1).',
+                 self.n_plus_one),
+                ('api_query_budget_exceeded_total',
+                 'Requests that ran more queries than the view allows.',
+                 self.over_budget),
+            ]
+            lines = []
+            for name, help_text, values in series:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (view, method), value in sorted(values.items()):
+                    lines.append(
+                        f'{name}{{view="{view}",method="{method}"}} {value}')
+
+        stats = get_response_cache().stats()
+        for outcome in ('hits', 'misses'):
+            name = f'api_response_cache_{outcome}_total'
+            lines.append(f'# HELP {name} Catalog response cache {outcome}.')
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {stats[outcome]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'API_QUERY_METRICS', {}).get(
+        'N_PLUS_ONE_THRESHOLD', 5)
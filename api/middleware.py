@@ -0,0 +1,237 @@
+import abc
+import hashlib
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from api import profiling
+from api.metrics import (QueryRecorder, RequestQueryMetrics,
+                         n_plus_one_threshold, registry, view_query_budget)
+from api.routers import replica_reads, replica_settings
+
+logger = logging.getLogger('api.queries')
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    """Install ``wrapper`` on every database connection of this thread."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+class ConnectionWrapperMiddleware(abc.ABC):
+    """
+    Base for middleware that watches the queries a request runs.
+
+    Works in both sync and async stacks. Under ASGI, queries run in the
+    request's ``sync_to_async`` thread rather than on the event loop, so
+    the wrapper is installed on that thread's connections.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.aprocess(request, self.call_async)
+        return self.process(request, self.call_sync)
+
+    def call_sync(self, request, wrapper):
+        with wrap_connections(wrapper):
+            return self.get_response(request)
+
+    async def call_async(self, request, wrapper):
+        stack = ExitStack()
+        await sync_to_async(stack.enter_context)(wrap_connections(wrapper))
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+    @abc.abstractmethod
+    def process(self, request, call):
+        """Handle ``request``, passing it on with ``call(request, wrapper)``."""
+
+    @abc.abstractmethod
+    async def aprocess(self, request, call):
+        """``process`` for async stacks, where ``call`` is awaited."""
+
+
+class QueryMetricsMiddleware(ConnectionWrapperMiddleware):
+    """
+    Counts and times the SQL queries each view runs, using
+    ``connection.execute_wrapper`` on every database alias.
+
+    Requests that repeat a query shape ``N_PLUS_ONE_THRESHOLD`` times or
+    exceed their view's ``query_budget`` are logged to ``api.queries``.
+    Totals per view are kept in ``api.metrics.registry`` and the request's
+    figures are attached to the response as ``response.query_metrics``.
+    Queries run while a streamed response is consumed are not counted.
+    """
+
+    def process(self, request, call):
+        recorder = QueryRecorder()
+        return self.record(request, call(request, recorder), recorder)
+
+    async def aprocess(self, request, call):
+        recorder = QueryRecorder()
+        return self.record(request, await call(request, recorder), recorder)
+
+    def record(self, request, response, recorder):
+        view_class = self.view_class(request)
+        if view_class is None:
+            return response
+
+        metrics = RequestQueryMetrics(
+            view_class.__name__,
+            request.method,
+            recorder,
+            view_query_budget(view_class, request.method),
+            n_plus_one_threshold(),
+        )
+        registry.record(metrics)
+        response.query_metrics = metrics
+
+        for shape, count in metrics.repeated.items():
+            logger.warning(
+                'Possible N+1 in %s %s: %d x %s',
+                request.method, metrics.view, count, shape)
+        if metrics.over_budget:
+            logger.warning(
+                '%s %s ran %d queries, over its budget of %d',
+                request.method, metrics.view, metrics.count, metrics.budget)
+        return response
+
+    def view_class(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        return (getattr(match.func, 'cls', None)
+                or getattr(match.func, 'view_class', None))
+
+
+class SamplingProfilerMiddleware(ConnectionWrapperMiddleware):
+    """
+    Records a sample of requests into Silk's tables, in place of
+    ``silk.middleware.SilkyMiddleware`` profiling every one of them.
+
+    A ``RATE`` fraction of requests is captured with their SQL; any request
+    taking ``SLOW_REQUEST_MS`` or longer is captured regardless. Paths are
+    filtered by ``ALLOW_PATHS`` and ``DENY_PATHS`` first. Captures are
+    queued in memory and written in batches by a background thread to the
+    ``DATABASE`` alias (see ``api.profiling``), so the request itself does
+    no profiler writes.
+    """
+
+    def process(self, request, call):
+        config = profiling.profiling_settings()
+        if not self.watched(request, config):
+            return self.get_response(request)
+        sql, started, start = self.begin(config)
+        response = call(request, sql)
+        return self.finish(request, response, config, sql, started, start)
+
+    async def aprocess(self, request, call):
+        config = profiling.profiling_settings()
+        if not self.watched(request, config):
+            return await self.get_response(request)
+        sql, started, start = self.begin(config)
+        response = await call(request, sql)
+        return self.finish(request, response, config, sql, started, start)
+
+    def watched(self, request, config):
+        return config['ENABLED'] and profiling.path_allowed(request.path, config)
+
+    def begin(self, config):
+        sql = profiling.SQLCapture(record_sql=profiling.should_sample(config))
+        return sql, datetime.now(timezone.utc), time.perf_counter()
+
+    def finish(self, request, response, config, sql, started, start):
+        elapsed = time.perf_counter() - start
+        slow = config['SLOW_REQUEST_MS'] is not None and (
+            elapsed * 1000 >= config['SLOW_REQUEST_MS'])
+        if sql.record_sql or slow:
+            profiling.buffer.push(
+                profiling.capture(
+                    request, response, started, elapsed, sql, config),
+                config)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ``api.routers.ReplicaRouter`` serve the reads of safe requests
+    from replicas.
+
+    After a client makes a successful unsafe request, its reads stay on
+    the primary for ``PIN_SECONDS`` so it sees its own writes despite
+    replication lag. Clients are told apart by their ``Authorization``
+    header or session cookie; pins are kept in the ``default`` cache,
+    which has to be shared for pins to hold across processes.
+    """
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    pin_key = 'api:primary-pin:{}'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        config = replica_settings()
+        key = self.client_key(request)
+        pinned = key is not None and cache.get(key) is not None
+        token = replica_reads.set(self.use_replicas(request, config, pinned))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if self.should_pin(request, response, key):
+            cache.set(key, True, config['PIN_SECONDS'])
+        return response
+
+    async def acall(self, request):
+        config = replica_settings()
+        key = self.client_key(request)
+        pinned = key is not None and await cache.aget(key) is not None
+        token = replica_reads.set(self.use_replicas(request, config, pinned))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if self.should_pin(request, response, key):
+            await cache.aset(key, True, config['PIN_SECONDS'])
+        return response
+
+    def client_key(self, request):
+        credential = (request.META.get('HTTP_AUTHORIZATION')
+                      or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        if not credential:
+            return None
+        return self.pin_key.format(
+            hashlib.sha1(credential.encode()).hexdigest())
+
+    def use_replicas(self, request, config, pinned):
+        return (bool(config['REPLICAS']) and not pinned
+                and request.method in self.safe_methods)
+
+    def should_pin(self, request, response, key):
+        return (key is not None and request.method not in self.safe_methods
+                and response.status_code < 400)
@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def backfill_unit_prices(OrderItem, Product):
+    price = Subquery(
+        Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    last_pk = 0
+    while True:
+        pks = list(
+            OrderItem.objects.filter(pk__gt=last_pk)
+            .order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        with transaction.atomic():
+            OrderItem.objects.filter(
+                pk__in=pks, unit_price__isnull=True).update(unit_price=price)
+        last_pk = pks[-1]
+
+
+def backfill_order_totals(Order):
+    orders = Order.objects.order_by('pk').annotate(
+        computed_total_price=Coalesce(
+            Sum(F('items__quantity') * F('items__unit_price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+        ),
+        computed_item_count=Count('items'),
+    )
+    last_pk = None
+    while True:
+        batch = orders if last_pk is None else orders.filter(pk__gt=last_pk)
+        batch = list(batch[:BATCH_SIZE])
+        if not batch:
+            return
+        for order in batch:
+            order.total_price = order.computed_total_price
+            order.item_count = order.computed_item_count
+        with transaction.atomic():
+            Order.objects.bulk_update(batch, ['total_price', 'item_count'])
+        last_pk = batch[-1].pk
+
+
+def backfill(apps, schema_editor):
+    backfill_unit_prices(
+        apps.get_model('api', 'OrderItem'), apps.get_model('api', 'Product'))
+    backfill_order_totals(apps.get_model('api', 'Order'))
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so large tables are not held in one
+    # long transaction.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_order_totals_and_unit_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
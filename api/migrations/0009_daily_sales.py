@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:36
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 1000
+
+
+def backfill_daily_sales(apps, schema_editor):
+    OrderItem = apps.get_model('api', 'OrderItem')
+    DailySales = apps.get_model('api', 'DailySales')
+    rows = (
+        OrderItem.objects
+        .values('product_id', date=TruncDate('order__created_at'),
+                status=F('order__status'))
+        .annotate(
+            revenue=Sum(F('quantity') * F('unit_price'),
+                        output_field=models.DecimalField(
+                            max_digits=14, decimal_places=2)),
+            units=Sum('quantity'))
+        .order_by()
+    )
+    DailySales.objects.bulk_create(
+        (DailySales(**row) for row in rows.iterator(chunk_size=BATCH_SIZE)),
+        batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('confirmed', 'Confirmed'), ('pending', 'Pending'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'date'], name='dailysales_product_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'status'), name='dailysales_key')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
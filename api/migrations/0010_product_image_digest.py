@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_daily_sales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
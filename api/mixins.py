@@ -0,0 +1,314 @@
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from api.cache import get_response_cache
+from api.catalog import catalog_version_is_shared, get_catalog_version
+from api.fast_serializers import compiled_serializer, serialize
+from api.renderers import CSVRenderer, NDJSONRenderer, StreamingRenderer
+from api.routers import primary_reads
+from api.serializers import sparse_serializer_class
+
+
+class StreamingExportMixin:
+    """
+    Adds ``?format=ndjson`` and ``?format=csv`` export modes to a list view.
+
+    In an export mode the filtered queryset is walked with
+    ``.iterator(chunk_size=...)`` and serialized one row at a time into a
+    ``StreamingHttpResponse``, so memory stays flat regardless of how many
+    rows match. Filtering, search and ordering apply exactly as they do for
+    the regular paginated JSON response; pagination is skipped. Fields that
+    do not fit a format, such as nested objects in CSV, are left out by
+    listing them in ``export_exclude_fields`` under the format.
+    """
+    renderer_classes = [
+        *api_settings.DEFAULT_RENDERER_CLASSES,
+        NDJSONRenderer,
+        CSVRenderer,
+    ]
+    export_chunk_size = 2000
+    export_exclude_fields = {}
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer_class = self.get_export_serializer_class(renderer.format)
+        if getattr(settings, 'API_COMPILED_SERIALIZERS', True):
+            to_representation = compiled_serializer(
+                serializer_class).to_representation
+        else:
+            to_representation = serializer_class(
+                context=self.get_serializer_context()).to_representation
+        rows = (
+            to_representation(obj)
+            for obj in queryset.iterator(chunk_size=self.export_chunk_size)
+        )
+        return StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+
+    def get_export_serializer_class(self, export_format):
+        serializer_class = self.get_serializer_class()
+        excluded = self.export_exclude_fields.get(export_format)
+        if not excluded:
+            return serializer_class
+        return sparse_serializer_class(serializer_class, frozenset(
+            name for name in serializer_class().fields if name not in excluded))
+
+
+class CatalogCacheMixin:
+    """
+    Serves anonymous list and detail GETs from the response cache, keyed on
+    the request's normalized query parameters and the catalog version.
+
+    Responses carry an ``X-Cache: HIT`` or ``X-Cache: MISS`` header.
+    Authenticated requests and streamed exports bypass the cache. Misses
+    read from the primary, never a replica.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
+
+    def _cached(self, handler, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or isinstance(request.accepted_renderer, StreamingRenderer)):
+            return handler(request, *args, **kwargs)
+
+        response_cache = get_response_cache()
+        key = response_cache.make_key(request, get_catalog_version())
+        data = response_cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        # Filled from the primary: the entry is served to every client.
+        with primary_reads():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answers list and detail GETs with ``304 Not Modified`` when the client's
+    ``If-None-Match`` or ``If-Modified-Since`` still matches.
+
+    The validators are computed before anything is serialized: for a list,
+    the newest ``updated_at`` and the row count of the filtered queryset
+    together with the full request URL; for a detail view, the row's
+    ``updated_at``. Views over the catalog set ``catalog_versioned`` to
+    derive an ETag from the catalog version and the request URL instead,
+    without a query (and without ``Last-Modified``), as long as the version
+    is shared by every process; a per-process version never sees the bumps
+    of other workers, so its ETags would never expire. Those responses are
+    rendered from the primary. Place this mixin first so it runs ahead of
+    any cache.
+    """
+    last_modified_field = 'updated_at'
+    catalog_versioned = False
+
+    def list(self, request, *args, **kwargs):
+        validators = self.get_list_validators(request)
+        return self._conditional(
+            super().list, validators, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_detail_validators(request)
+        return self._conditional(
+            super().retrieve, validators, request, *args, **kwargs)
+
+    def uses_catalog_version(self):
+        return self.catalog_versioned and catalog_version_is_shared()
+
+    def get_list_validators(self, request):
+        if self.uses_catalog_version():
+            return self._validators(request, None, get_catalog_version())
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        stats = queryset.aggregate(
+            last_modified=Max(self.last_modified_field), count=Count('pk'))
+        return self._validators(
+            request, stats['last_modified'], stats['count'])
+
+    def get_detail_validators(self, request):
+        if self.uses_catalog_version():
+            return self._validators(request, None, get_catalog_version())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        last_modified = queryset.values_list(
+            self.last_modified_field, flat=True).first()
+        if last_modified is None:
+            return None, None
+        return self._validators(request, last_modified)
+
+    def _validators(self, request, last_modified, *extra):
+        user = request.user.pk if request.user.is_authenticated else None
+        raw = repr((request.get_full_path(), user, last_modified, extra))
+        etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return etag, timestamp
+
+    def _conditional(self, handler, validators, request, *args, **kwargs):
+        etag, last_modified = validators
+        if etag is None:
+            return handler(request, *args, **kwargs)
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        response = not_modified or self._render(handler, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
+
+
+    def _render(self, handler, request, *args, **kwargs):
+        if not self.uses_catalog_version():
+            return handler(request, *args, **kwargs)
+        # The ETag names the current catalog version, so the body is read
+        # at it too: from the primary, never a lagging replica.
+        with primary_reads():
+            return handler(request, *args, **kwargs)
+
+
+class CompiledReadMixin:
+    """
+    Renders list and retrieve responses through the view serializer's
+    compiled read plan (see ``api.fast_serializers``) instead of DRF's
+    per-field machinery. The output is identical. Place it directly before
+    the generic view class.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize(page, many=True))
+        return Response(self.serialize(queryset, many=True))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize(self.get_object()))
+
+    def serialize(self, instance, many=False):
+        return serialize(
+            self.get_serializer_class(), instance, many=many,
+            context=self.get_serializer_context())
+
+
+class SparseFieldsMixin:
+    """
+    Adds ``?fields=`` and ``?expand=`` to GET requests.
+
+    ``?fields=order_id,status`` renders only those serializer fields and
+    loads only the columns behind them with ``.only()``. Nested fields in
+    ``expandable_fields`` (field name -> queryset method that prefetches
+    it) are rendered, and prefetched, only when named in ``?fields=`` or
+    ``?expand=``. Without ``?fields=`` every field is rendered as before.
+    Fields whose source is not a model column of their own, such as
+    ``SerializerMethodField``, list their columns in ``sparse_columns``;
+    otherwise the selection loads every column.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    expandable_fields = {}
+    sparse_columns = {}
+
+    def get_sparse_fields(self):
+        """The selected field names as a frozenset, or None for all."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None
+        available = list(self.serializer_class().fields)
+        fields = self._query_list(self.fields_query_param, available)
+        expand = self._query_list(
+            self.expand_query_param, list(self.expandable_fields))
+        if fields is None:
+            return None
+        return frozenset(fields) | frozenset(expand or ())
+
+    def _query_list(self, param, choices):
+        values = self.request.query_params.getlist(param)
+        if not values:
+            return None
+        names = [
+            name.strip() for value in values for name in value.split(',')
+            if name.strip()
+        ]
+        unknown = [name for name in names if name not in choices]
+        if unknown:
+            raise ValidationError({param: [
+                f'Unknown field(s): {", ".join(unknown)}. '
+                f'Choose from: {", ".join(choices)}.'
+            ]})
+        return names
+
+    def get_serializer_class(self):
+        serializer_class = super().get_serializer_class()
+        fields = self.get_sparse_fields()
+        if fields is None or serializer_class is not self.serializer_class:
+            return serializer_class
+        return sparse_serializer_class(serializer_class, fields)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        if any(name not in fields for name in self.expandable_fields):
+            queryset = queryset.prefetch_related(None)
+            for name, method in self.expandable_fields.items():
+                if name in fields:
+                    queryset = getattr(queryset, method)()
+        columns = self.get_sparse_columns(fields)
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def get_sparse_columns(self, fields):
+        """
+        Model fields to load for the selected serializer fields, or None
+        when a selected field's columns are unknown.
+        """
+        model = self.serializer_class.Meta.model
+        serializer_fields = self.serializer_class().fields
+        columns = {model._meta.pk.name}  # pylint: disable=protected-access
+        for name in fields:
+            if name in self.expandable_fields:
+                continue
+            if name in self.sparse_columns:
+                columns.update(self.sparse_columns[name])
+                continue
+            attrs = serializer_fields[name].source_attrs
+            try:
+                model_field = model._meta.get_field(attrs[0])  # pylint: disable=protected-access
+            except (IndexError, FieldDoesNotExist):
+                return None
+            if not model_field.concrete:
+                return None
+            columns.add(model_field.name)
+        return columns
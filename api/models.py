@@ -1,5 +1,10 @@
-from django.db import models
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 import uuid
 
 
@@ -16,6 +21,21 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveBigIntegerField()
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # SHA-256 of the image whose renditions are stored (see api.images);
+    # blank until they are.
+    image_digest = models.CharField(max_length=64, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # (field, pk) indexes back keyset pagination for each ordering
+        # offered by the product list.
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['stock', 'id'], name='product_stock_id_idx'),
+            # In-stock price filters: price range with stock > 0.
+            models.Index(fields=['price', 'stock'], name='product_price_stock_idx'),
+        ]
 
     @property
     def in_stock(self):
@@ -25,6 +45,47 @@ class Product(models.Model):
         return str(self.name)
 
 
+class OrderQuerySet(models.QuerySet):
+    """QuerySet helpers for reading orders efficiently."""
+
+    def with_computed_totals(self):
+        """
+        Annotate each order with its total price and item count as computed
+        from its items, for checking or rebuilding the stored totals.
+        """
+        return self.annotate(
+            computed_total_price=Coalesce(
+                Sum(F('items__quantity') * F('items__unit_price'),
+                    output_field=models.DecimalField(
+                        max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+            ),
+            computed_item_count=Count('items'),
+        )
+
+    def delete(self):
+        """
+        Delete the orders, first taking all their sales out of the rollups
+        at once (``api.rollups.remove_sales``).
+        """
+        from api.rollups import remove_sales  # pylint: disable=import-outside-toplevel
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            remove_sales(self)
+            return super().delete()
+
+    def prefetch_items(self):
+        """
+        Prefetch items with only the product columns needed to render them.
+        """
+        return self.prefetch_related(models.Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related(  # pylint: disable=no-member
+                'product').only(
+                    'order', 'quantity', 'unit_price', 'product__name'),
+        ))
+
+
 class Order(models.Model):
     """Model representing an order in the store."""
 
@@ -38,10 +99,49 @@ class Order(models.Model):
     order_id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(
         max_length=10, choices=StatusChoices.choices, default=StatusChoices.PENDING)
     products = models.ManyToManyField(
         Product, through='OrderItem', related_name='orders')
+    # Denormalized from the order's items; written in the same transaction.
+    total_price = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'order_id'],
+                         name='order_created_at_id_idx'),
+            # A customer's orders, optionally by status and date (OrderFilter).
+            models.Index(fields=['user', 'status', 'created_at'],
+                         name='order_user_status_created_idx'),
+        ]
+
+    def delete(self, using=None, keep_parents=False):
+        """Delete the order, taking its sales out of the rollups first."""
+        from api.rollups import remove_sales  # pylint: disable=import-outside-toplevel
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            remove_sales(Order.objects.filter(pk=self.pk))
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    def recalculate_totals(self):
+        """Recompute and save total_price and item_count from the items."""
+        totals = OrderItem.objects.filter(order=self).aggregate(  # pylint: disable=no-member
+            total_price=Coalesce(
+                Sum(F('quantity') * F('unit_price'),
+                    output_field=models.DecimalField(
+                        max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+            ),
+            item_count=Count('pk'),
+        )
+        self.total_price = totals['total_price']
+        self.item_count = totals['item_count']
+        self.save(update_fields=['total_price', 'item_count', 'updated_at'])
 
 
 class OrderItem(models.Model):
@@ -51,10 +151,95 @@ class OrderItem(models.Model):
         Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Product price at the time the item was ordered.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'product'],
+                         name='orderitem_order_product_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
 
     @property
     def item_subtotal(self):
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Order: {self.order.order_id})"
+
+
+class DailySales(models.Model):
+    """
+    Revenue and units sold per day, product and order status: a rollup of
+    ``OrderItem`` for analytics that never has to scan the order tables.
+
+    Kept current by ``api.rollups.update_sales_rollups`` in the
+    transactions that write orders, and rebuilt from the order tables with
+    the ``rebuild_sales_rollups`` command.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=10, choices=Order.StatusChoices.choices)
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    units = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index for date range reads.
+            models.UniqueConstraint(
+                fields=['date', 'product', 'status'], name='dailysales_key'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date'],
+                         name='dailysales_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} {self.status}"
+
+
+class OutboxEvent(models.Model):
+    """
+    An order event waiting to be delivered to its handlers.
+
+    Written in the same transaction as the change it describes, so an
+    event exists exactly when the change was committed, and drained by
+    the ``dispatch_outbox`` command (see ``api.outbox``). Delivery is at
+    least once: handlers must tolerate seeing an event twice.
+    """
+
+    class StatusChoices(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        DISPATCHED = 'dispatched', 'Dispatched'
+        # Out of attempts; left for inspection and manual retry.
+        FAILED = 'failed', 'Failed'
+
+    event_type = models.CharField(max_length=50)
+    # Not a foreign key: events outlive deleted orders.
+    order_id = models.UUIDField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(
+        max_length=10, choices=StatusChoices.choices, default=StatusChoices.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Not delivered before this time: pushed back while a dispatcher holds
+    # the event and after each failed attempt.
+    available_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Pending events in the order they were written.
+            models.Index(fields=['status', 'id'], name='outbox_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.order_id})"
@@ -0,0 +1,218 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.models import Order, OutboxEvent, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Event type -> dotted paths of callables taking an ``OutboxEvent``,
+    # called in order. Types without handlers are marked dispatched.
+    'HANDLERS': {},
+    # Events claimed per batch.
+    'BATCH_SIZE': 100,
+    # Threads handling a batch; one runs the batch in the calling thread.
+    'WORKERS': 4,
+    # Attempts before an event is marked failed and skipped.
+    'MAX_ATTEMPTS': 8,
+    # Seconds before the first retry, doubling with each attempt up to
+    # MAX_RETRY_DELAY.
+    'RETRY_BACKOFF': 2,
+    'MAX_RETRY_DELAY': 3600,
+    # Seconds a dispatcher holds the events it claimed. Must be longer than
+    # handling a batch takes, or another dispatcher may deliver them too.
+    'LEASE_SECONDS': 300,
+}
+
+ORDER_CREATED = 'order.created'
+STATUS_EVENTS = {
+    Order.StatusChoices.SHIPPED: 'order.shipped',
+    Order.StatusChoices.DELIVERED: 'order.delivered',
+    Order.StatusChoices.CANCELLED: 'order.cancelled',
+}
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_OUTBOX', {})}
+
+
+def record_event(order, event_type, **data):
+    """
+    Add an event about ``order`` to the outbox. Must be called inside the
+    ``transaction.atomic()`` block that changes the order, so the event is
+    committed, or rolled back, with the change.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise TransactionManagementError(
+            'Outbox events must be recorded in the transaction that '
+            'changes the order.')
+    return OutboxEvent.objects.create(  # pylint: disable=no-member
+        event_type=event_type,
+        order_id=order.pk,
+        payload={
+            'order_id': order.pk,
+            'user_id': order.user_id,
+            'status': order.status,
+            'total_price': order.total_price,
+            'item_count': order.item_count,
+            **data,
+        },
+    )
+
+
+def record_order_created(order, items):
+    return record_event(order, ORDER_CREATED, items=[
+        {'product': item.product_id, 'quantity': item.quantity,
+         'unit_price': item.unit_price}
+        for item in items
+    ])
+
+
+def record_status_change(order, previous_status):
+    """Record the order's move to a status that has an event, if it moved."""
+    event_type = STATUS_EVENTS.get(order.status)
+    if event_type is None or order.status == previous_status:
+        return None
+    return record_event(order, event_type, previous_status=previous_status)
+
+
+def log_event(event):
+    logger.info('Order %s: %s', event.order_id, event.event_type)
+
+
+def email_customer(event):
+    """Tell the customer about the order event, if they have an email."""
+    user = User.objects.filter(  # pylint: disable=no-member
+        pk=event.payload['user_id']).only('email').first()
+    if user is None or not user.email:
+        return
+    status = event.event_type.split('.', 1)[1]
+    send_mail(
+        subject=f'Your order has been {status}',
+        message=(
+            f"Order {event.order_id} has been {status}.\n"
+            f"Items: {event.payload['item_count']}, "
+            f"total: {event.payload['total_price']}"),
+        from_email=None,
+        recipient_list=[user.email],
+    )
+
+
+class OutboxDispatcher:
+    """
+    Delivers pending ``OutboxEvent`` rows to their handlers, in batches.
+
+    A batch claims up to ``BATCH_SIZE`` of the oldest due events by moving
+    their ``available_at`` ``LEASE_SECONDS`` ahead, so that concurrent
+    dispatchers skip them and a crashed dispatcher's events come back once
+    the lease runs out. Events of one order are handled oldest first by a
+    single worker, and none is handled while an earlier one of its order
+    waits for a retry; different orders are handled by up to ``WORKERS``
+    threads at once. A handler error retries the whole event after a
+    backoff, so handlers must be idempotent; after ``MAX_ATTEMPTS`` the
+    event is marked failed and its order's later events go ahead.
+    """
+
+    def __init__(self, handlers=None, batch_size=None, workers=None):
+        config = outbox_settings()
+        if handlers is None:
+            handlers = {
+                event_type: [import_string(path) for path in paths]
+                for event_type, paths in config['HANDLERS'].items()
+            }
+        self.handlers = handlers
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.workers = workers or config['WORKERS']
+        self.max_attempts = config['MAX_ATTEMPTS']
+        self.retry_backoff = config['RETRY_BACKOFF']
+        self.max_retry_delay = config['MAX_RETRY_DELAY']
+        self.lease = timedelta(seconds=config['LEASE_SECONDS'])
+
+    def dispatch_batch(self):
+        """
+        Claim and handle one batch. Return a ``Counter`` of the events
+        ``dispatched``, ``retried`` and ``failed``; empty when none were due.
+        """
+        groups = self.claim()
+        if self.workers > 1 and len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self.dispatch_in_thread, groups))
+        else:
+            results = [self.dispatch_group(group) for group in groups]
+        return sum(results, Counter())
+
+    def claim(self):
+        """Lease the next due events, grouped by order, oldest first."""
+        now = timezone.now()
+        pending = OutboxEvent.objects.filter(  # pylint: disable=no-member
+            status=OutboxEvent.StatusChoices.PENDING)
+        with transaction.atomic():
+            events = list(
+                pending.select_for_update()
+                .filter(available_at__lte=now)
+                # Orders with an event that is held or waiting for a retry.
+                .exclude(order_id__in=pending.filter(
+                    available_at__gt=now).values('order_id'))
+                .order_by('id')[:self.batch_size])
+            OutboxEvent.objects.filter(  # pylint: disable=no-member
+                pk__in=[event.pk for event in events],
+            ).update(available_at=now + self.lease)
+        groups = {}
+        for event in events:
+            groups.setdefault(event.order_id, []).append(event)
+        return list(groups.values())
+
+    def dispatch_in_thread(self, events):
+        try:
+            return self.dispatch_group(events)
+        finally:
+            connections.close_all()
+
+    def dispatch_group(self, events):
+        """Handle one order's claimed events in order."""
+        outcomes = Counter()
+        for position, event in enumerate(events):
+            try:
+                for handler in self.handlers.get(event.event_type, ()):
+                    handler(event)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(
+                    'Outbox event %s (%s) failed', event.pk, event.event_type)
+                outcome = self.failed(event, exc)
+                outcomes[outcome] += 1
+                if outcome == 'retried':
+                    # Release the rest of the order to wait behind this one.
+                    OutboxEvent.objects.filter(  # pylint: disable=no-member
+                        pk__in=[later.pk for later in events[position + 1:]],
+                    ).update(available_at=timezone.now())
+                    break
+            else:
+                OutboxEvent.objects.filter(pk=event.pk).update(  # pylint: disable=no-member
+                    status=OutboxEvent.StatusChoices.DISPATCHED,
+                    dispatched_at=timezone.now(),
+                    attempts=event.attempts + 1)
+                outcomes['dispatched'] += 1
+        return outcomes
+
+    def failed(self, event, exc):
+        attempts = event.attempts + 1
+        changes = {'attempts': attempts, 'last_error': repr(exc)}
+        if attempts >= self.max_attempts:
+            changes['status'] = OutboxEvent.StatusChoices.FAILED
+            outcome = 'failed'
+        else:
+            delay = min(self.retry_backoff * 2 ** (attempts - 1),
+                        self.max_retry_delay)
+            changes['available_at'] = timezone.now() + timedelta(seconds=delay)
+            outcome = 'retried'
+        OutboxEvent.objects.filter(pk=event.pk).update(**changes)  # pylint: disable=no-member
+        return outcome
@@ -0,0 +1,233 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import filters
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Cursor pagination over products in primary key order.
+    """
+    ordering = 'pk'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination that stays O(page size) at any depth.
+
+    The page is ordered by the first term chosen by the view's
+    ``OrderingFilter``, falling back to the view's ``ordering``, then to the
+    queryset's own ordering (e.g. search relevance), with the primary key as
+    a tie-breaker in the same direction, so that each ordering can be
+    served as a range scan over a ``(field, pk)`` index. Cursors are opaque
+    tokens carrying the ordering and the key of the boundary row; a cursor is
+    rejected if the requested ordering has changed since it was issued.
+
+    Pass ``?count=1`` to include a total, counted up to ``max_count`` rows;
+    ``count_exact`` is false when the real total is larger.
+    """
+    page_size = api_settings.PAGE_SIZE
+    ordering = 'pk'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    max_count = 10000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.plan_page(queryset, request, view)
+        if self.count_requested(request):
+            self.count = self.count_queryset.count()
+        return self.finish_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, using the async ORM."""
+        queryset = self.plan_page(queryset, request, view)
+        if self.count_requested(request):
+            self.count = await self.count_queryset.acount()
+        return self.finish_page(
+            [obj async for obj in queryset[:self.page_size + 1]])
+
+    def plan_page(self, queryset, request, view):
+        """
+        Decode the cursor and return the queryset the page is read from,
+        without running any query.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering_term = self.get_ordering(request, queryset, view)
+        descending = self.ordering_term.startswith('-')
+        self.resolve_key(queryset, self.ordering_term.lstrip('-'))
+        loaded, deferred = queryset.query.deferred_loading
+        if loaded and not deferred and not self.key_is_annotation \
+                and self.key_name not in loaded:
+            # Narrowed with ``.only()``: cursors still read the key off rows.
+            queryset = queryset.only(*loaded, self.key_name)
+
+        self.count = None
+        self.count_queryset = queryset[:self.max_count + 1]
+
+        self.cursor = self.decode_cursor(request)
+        self.backwards = self.cursor is not None and self.cursor['d'] == 'p'
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self.seek_filter(self.cursor['k'], descending != self.backwards))
+
+        key_fields = [self.key_name]
+        if self.key_field != self.pk_field:
+            key_fields.append(self.pk_field.name)
+        prefix = '-' if descending != self.backwards else ''
+        return queryset.order_by(*(prefix + name for name in key_fields))
+
+    def finish_page(self, results):
+        """Trim the over-fetched row and work out the page links."""
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.backwards:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, filters.OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = getattr(view, 'ordering', None)
+        if not ordering:
+            ordering = [
+                term for term in queryset.query.order_by
+                if isinstance(term, str)
+            ] or [self.ordering]
+        if isinstance(ordering, str):
+            return ordering
+        return ordering[0]
+
+    def resolve_key(self, queryset, name):
+        """
+        Find the model field or annotation that pages are keyed on.
+        """
+        meta = queryset.model._meta  # pylint: disable=protected-access
+        self.pk_field = meta.pk
+        self.key_is_annotation = name in queryset.query.annotations
+        if name in ('pk', meta.pk.name):
+            self.key_field = meta.pk
+        elif self.key_is_annotation:
+            self.key_field = queryset.query.annotations[name].output_field
+        else:
+            self.key_field = meta.get_field(name)
+        self.key_name = name if self.key_is_annotation else self.key_field.name
+
+    def count_requested(self, request):
+        value = request.query_params.get(self.count_query_param, '')
+        return value.lower() in ('1', 'true', 'yes')
+
+    def seek_filter(self, key, descending):
+        """
+        Rows strictly after ``key`` in the given direction.
+        """
+        lookup = 'lt' if descending else 'gt'
+        value = self.key_field.to_python(key[0])
+        if self.key_field == self.pk_field:
+            return Q(**{f'pk__{lookup}': value})
+        pk = self.pk_field.to_python(key[1])
+        name = self.key_name
+        return (
+            Q(**{f'{name}__{lookup}': value})
+            | Q(**{name: value, f'pk__{lookup}': pk})
+        )
+
+    def row_key(self, obj):
+        if self.key_is_annotation:
+            key = [str(getattr(obj, self.key_name))]
+        else:
+            key = [self.key_field.value_to_string(obj)]
+        if self.key_field != self.pk_field:
+            key.append(self.pk_field.value_to_string(obj))
+        return key
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['o'] != self.ordering_term or cursor['d'] not in ('n', 'p'):
+                raise ValueError
+            self.seek_filter(cursor['k'], False)
+        except (TypeError, ValueError, KeyError, IndexError,
+                UnicodeEncodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)  # pylint: disable=raise-missing-from
+        return cursor
+
+    def encode_cursor(self, obj, direction):
+        payload = json.dumps(
+            {'o': self.ordering_term, 'd': direction, 'k': self.row_key(obj)},
+            separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], 'n')
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], 'p')
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.count is not None:
+            response['count'] = min(self.count, self.max_count)
+            response['count_exact'] = self.count <= self.max_count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'count_exact': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Include a total count, capped at {self.max_count}.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
@@ -0,0 +1,32 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON into a lazy iterator of rows, so a large
+    upload is read line by line as the view consumes it instead of all at
+    once. Blank lines are skipped; a line that is not valid JSON comes
+    through as a ``ParseError`` in place of its row, leaving the view to
+    decide whether to go on.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.rows(stream, encoding)
+
+    @staticmethod
+    def rows(stream, encoding):
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode(encoding))
+            except ValueError as exc:  # includes UnicodeDecodeError
+                yield ParseError(f'Line {number}: {exc}')
@@ -0,0 +1,240 @@
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger('api.profiling')
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Fraction of requests profiled in full, SQL included.
+    'RATE': 0.01,
+    # Requests at least this slow are always recorded (without SQL text).
+    'SLOW_REQUEST_MS': 500,
+    # Path prefixes: if ALLOW_PATHS is non-empty, only those are profiled.
+    'ALLOW_PATHS': [],
+    'DENY_PATHS': ['/silk/', '/admin/', '/metrics/', '/static/'],
+    'DATABASE': 'silk',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_BUFFERED': 10000,
+    'MAX_BODY_SIZE': 4096,
+}
+
+SENSITIVE_HEADERS = {'authorization', 'cookie', 'proxy-authorization'}
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_PROFILING', {})}
+
+
+def path_allowed(path, config):
+    if any(path.startswith(prefix) for prefix in config['DENY_PATHS']):
+        return False
+    allow = config['ALLOW_PATHS']
+    return not allow or any(path.startswith(prefix) for prefix in allow)
+
+
+def should_sample(config):
+    return random.random() < config['RATE']
+
+
+class SQLCapture:
+    """
+    ``connection.execute_wrapper`` callable recording each query's text and
+    timing for a sampled request, or just counting them otherwise.
+    """
+
+    def __init__(self, record_sql):
+        self.record_sql = record_sql
+        self.count = 0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if self.record_sql:
+                self.queries.append((sql, params, start, time.time()))
+
+
+def _body(content, config):
+    if not content or len(content) > config['MAX_BODY_SIZE']:
+        return ''
+    return content.decode('utf-8', errors='replace')
+
+
+def _render_sql(sql, params):
+    """Inline parameters for display; falls back to the raw statement."""
+    if not params or isinstance(params, dict):
+        return sql
+    try:
+        return sql % tuple(repr(param) for param in params)
+    except (TypeError, ValueError):
+        return sql
+
+
+def capture(request, response, started, elapsed, sql, config):
+    """
+    Snapshot a finished request as plain data, ready to be queued. Nothing
+    here touches the database.
+    """
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in SENSITIVE_HEADERS
+    }
+    match = getattr(request, 'resolver_match', None)
+    profile = {
+        'path': request.path,
+        'method': request.method,
+        'query_params': json.dumps(request.GET.dict()) if request.GET else '',
+        'view_name': match.view_name if match else '',
+        'headers': json.dumps(headers),
+        'start_time': started,
+        'time_taken': elapsed * 1000,
+        'status_code': response.status_code,
+        'num_sql_queries': sql.count,
+        'request_body': '',
+        'response_body': '',
+        'response_headers': json.dumps(dict(response.items())),
+        'queries': [],
+    }
+    if sql.record_sql:
+        profile['request_body'] = _body(
+            getattr(request, '_body', b''), config)
+        if not response.streaming:
+            profile['response_body'] = _body(response.content, config)
+        profile['queries'] = [
+            (_render_sql(sql_text, params), start, end)
+            for sql_text, params, start, end in sql.queries
+        ]
+    return profile
+
+
+class ProfileBuffer:
+    """
+    Holds captured profiles in memory and writes them to the profiling
+    database in batches from a background thread, so requests never wait
+    on profiler writes. When the buffer is full the oldest profiles are
+    dropped. With ``background=False`` nothing is written until ``flush``
+    is called.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def push(self, profile, config):
+        with self._lock:
+            self._items.append(profile)
+            while len(self._items) > config['MAX_BUFFERED']:
+                self._items.popleft()
+                self.dropped += 1
+            full = len(self._items) >= config['BATCH_SIZE']
+            if self.background and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='profile-flusher', daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(profiling_settings()['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to write profiles')
+
+    def flush(self):
+        """Write out everything buffered so far."""
+        config = profiling_settings()
+        while True:
+            with self._lock:
+                batch = [
+                    self._items.popleft()
+                    for _ in range(min(config['BATCH_SIZE'], len(self._items)))
+                ]
+            if not batch:
+                return
+            write_profiles(batch, config['DATABASE'])
+
+
+def write_profiles(profiles, alias):
+    """
+    Store captured profiles as Silk ``Request``, ``Response`` and
+    ``SQLQuery`` rows, three INSERT statements per batch.
+    """
+    from silk.models import Request, Response, SQLQuery  # pylint: disable=import-outside-toplevel
+
+    requests, responses, queries = [], [], []
+    for profile in profiles:
+        start = profile['start_time']
+        request = Request(
+            path=profile['path'][:190],
+            method=profile['method'],
+            query_params=profile['query_params'],
+            view_name=profile['view_name'][:190],
+            encoded_headers=profile['headers'],
+            body=profile['request_body'],
+            start_time=start,
+            end_time=start + timedelta(milliseconds=profile['time_taken']),
+            time_taken=profile['time_taken'],
+            num_sql_queries=profile['num_sql_queries'],
+        )
+        requests.append(request)
+        responses.append(Response(
+            request=request,
+            status_code=profile['status_code'],
+            body=profile['response_body'],
+            encoded_headers=profile['response_headers'],
+        ))
+        for sql, query_start, query_end in profile['queries']:
+            queries.append(SQLQuery(
+                request=request,
+                query=sql,
+                start_time=_from_timestamp(query_start),
+                end_time=_from_timestamp(query_end),
+                time_taken=(query_end - query_start) * 1000,
+                traceback='',
+            ))
+
+    # The managers' own bulk_create would re-save each request per query.
+    with transaction.atomic(using=alias):
+        Request._base_manager.using(alias).bulk_create(requests)  # pylint: disable=protected-access
+        Response._base_manager.using(alias).bulk_create(responses)  # pylint: disable=protected-access
+        SQLQuery._base_manager.using(alias).bulk_create(queries)  # pylint: disable=protected-access
+    connections[alias].close_if_unusable_or_obsolete()
+
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+buffer = ProfileBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        buffer.flush()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to write profiles at exit')
@@ -0,0 +1,176 @@
+import abc
+import csv
+import datetime
+import decimal
+import json
+import uuid
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Types DRF's ``JSONEncoder`` handles that the fast encoders are not
+# given a native path for (lazy strings, querysets, timedeltas...) still go
+# through its ``default``.
+_drf_encoder = JSONEncoder()
+
+
+def _encode_datetime(value):
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+# Exact-type table for the pure Python encoder: one dict lookup per value
+# in place of the ``isinstance`` chain in ``JSONEncoder.default``.
+_PYTHON_ENCODERS = {
+    decimal.Decimal: float,
+    uuid.UUID: str,
+    datetime.datetime: _encode_datetime,
+    datetime.date: datetime.date.isoformat,
+}
+
+
+def _python_default(value):
+    encode = _PYTHON_ENCODERS.get(type(value))
+    if encode is not None:
+        return encode(value)
+    return _drf_encoder.default(value)
+
+
+# Built once: ``json.dumps`` would construct a new encoder per response.
+_python_encoder = json.JSONEncoder(
+    ensure_ascii=False, separators=(',', ':'), allow_nan=False,
+    default=_python_default)
+
+
+def python_dumps(data):
+    """Compact UTF-8 JSON through the stdlib's C-accelerated encoder."""
+    return _python_encoder.encode(data).encode('utf-8')
+
+
+def _orjson_default(value):
+    # orjson encodes UUIDs and datetimes itself; Decimal is the only common
+    # type that comes back to Python.
+    if type(value) is decimal.Decimal:
+        return float(value)
+    return _drf_encoder.default(value)
+
+
+def orjson_dumps(data):
+    """Compact UTF-8 JSON through orjson, written into its own buffer."""
+    return orjson.dumps(
+        data, default=_orjson_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+dumps = orjson_dumps if orjson is not None else python_dumps
+JSON_ACCELERATOR = 'orjson' if orjson is not None else None
+
+
+class _Echo:
+    """
+    File-like object that hands back whatever is written to it, so
+    ``csv.writer`` can be used to produce one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer, metaclass=abc.ABCMeta):
+    """
+    Base class for renderers that can emit a list of rows incrementally.
+
+    ``stream`` yields encoded chunks for an iterable of serialized rows and
+    is used by ``StreamingExportMixin`` to back a ``StreamingHttpResponse``.
+    ``render`` covers ordinary (non-streamed) responses such as errors.
+    """
+    charset = 'utf-8'
+
+    @abc.abstractmethod
+    def stream(self, rows):
+        """Yield encoded chunks for ``rows``."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(self.stream(data))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes with orjson when it is installed and
+    otherwise with a reused stdlib encoder and an exact-type table for
+    ``Decimal``, ``UUID`` and dates.
+
+    Output matches ``JSONRenderer`` (decimals as numbers, UTC datetimes
+    ending in ``Z``, U+2028/U+2029 escaped) except that orjson writes
+    exponent floats as ``1e16`` instead of ``1e+16``. Indented output
+    (the browsable API, ``Accept: application/json; indent=4``) and
+    non-default ``UNICODE_JSON``/``COMPACT_JSON`` settings are left to
+    ``JSONRenderer``.
+    """
+    encode = staticmethod(dumps)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or self.get_indent(
+                accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = self.encode(data)
+        except TypeError:
+            # Anything orjson refuses (e.g. integers over 64 bits).
+            return super().render(data, accepted_media_type, renderer_context)
+        # Valid JSON but not valid JavaScript; JSONRenderer escapes them too.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028') \
+                .replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """
+    Renders rows as newline-delimited JSON, one object per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, rows):
+        for row in rows:
+            yield dumps(row) + b'\n'
+
+
+class CSVRenderer(StreamingRenderer):
+    """
+    Renders rows as CSV. The header is taken from the first row and nested
+    values (e.g. order items) are written as JSON.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(_Echo())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header).encode(self.charset)
+            yield writer.writerow(
+                [self._cell(row.get(field)) for field in header]
+            ).encode(self.charset)
+
+    @staticmethod
+    def _cell(value):
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, cls=JSONEncoder, separators=(',', ':'))
+        return '' if value is None else value
@@ -0,0 +1,145 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, models, router, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import DailySales, OrderItem
+
+ZERO = Decimal('0.00')
+
+
+def sales_lines(order, items, status=None):
+    """
+    Revenue and units that ``order`` with ``items`` adds to the
+    ``DailySales`` rows, keyed by (date, product id, status). ``status``
+    overrides the order's own, for the lines an order had before a change.
+    """
+    lines = {}
+    day = timezone.localdate(order.created_at)
+    for item in items:
+        key = (day, item.product_id, status or order.status)
+        revenue, units = lines.get(key, (ZERO, 0))
+        lines[key] = (revenue + item.quantity * item.unit_price,
+                      units + item.quantity)
+    return lines
+
+
+def stored_sales_lines(order, status=None):
+    """``sales_lines`` of the order's items as currently stored."""
+    return sales_lines(order, OrderItem.objects.filter(  # pylint: disable=no-member
+        order=order).only('product', 'quantity', 'unit_price'), status)
+
+
+def grouped_sales(items):
+    """
+    ``items`` (an ``OrderItem`` queryset) summed per ``DailySales`` key in
+    the database: rows of date, product_id, status, revenue and units.
+    """
+    return (
+        items.values('product_id', date=TruncDate('order__created_at'),
+                     status=F('order__status'))
+        .annotate(
+            revenue=Sum(F('quantity') * F('unit_price'),
+                        output_field=models.DecimalField(
+                            max_digits=14, decimal_places=2)),
+            units=Sum('quantity'))
+        .order_by()
+    )
+
+
+def remove_sales(orders):
+    """
+    Take the sales of ``orders`` (a queryset about to be deleted) out of
+    the rollups: one grouped query for their lines and one batch of
+    updates, however many orders there are. Must run in the deleting
+    transaction, while the orders' items are still stored.
+    """
+    rows = grouped_sales(OrderItem.objects.filter(  # pylint: disable=no-member
+        order__in=orders.values('pk')))
+    update_sales_rollups({
+        (row['date'], row['product_id'], row['status']):
+            (row['revenue'], row['units'])
+        for row in rows
+    }, {})
+
+
+def update_sales_rollups(before, after):
+    """
+    Move the ``DailySales`` rows from an order's ``before`` lines to its
+    ``after`` lines (both from ``sales_lines``; empty for an order that
+    does not exist before or after). Must run in the transaction that
+    changes the order.
+
+    Rows are changed by adding deltas, so concurrent orders never
+    overwrite each other's sales, and in key order, so they cannot
+    deadlock. Where the database supports it the whole change is one
+    ``executemany`` of ``INSERT ... ON CONFLICT DO UPDATE`` statements.
+    """
+    deltas = []
+    for key in sorted(before.keys() | after.keys()):
+        revenue_before, units_before = before.get(key, (ZERO, 0))
+        revenue_after, units_after = after.get(key, (ZERO, 0))
+        if revenue_after != revenue_before or units_after != units_before:
+            deltas.append((*key, revenue_after - revenue_before,
+                           units_after - units_before))
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(DailySales)]
+    if connection.features.supports_update_conflicts_with_target:
+        upsert_deltas(connection, deltas)
+        return
+    for day, product_id, status, revenue, units in deltas:
+        if not DailySales.objects.filter(  # pylint: disable=no-member
+                date=day, product_id=product_id, status=status,
+        ).update(revenue=F('revenue') + revenue, units=F('units') + units):
+            DailySales.objects.create(  # pylint: disable=no-member
+                date=day, product_id=product_id, status=status,
+                revenue=revenue, units=units)
+
+
+def upsert_deltas(connection, deltas):
+    meta = DailySales._meta  # pylint: disable=protected-access
+    quote = connection.ops.quote_name
+    fields = [meta.get_field(name)
+              for name in ('date', 'product', 'status', 'revenue', 'units')]
+    columns = [quote(field.column) for field in fields]
+    table = quote(meta.db_table)
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES ({values}) '
+        'ON CONFLICT ({key}) DO UPDATE SET {revenue} = {table}.{revenue} + '
+        'EXCLUDED.{revenue}, {units} = {table}.{units} + EXCLUDED.{units}'
+    ).format(
+        table=table, columns=', '.join(columns),
+        values=', '.join(['%s'] * len(fields)), key=', '.join(columns[:3]),
+        revenue=columns[3], units=columns[4])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(value, connection)
+             for field, value in zip(fields, delta)]
+            for delta in deltas
+        ])
+
+
+def day_start(day):
+    return timezone.make_aware(
+        datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def rebuild_sales_rollups(first_day, last_day):
+    """
+    Recompute the ``DailySales`` rows of ``first_day`` to ``last_day``
+    (inclusive) from the order tables, in one transaction, and return the
+    number of rows written.
+    """
+    rows = grouped_sales(OrderItem.objects.filter(  # pylint: disable=no-member
+        order__created_at__gte=day_start(first_day),
+        order__created_at__lt=day_start(last_day + timedelta(days=1))))
+    with transaction.atomic():
+        DailySales.objects.filter(  # pylint: disable=no-member
+            date__range=(first_day, last_day)).delete()
+        created = DailySales.objects.bulk_create(  # pylint: disable=no-member
+            [DailySales(**row) for row in rows], batch_size=1000)
+    return len(created)
@@ -0,0 +1,107 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DEFAULTS = {
+    # Read-only aliases that mirror the primary ('default').
+    'REPLICAS': [],
+    # Models whose reads may be served by a replica.
+    'MODELS': ['api.product', 'api.order', 'api.orderitem', 'api.dailysales'],
+    # Seconds a client keeps reading from the primary after it writes.
+    'PIN_SECONDS': 5,
+}
+
+
+class ProfilingRouter:
+    """
+    Sends Silk's models to the profiling database alias, when one is
+    configured, and keeps every other app off it.
+    """
+    app_label = 'silk'
+
+    def _alias(self):
+        alias = getattr(settings, 'API_PROFILING', {}).get('DATABASE', 'silk')
+        return alias if alias in settings.DATABASES else None
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:  # pylint: disable=protected-access
+            return self._alias()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = self._alias()
+        if alias is None:
+            return None
+        if app_label == self.app_label:
+            return db == alias
+        return False if db == alias else None
+
+
+# Set by ``api.middleware.ReplicaRoutingMiddleware`` for the duration of a
+# request whose reads may go to a replica.
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, whatever the request. Used
+    around reads whose results are shared, such as fills of the catalog
+    caches: a lagging replica's rows would be served to every client under
+    the current catalog version.
+    """
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def replica_settings():
+    return {**REPLICA_DEFAULTS, **getattr(settings, 'API_DATABASE_REPLICAS', {})}
+
+
+class ReplicaRouter:
+    """
+    Sends reads of the models in ``API_DATABASE_REPLICAS['MODELS']`` to a
+    randomly chosen ``REPLICAS`` alias while ``replica_reads`` is set, i.e.
+    during safe requests from clients that have not written recently.
+
+    Everything else reads from the primary: reads outside a request, reads
+    inside a transaction (where a request's writes belong) and reads under
+    ``primary_reads``. Writes always go to the primary. Replicas are never
+    migrated; they receive the primary's schema by replication.
+    """
+    primary = DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not replica_reads.get():
+            return None
+        config = replica_settings()
+        if not config['REPLICAS'] or model._meta.label_lower not in config['MODELS']:  # pylint: disable=protected-access
+            return None
+        if connections[self.primary].in_atomic_block:
+            return None
+        return random.choice(config['REPLICAS'])
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {self.primary, *replica_settings()['REPLICAS']}
+        if obj1._state.db in pool and obj2._state.db in pool:  # pylint: disable=protected-access
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_settings()['REPLICAS']:
+            return False
+        return None
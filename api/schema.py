@@ -0,0 +1,17 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import (
+    SimpleJWTScheme, TokenObtainPairSerializerExtension)
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    Documents ``CachedJWTAuthentication`` (and its async subclass) as the
+    bearer ``jwtAuth`` scheme; simplejwt's own extension only matches the
+    stock class.
+    """
+    target_class = 'api.authentication.CachedJWTAuthentication'
+    match_subclasses = True
+
+
+class CachedTokenObtainPairSerializerExtension(TokenObtainPairSerializerExtension):
+    """Documents the token pair in the response of ``/api/token/``."""
+    target_class = 'api.authentication.TokenObtainPairSerializer'
@@ -0,0 +1,153 @@
+import abc
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from api.models import Product
+
+
+class BaseSearchBackend(abc.ABC):
+    """
+    Interface for product search engines.
+
+    ``search`` narrows a product queryset to the matches for ``terms`` and
+    orders it by relevance, best first. Backends with an index of their own
+    also keep it in step with the product table through ``index``,
+    ``index_many``, ``remove`` and ``rebuild``.
+    """
+
+    @abc.abstractmethod
+    def search(self, queryset, terms):
+        """Return ``queryset`` narrowed to ``terms``, best match first."""
+
+    def index(self, product):
+        pass
+
+    def index_many(self, products):
+        for product in products:
+            self.index(product)
+
+    def remove(self, product_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """
+    Unindexed substring matching on name and description, as done by DRF's
+    ``SearchFilter``. Used where no full-text engine is available.
+    """
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    Ranked, prefix-matching search over an SQLite FTS5 index of product
+    names and descriptions.
+
+    The ``api_product_fts`` table is created by migration and keyed by
+    product id. Each search term matches as a prefix (``lam`` finds
+    "lamp"), all terms must match, and results are ranked with BM25,
+    weighting name matches above description matches.
+    """
+    table = 'api_product_fts'
+    name_weight = 10.0
+    description_weight = 1.0
+
+    def match_expression(self, terms):
+        phrases = []
+        for term in terms:
+            tokens = re.findall(r'\w+', term)
+            if tokens:
+                phrases.append('"%s"*' % ' '.join(tokens))
+        return ' '.join(phrases)
+
+    def search(self, queryset, terms):
+        expression = self.match_expression(terms)
+        if not expression:
+            return queryset
+        # The index is joined once, so MATCH runs once per query and BM25
+        # is scored from that match rather than a subquery per row.
+        meta = queryset.model._meta  # pylint: disable=protected-access
+        quote = connection.ops.quote_name
+        table = quote(self.table)
+        rank = RawSQL(
+            f'bm25({table}, %s, %s)',
+            (self.name_weight, self.description_weight),
+            output_field=FloatField())
+        return (
+            queryset.extra(  # pylint: disable=no-member
+                tables=[self.table],
+                where=[f'{table}.rowid = {quote(meta.db_table)}.'
+                       f'{quote(meta.pk.column)}',
+                       f'{table} MATCH %s'],
+                params=[expression])
+            .annotate(search_rank=rank)
+            .order_by('search_rank', 'pk')
+        )
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, name, description) '
+                'VALUES (%s, %s, %s)',
+                (product.pk, product.name, product.description))
+
+    def index_many(self, products):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, name, description) '
+                'VALUES (%s, %s, %s)',
+                [(product.pk, product.name, product.description)
+                 for product in products])
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', (product_id,))
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f'SELECT id, name, description FROM {Product._meta.db_table}')  # pylint: disable=protected-access
+
+
+def get_search_backend():
+    """
+    Return the configured search backend. Defaults to FTS5 on SQLite and
+    plain substring matching elsewhere.
+    """
+    path = getattr(settings, 'API_SEARCH_BACKEND', None)
+    if path is None:
+        if connection.vendor == 'sqlite':
+            return SQLiteFTS5Backend()
+        return IContainsSearchBackend()
+    return import_string(path)()
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ``SearchFilter`` that answers ``?search=`` from the search backend
+    instead of ``icontains`` scans. Without an explicit ``?ordering=``,
+    results come back best match first.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
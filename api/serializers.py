@@ -1,6 +1,48 @@
+import functools
+from collections import defaultdict
+
 from django.db import transaction
 from rest_framework import serializers
+from .images import rendition_urls
+from .inventory import InsufficientStock, rebalance, reserved_quantities
 from .models import Product, Order, OrderItem, User
+from .outbox import record_order_created, record_status_change
+from .rollups import sales_lines, update_sales_rollups
+
+
+def rebalance_stock(before, after):
+    """
+    Move stock reservations from ``before`` to ``after``, reporting any
+    shortfall as a validation error on the order's items.
+    """
+    try:
+        rebalance(before, after)
+    except InsufficientStock as exc:
+        raise serializers.ValidationError({'items': [
+            f'Insufficient stock for product {product_id}.'
+            for product_id in exc.product_ids
+        ]}) from exc
+
+
+@functools.lru_cache(maxsize=256)
+def sparse_serializer_class(serializer_class, fields):
+    """
+    Subclass of ``serializer_class`` that renders only ``fields`` (a
+    frozenset of its field names), in the serializer's own order. Cached,
+    so each selection is built, and compiled, once.
+    """
+    names = [name for name in serializer_class().fields if name in fields]
+
+    class Meta(serializer_class.Meta):
+        pass
+    Meta.fields = names
+    attrs = {
+        name: None  # drops an inherited declared field
+        for name in serializer_class._declared_fields  # pylint: disable=protected-access
+        if name not in fields
+    }
+    return type(serializer_class)(
+        serializer_class.__name__, (serializer_class,), {'Meta': Meta, **attrs})
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,10 +55,19 @@ class UserSerializer(serializers.ModelSerializer):
 
 class ProductSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    # Uploads only: clients get the renditions in ``images``.
+    image = serializers.ImageField(write_only=True, required=False, allow_null=True)
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'description', 'price', 'stock')
+        fields = ('id', 'name', 'description', 'price', 'stock', 'image', 'images')
+
+    def get_images(self, obj):
+        """Rendition name -> URL, or None until the renditions are built."""
+        if not obj.image_digest:
+            return None
+        return rendition_urls(obj.image_digest)
 
     def validate_price(self, value):
         if value <= 0:
@@ -30,7 +81,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     product_price = serializers.DecimalField(
         max_digits=10,
         decimal_places=2,
-        source='product.price'
+        source='unit_price'
     )
 
     class Meta:
@@ -38,42 +89,126 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('product_name', 'product_price', 'quantity', 'item_subtotal')
 
 
+class OrderItemListSerializer(serializers.ListSerializer):
+    """
+    Validates the product of every line with a single ``in_bulk`` query.
+    """
+
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        product_ids = {item['product_id'] for item in attrs}
+        products = Product.objects.in_bulk(product_ids)  # pylint: disable=no-member
+
+        errors = []
+        for item in attrs:
+            if item['product_id'] in products:
+                errors.append({})
+            else:
+                errors.append({'product': [
+                    f'Invalid pk "{item["product_id"]}" - object does not exist.'
+                ]})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return [
+            {'product': products[item.pop('product_id')], **item}
+            for item in attrs
+        ]
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     class OrderItemCreateSerializer(serializers.ModelSerializer):
+        product = serializers.IntegerField(source='product_id')
+
         class Meta:
             model = OrderItem
             fields = ('product', 'quantity')
+            list_serializer_class = OrderItemListSerializer
     order_id = serializers.UUIDField(read_only=True)
     items = OrderItemCreateSerializer(many=True)
 
     def create(self, validated_data):
         orderitem_data = validated_data.pop('items', None)
+        items = [
+            OrderItem(unit_price=item['product'].price, **item)
+            for item in orderitem_data
+        ]
+        status = validated_data.get('status', Order.StatusChoices.PENDING)
         with transaction.atomic():
+            rebalance_stock({}, reserved_quantities(status, items))
             order = Order.objects.create(  # pylint: disable=no-member
+                total_price=sum(item.item_subtotal for item in items),
+                item_count=len(items),
                 **validated_data)
 
-            for item in orderitem_data:
-                OrderItem.objects.create(  # pylint: disable=no-member
-                    order=order, **item)
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)  # pylint: disable=no-member
+            update_sales_rollups({}, sales_lines(order, items))
+            record_order_created(order, items)
 
             return order
 
     def update(self, instance, validated_data):
         orderitem_data = validated_data.pop('items', None)
         with transaction.atomic():
-            instance = super().update(instance, validated_data)
-
+            items = list(instance.items.all())
+            reserved = reserved_quantities(instance.status, items)
+            sales = sales_lines(instance, items)
             if orderitem_data is not None:
-                # clear existing items (optional, depends on requirements)
-                instance.items.clear()
+                items = self._sync_items(instance, items, orderitem_data)
 
-                # Recreate items with the updated data
-                for item in orderitem_data:
-                    OrderItem.objects.create(  # pylint: disable=no-member.
-                        order=instance, **item)
+            previous_status = instance.status
+            status = validated_data.get('status', previous_status)
+            rebalance_stock(reserved, reserved_quantities(
+                status, items, previous_status))
+            instance = super().update(instance, validated_data)
+            update_sales_rollups(sales, sales_lines(instance, items))
+            record_status_change(instance, previous_status)
 
         return instance
 
+    def _sync_items(self, order, current_items, orderitem_data):
+        """
+        Bring the order's ``current_items`` in line with ``orderitem_data``,
+        returning the resulting items and touching
+        only the lines that changed. Existing lines are matched by product
+        and keep their price snapshot; new lines take the current price.
+        The work is at most one delete, one update and one insert regardless
+        of order size. The order's totals are set on ``order`` but left for
+        the caller to save.
+        """
+        existing = defaultdict(list)
+        for item in current_items:
+            existing[item.product_id].append(item)
+
+        to_create, to_update, kept = [], [], []
+        for data in orderitem_data:
+            matches = existing.get(data['product'].pk)
+            if not matches:
+                to_create.append(OrderItem(
+                    order=order, unit_price=data['product'].price, **data))
+                continue
+            item = matches.pop(0)
+            kept.append(item)
+            if item.quantity != data['quantity']:
+                item.quantity = data['quantity']
+                to_update.append(item)
+
+        stale = [item.pk for items in existing.values() for item in items]
+        if stale:
+            OrderItem.objects.filter(pk__in=stale).delete()  # pylint: disable=no-member
+        if to_update:
+            OrderItem.objects.bulk_update(  # pylint: disable=no-member
+                to_update, ['quantity'])
+        if to_create:
+            OrderItem.objects.bulk_create(to_create)  # pylint: disable=no-member
+
+        items = kept + to_create
+        order.total_price = sum(item.item_subtotal for item in items)
+        order.item_count = len(items)
+        return items
+
     class Meta:
         model = Order
         fields = (
@@ -94,8 +229,26 @@ class OrderSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, obj):
-        order_items = obj.items.all()
-        return sum(order_item.item_subtotal for order_item in order_items)
+        return obj.total_price
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            previous_status = instance.status
+            if 'status' in validated_data:
+                # Cancelling an open order releases its stock; reopening
+                # takes it back.
+                items = instance.items.all()
+                rebalance_stock(
+                    reserved_quantities(previous_status, items),
+                    reserved_quantities(
+                        validated_data['status'], items, previous_status))
+            instance = super().update(instance, validated_data)
+            if 'status' in validated_data:
+                update_sales_rollups(
+                    sales_lines(instance, items, previous_status),
+                    sales_lines(instance, items))
+                record_status_change(instance, previous_status)
+            return instance
 
     class Meta:
         model = Order
@@ -105,11 +258,30 @@ class OrderSerializer(serializers.ModelSerializer):
             'user',
             'status',
             'items',
-            'total_price'
+            'total_price',
+            'item_count',
         )
+        read_only_fields = ('item_count',)
 
 
 class ProductInfoSerializer(serializers.Serializer):
     products = ProductSerializer(many=True)
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
     count = serializers.IntegerField()
+    in_stock_count = serializers.IntegerField()
     max_price = serializers.FloatField()
+    min_price = serializers.FloatField()
+    avg_price = serializers.FloatField()
+
+
+class SalesSerializer(serializers.Serializer):
+    """
+    Summed ``DailySales`` rows. Grouping columns a summary is not grouped
+    by are left out.
+    """
+    date = serializers.DateField(required=False)
+    product = serializers.IntegerField(required=False)
+    status = serializers.CharField(required=False)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
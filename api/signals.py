@@ -0,0 +1,82 @@
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api.authentication import BLACKLIST_APP, blacklist, invalidate_user
+from api.catalog import bump_catalog_version_on_commit
+from api.images import queue_renditions
+from api.models import Order, Product, User
+from api.rollups import remove_sales
+from api.search import get_search_backend
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, **kwargs):
+    """
+    Invalidate cached catalog data whenever a product is saved or deleted,
+    once the change is committed.
+    """
+    bump_catalog_version_on_commit()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+def note_image_upload(sender, instance, **kwargs):
+    """
+    Flag a newly uploaded image (one this save stores) for renditions, and
+    drop the renditions of a replaced or removed one.
+    """
+    if 'image' in instance.get_deferred_fields():
+        return
+    image = instance.image
+    uploaded = bool(image) and not image._committed  # pylint: disable=protected-access
+    if uploaded or not image:
+        instance.image_digest = ''
+    instance._image_uploaded = uploaded  # pylint: disable=protected-access
+
+
+@receiver(post_save, sender=Product)
+def build_image_renditions(sender, instance, **kwargs):
+    """Queue renditions of a newly uploaded image once it is committed."""
+    if getattr(instance, '_image_uploaded', False):
+        transaction.on_commit(partial(queue_renditions, instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """
+    Take the sales of a deleted user's orders out of the rollups: the
+    orders go by cascade, past ``Order.delete`` and ``OrderQuerySet.delete``
+    which do that for every other order deletion.
+    """
+    remove_sales(Order.objects.filter(user=instance))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    Drop the user from the authentication cache, now and again on commit
+    so a concurrent request cannot cache the row from before the save.
+    """
+    invalidate_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+if apps.is_installed(BLACKLIST_APP):
+    @receiver(post_save, sender='token_blacklist.BlacklistedToken')
+    def token_blacklisted(sender, **kwargs):
+        blacklist.invalidate()
+        transaction.on_commit(blacklist.invalidate)
@@ -1,10 +1,100 @@
-from django.test import TestCase
-from api.models import User, Order
+import importlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import Count, Q
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from drf_spectacular.generators import SchemaGenerator
+from api import authentication as auth
+from api import bulk as api_bulk
+from api import images
+from api import renderers
+from api.authentication import CachedJWTAuthentication, get_user_cache
+from api.cache import LocMemLRUBackend, get_response_cache
+from api.catalog import check_catalog_version_cache, get_catalog_version
+from api.fast_serializers import compiled_serializer
+from api.filters import OrderFilter, ProductFilter
+from api.metrics import QueryRecorder, query_shape, registry
+from api.models import (DailySales, Order, OrderItem, OutboxEvent, Product,
+                        User)
+from api.outbox import OutboxDispatcher, record_event
+from api.pagination import KeysetPagination, ProductCursorPagination
+from api.profiling import ProfileBuffer
+from api.renderers import FastJSONRenderer
+from api.routers import ProfilingRouter, primary_reads, replica_reads
+from api.serializers import (OrderItemSerializer, OrderSerializer,
+                             ProductSerializer, UserSerializer)
 from django.urls import reverse
-from rest_framework import status
+from rest_framework import serializers, status
+from rest_framework.exceptions import AuthenticationFailed, ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from PIL import Image
+from silk.models import Request as SilkRequest
 
 # Create your tests here.
 
+# Tests run against the primary alone: a replica would not see the rows of
+# a TestCase's open transaction. Sampled profiling is off unless a test
+# turns it on.
+test_settings = override_settings(
+    API_DATABASE_REPLICAS={**settings.API_DATABASE_REPLICAS, 'REPLICAS': []},
+    API_PROFILING={**settings.API_PROFILING, 'ENABLED': False},
+)
+
+
+def setUpModule():  # pylint: disable=invalid-name
+    test_settings.enable()
+
+
+def tearDownModule():  # pylint: disable=invalid-name
+    test_settings.disable()
+
+
+def app_queries(captured):
+    """
+    Data statements captured during a request, minus Silk's own bookkeeping
+    (its inserts, EXPLAINs and savepoints).
+    """
+    return [
+        q for q in captured.captured_queries
+        if q['sql'].startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE'))
+        and 'silk_' not in q['sql']
+    ]
+
+
+def query_plan(queryset):
+    """SQLite's EXPLAIN QUERY PLAN output for a queryset, as one string."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
 
 class UserOrdersAPITestCase(TestCase):
     def setUp(self):
@@ -28,3 +118,1911 @@ class UserOrdersAPITestCase(TestCase):
     def test_user_order_list_unauthenticated(self):
         response = self.client.get(reverse('user-orders'))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ProductInfoAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(
+            name='A', description='a', price=Decimal('10.00'), stock=0)
+        Product.objects.create(
+            name='B', description='b', price=Decimal('30.00'), stock=5)
+
+    def test_summary_is_computed_in_a_single_aggregate_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/info/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # one aggregate for the summary, one for the cursor page
+        self.assertEqual(len(app_queries(queries)), 2)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['in_stock_count'], 1)
+        self.assertEqual(data['max_price'], 30.0)
+        self.assertEqual(data['min_price'], 10.0)
+        self.assertEqual(data['avg_price'], 20.0)
+        self.assertEqual(len(data['products']), 2)
+
+    def test_summary_is_cached_until_a_product_changes(self):
+        self.client.get('/products/info/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/products/info/')
+        self.assertEqual(len(app_queries(queries)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='C', description='c', price=Decimal('50.00'), stock=1)
+        data = self.client.get('/products/info/').json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['max_price'], 50.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(name='C').delete()
+        self.assertEqual(self.client.get('/products/info/').json()['count'], 2)
+
+    @mock.patch.object(ProductCursorPagination, 'page_size', 1)
+    def test_products_are_cursor_paginated(self):
+        first = self.client.get('/products/info/').json()
+        self.assertEqual([p['name'] for p in first['products']], ['A'])
+        self.assertIsNotNone(first['next'])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([p['name'] for p in second['products']], ['B'])
+        self.assertIsNone(second['next'])
+
+
+class StreamingExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='test')
+        self.cheap = Product.objects.create(
+            name='Cheap', description='x', price=Decimal('5.00'), stock=3)
+        self.pricey = Product.objects.create(
+            name='Pricey', description='y', price=Decimal('50.00'), stock=1)
+        Product.objects.create(
+            name='Gone', description='z', price=Decimal('7.00'), stock=0)
+        order = Order.objects.create(
+            user=self.user, status=Order.StatusChoices.SHIPPED)
+        OrderItem.objects.create(order=order, product=self.cheap, quantity=2)
+        Order.objects.create(user=self.user)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_products_ndjson_applies_filters_and_ordering(self):
+        response = self.client.get(
+            '/products/', {'format': 'ndjson', 'price__gt': '1', 'ordering': '-price'})
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Pricey', 'Cheap'])
+
+    def test_products_csv_has_header_and_search(self):
+        response = self.client.get(
+            '/products/', {'format': 'csv', 'search': 'cheap'})
+        lines = self.read(response).splitlines()
+        # Nested renditions stay out of CSV.
+        self.assertEqual(lines[0], 'id,name,description,price,stock')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Cheap', lines[1])
+
+    def test_orders_ndjson_applies_order_filter(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            '/orders/', {'format': 'ndjson', 'status': 'shipped'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['items'][0]['quantity'], 2)
+
+    def test_users_csv_streams_without_pagination(self):
+        response = self.client.get('/users/', {'format': 'csv'})
+        self.assertEqual(len(self.read(response).splitlines()), 2)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        # several products share a price so pages have to break ties on pk
+        for i, price in enumerate(['3.00', '1.00', '2.00', '2.00', '2.00', '1.00']):
+            Product.objects.create(
+                name=f'P{i}', description='', price=Decimal(price), stock=i + 1)
+
+    def walk(self, url, params):
+        names, response = [], self.client.get(url, params).json()
+        names.extend(p['name'] for p in response['results'])
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            names.extend(p['name'] for p in response['results'])
+        return names, response
+
+    @mock.patch.object(KeysetPagination, 'page_size', 2)
+    def test_walks_every_ordering_without_gaps_or_duplicates(self):
+        for ordering in ['price', '-price', 'name', '-stock']:
+            with self.subTest(ordering=ordering):
+                expected = [
+                    p.name for p in Product.objects.order_by(
+                        ordering, ordering.replace(ordering.lstrip('-'), 'pk'))
+                ]
+                names, _ = self.walk('/products/', {'ordering': ordering})
+                self.assertEqual(names, expected)
+
+    @mock.patch.object(KeysetPagination, 'page_size', 2)
+    def test_previous_link_returns_the_prior_page(self):
+        first = self.client.get('/products/', {'ordering': 'price'}).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNotNone(back['next'])
+        self.assertIsNone(back['previous'])
+
+    @mock.patch.object(KeysetPagination, 'page_size', 2)
+    def test_cursor_is_bound_to_its_ordering(self):
+        first = self.client.get('/products/', {'ordering': 'price'}).json()
+        response = self.client.get(
+            first['next'].replace('ordering=price', 'ordering=stock'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/products/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_count_is_optional_and_capped(self):
+        self.assertNotIn('count', self.client.get('/products/').json())
+        with mock.patch.object(KeysetPagination, 'max_count', 4):
+            data = self.client.get('/products/', {'count': '1'}).json()
+        self.assertEqual(data['count'], 4)
+        self.assertFalse(data['count_exact'])
+        get_response_cache().clear()
+        data = self.client.get('/products/', {'count': '1'}).json()
+        self.assertEqual(data['count'], 6)
+        self.assertTrue(data['count_exact'])
+
+    @mock.patch.object(KeysetPagination, 'page_size', 1)
+    def test_orders_default_to_newest_first(self):
+        user = User.objects.create_user(username='pager', password='test')
+        older = Order.objects.create(user=user)
+        newer = Order.objects.create(user=user)
+        self.client.force_login(user)
+        first = self.client.get('/orders/').json()
+        self.assertEqual(first['results'][0]['order_id'], str(newer.order_id))
+        second = self.client.get(first['next']).json()
+        self.assertEqual(second['results'][0]['order_id'], str(older.order_id))
+        self.assertIsNone(second['next'])
+
+    def test_seek_query_uses_an_index(self):
+        queryset = Product.objects.filter(
+            Q(price__gt=1) | Q(price=1, pk__gt=1)).order_by('price', 'pk')
+        self.assertIn('product_price_id_idx', query_plan(queryset))
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='totals', password='test')
+        pen = Product.objects.create(
+            name='Pen', description='long text', price=Decimal('1.50'), stock=10)
+        ink = Product.objects.create(
+            name='Ink', description='long text', price=Decimal('4.25'), stock=10)
+        for quantity in range(1, 4):
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.create(order=order, product=pen, quantity=quantity)
+            OrderItem.objects.create(order=order, product=ink, quantity=2)
+            order.recalculate_totals()
+        Order.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_totals_match_python_item_subtotals(self):
+        results = self.client.get('/orders/').json()['results']
+        for data in results:
+            order = Order.objects.get(order_id=data['order_id'])
+            expected = sum(item.item_subtotal for item in order.items.all())
+            self.assertEqual(Decimal(str(data['total_price'])), expected)
+            self.assertEqual(data['item_count'], order.items.count())
+
+    def test_listing_orders_uses_a_fixed_number_of_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/orders/')
+        order_queries = app_queries(queries)
+        # session, user, validator, orders, items joined to product names
+        self.assertEqual(len(order_queries), 5)
+        self.assertNotIn('api_orderitem', order_queries[3]['sql'])
+        item_query = order_queries[-1]['sql']
+        self.assertIn('"api_orderitem"."unit_price"', item_query)
+        self.assertNotIn('"api_product"."price"', item_query)
+        self.assertNotIn('"api_product"."description"', item_query)
+
+    def test_user_orders_endpoint_includes_totals(self):
+        data = self.client.get(reverse('user-orders')).json()
+        self.assertEqual(len(data), 4)
+        self.assertEqual(sorted(order['item_count'] for order in data),
+                         [0, 2, 2, 2])
+
+
+class OrderItemBulkWriteTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', password='test')
+        self.products = [
+            Product.objects.create(
+                name=f'Item {i}', description='', price=Decimal('2.00'), stock=100)
+            for i in range(5)
+        ]
+        self.client.force_login(self.user)
+
+    def items(self, *pairs):
+        return [{'product': self.products[i].pk, 'quantity': q} for i, q in pairs]
+
+    def write_queries(self, captured):
+        # Stock reservations are covered by InventoryReservationTestCase.
+        return [q for q in app_queries(captured)
+                if not q['sql'].startswith(('SELECT', 'UPDATE "api_product"'))]
+
+    def test_create_inserts_all_items_in_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/orders/', {'items': self.items((0, 1), (1, 2), (2, 3), (3, 4))},
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        product_lookups = [q for q in app_queries(queries)
+                           if q['sql'].startswith('SELECT')
+                           and 'FROM "api_product"' in q['sql']]
+        self.assertEqual(len(product_lookups), 1)
+        # one INSERT for the order, one for all of its items, one for the
+        # order.created outbox event
+        self.assertEqual(len(self.write_queries(queries)), 3)
+        order = Order.objects.get(order_id=response.json()['order_id'])
+        self.assertEqual(order.items.count(), 4)
+
+    def test_unknown_product_is_reported_per_line(self):
+        payload = self.items((0, 1))
+        payload.append({'product': 9999, 'quantity': 1})
+        response = self.client.post(
+            '/orders/', {'items': payload}, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['items'][0], {})
+        self.assertIn('9999', response.json()['items'][1]['product'][0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_update_only_writes_changed_lines(self):
+        order = Order.objects.create(user=self.user)
+        for i, quantity in [(0, 1), (1, 1), (2, 1)]:
+            OrderItem.objects.create(
+                order=order, product=self.products[i], quantity=quantity)
+        unchanged = order.items.get(product=self.products[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(
+                f'/orders/{order.order_id}/',
+                {'status': 'confirmed', 'items': self.items((0, 1), (1, 5), (3, 2))},
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # order UPDATE, then one DELETE, one UPDATE and one INSERT for items
+        self.assertEqual(len(self.write_queries(queries)), 4)
+        lines = {item.product_id: item for item in order.items.all()}
+        self.assertEqual({pk: item.quantity for pk, item in lines.items()}, {
+            self.products[0].pk: 1,
+            self.products[1].pk: 5,
+            self.products[3].pk: 2,
+        })
+        self.assertEqual(lines[self.products[0].pk].pk, unchanged.pk)
+
+
+class OrderPriceSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='snap', password='test')
+        self.product = Product.objects.create(
+            name='Lamp', description='', price=Decimal('20.00'), stock=5)
+        self.client.force_login(self.user)
+
+    def place_order(self, quantity):
+        response = self.client.post(
+            '/orders/', {'items': [{'product': self.product.pk, 'quantity': quantity}]},
+            content_type='application/json')
+        return Order.objects.get(order_id=response.json()['order_id'])
+
+    def test_totals_are_stored_when_the_order_is_created(self):
+        order = self.place_order(3)
+        self.assertEqual(order.total_price, Decimal('60.00'))
+        self.assertEqual(order.item_count, 1)
+        self.assertEqual(order.items.get().unit_price, Decimal('20.00'))
+
+    def test_price_changes_do_not_rewrite_history(self):
+        order = self.place_order(2)
+        self.product.price = Decimal('99.00')
+        self.product.save()
+
+        data = self.client.get(f'/orders/{order.order_id}/').json()
+        self.assertEqual(data['total_price'], 40.0)
+        self.assertEqual(data['items'][0]['product_price'], '20.00')
+
+    def test_update_keeps_snapshots_and_refreshes_totals(self):
+        order = self.place_order(1)
+        self.product.price = Decimal('30.00')
+        self.product.save()
+        other = Product.objects.create(
+            name='Bulb', description='', price=Decimal('2.50'), stock=5)
+
+        self.client.put(
+            f'/orders/{order.order_id}/',
+            {'status': 'pending', 'items': [
+                {'product': self.product.pk, 'quantity': 2},
+                {'product': other.pk, 'quantity': 4},
+            ]},
+            content_type='application/json')
+
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('50.00'))
+        self.assertEqual(order.item_count, 2)
+
+    def test_backfill_migration_computes_totals_in_batches(self):
+        migration = importlib.import_module(
+            'api.migrations.0003_backfill_order_totals')
+        orders = [Order.objects.create(user=self.user) for _ in range(3)]
+        for quantity, order in enumerate(orders, start=1):
+            OrderItem.objects.create(
+                order=order, product=self.product, quantity=quantity)
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_order_totals(Order)
+
+        for quantity, order in enumerate(orders, start=1):
+            order.refresh_from_db()
+            self.assertEqual(order.total_price, Decimal('20.00') * quantity)
+            self.assertEqual(order.item_count, 1)
+
+
+class InventoryReservationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stock', password='test')
+        self.mug = Product.objects.create(
+            name='Mug', description='', price=Decimal('8.00'), stock=5)
+        self.cup = Product.objects.create(
+            name='Cup', description='', price=Decimal('4.00'), stock=2)
+        self.client.force_login(self.user)
+
+    def stock(self):
+        return {p.name: p.stock for p in Product.objects.all()}
+
+    def place_order(self, *lines):
+        return self.client.post(
+            '/orders/',
+            {'items': [{'product': p.pk, 'quantity': q} for p, q in lines]},
+            content_type='application/json')
+
+    def test_creating_an_order_reserves_stock(self):
+        response = self.place_order((self.mug, 2), (self.cup, 1), (self.mug, 1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(), {'Mug': 2, 'Cup': 1})
+
+    def test_short_stock_rejects_the_whole_order(self):
+        response = self.place_order((self.mug, 1), (self.cup, 3))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['items'],
+                         [f'Insufficient stock for product {self.cup.pk}.'])
+        self.assertEqual(self.stock(), {'Mug': 5, 'Cup': 2})
+        self.assertFalse(Order.objects.exists())
+
+    def test_reservations_are_conditional_updates_in_product_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.place_order((self.cup, 1), (self.mug, 1))
+        updates = [q['sql'] for q in app_queries(queries)
+                   if q['sql'].startswith('UPDATE "api_product"')]
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(all('"stock" >= 1' in sql for sql in updates))
+        self.assertIn(f'"id" = {self.mug.pk}', updates[0])
+        self.assertIn(f'"id" = {self.cup.pk}', updates[1])
+
+    def test_cancelling_releases_and_reopening_reserves_again(self):
+        order_id = self.place_order((self.mug, 3)).json()['order_id']
+
+        self.client.patch(f'/orders/{order_id}/', {'status': 'cancelled'},
+                          content_type='application/json')
+        self.assertEqual(self.stock()['Mug'], 5)
+
+        self.client.patch(f'/orders/{order_id}/', {'status': 'pending'},
+                          content_type='application/json')
+        self.assertEqual(self.stock()['Mug'], 2)
+
+    def test_updating_items_moves_only_the_difference(self):
+        order_id = self.place_order((self.mug, 3)).json()['order_id']
+        response = self.client.put(
+            f'/orders/{order_id}/',
+            {'status': 'pending', 'items': [
+                {'product': self.mug.pk, 'quantity': 1},
+                {'product': self.cup.pk, 'quantity': 2},
+            ]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), {'Mug': 4, 'Cup': 0})
+
+    def test_deleting_an_open_order_releases_its_stock(self):
+        order_id = self.place_order((self.cup, 2)).json()['order_id']
+        self.client.delete(f'/orders/{order_id}/')
+        self.assertEqual(self.stock()['Cup'], 2)
+
+    def test_fulfilled_orders_keep_their_stock(self):
+        shipped = self.place_order((self.mug, 2)).json()['order_id']
+        delivered = self.place_order((self.cup, 2)).json()['order_id']
+        self.client.patch(f'/orders/{shipped}/', {'status': 'shipped'},
+                          content_type='application/json')
+        self.client.put(
+            f'/orders/{delivered}/',
+            {'status': 'delivered',
+             'items': [{'product': self.cup.pk, 'quantity': 2}]},
+            content_type='application/json')
+        self.assertEqual(self.stock(), {'Mug': 3, 'Cup': 0})
+
+        self.client.patch(f'/orders/{shipped}/', {'status': 'cancelled'},
+                          content_type='application/json')
+        self.assertEqual(
+            self.client.delete(f'/orders/{delivered}/').status_code,
+            status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.stock(), {'Mug': 3, 'Cup': 0})
+
+
+class CatalogResponseCacheTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.lamp = Product.objects.create(
+            name='Lamp', description='', price=Decimal('20.00'), stock=5)
+
+    def test_repeated_anonymous_gets_are_served_from_cache(self):
+        first = self.client.get('/products/', {'ordering': 'price', 'price__gt': '1'})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(
+                '/products/', {'price__gt': '1', 'ordering': 'price'})
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        # Only the conditional-GET validators touch the database: with the
+        # per-process default cache they come from the rows.
+        self.assertEqual(len(app_queries(queries)), 1)
+        self.assertIn('MAX("api_product"."updated_at")', app_queries(queries)[0]['sql'])
+        self.assertEqual(get_response_cache().stats(), {'hits': 1, 'misses': 1})
+
+    def test_product_changes_invalidate_cached_responses(self):
+        url = f'/products/{self.lamp.pk}/'
+        self.client.get(url)
+        self.client.get('/products/')
+        self.lamp.price = Decimal('25.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp.save()
+            # Until the save commits, readers keep the cached version.
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        detail = self.client.get(url)
+        self.assertEqual(detail['X-Cache'], 'MISS')
+        self.assertEqual(detail.json()['price'], '25.00')
+        self.assertEqual(self.client.get('/products/')['X-Cache'], 'MISS')
+
+    def test_stock_reservations_invalidate_cached_responses(self):
+        user = User.objects.create_user(username='shopper', password='test')
+        self.client.get(f'/products/{self.lamp.pk}/')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/orders/', {'items': [{'product': self.lamp.pk, 'quantity': 2}]},
+                content_type='application/json')
+        self.client.logout()
+
+        self.assertEqual(self.client.get(f'/products/{self.lamp.pk}/').json()['stock'], 3)
+
+    def test_deploy_check_wants_a_shared_version_cache(self):
+        self.assertEqual(
+            [error.id for error in check_catalog_version_cache(None)],
+            ['api.W001'])
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': 'redis://localhost:6379'}}):
+            self.assertEqual(check_catalog_version_cache(None), [])
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        user = User.objects.create_user(username='member', password='test')
+        self.client.force_login(user)
+        self.client.get('/products/')
+        self.assertNotIn('X-Cache', self.client.get('/products/'))
+
+    def test_lru_backend_evicts_least_recently_used(self):
+        backend = LocMemLRUBackend(max_entries=2)
+        backend.set('a', 1, None)
+        backend.set('b', 2, None)
+        backend.get('a')
+        backend.set('c', 3, None)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), 3)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        # Catalog ETags follow the catalog version only when every process
+        # shares it, so these tests keep it in a cache outside the process.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared_cache = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name}})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        get_response_cache().clear()
+        self.user = User.objects.create_user(username='poller', password='test')
+        self.product = Product.objects.create(
+            name='Kettle', description='', price=Decimal('30.00'), stock=4)
+
+    def test_product_list_returns_304_until_the_catalog_changes(self):
+        first = self.client.get('/products/?search=kettle')
+        self.assertIn('ETag', first)
+
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(
+                '/products/?search=kettle', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again.content, b'')
+        # Catalog validators come from the catalog version alone.
+        self.assertEqual(app_queries(queries), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Kettle lid', description='', price=Decimal('4.00'), stock=1)
+        changed = self.client.get(
+            '/products/?search=kettle', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_etag_depends_on_query_parameters(self):
+        plain = self.client.get('/products/')
+        ordered = self.client.get(
+            '/products/', {'ordering': '-price'}, HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(ordered.status_code, status.HTTP_200_OK)
+
+    def test_product_detail_revalidates_against_the_catalog_version(self):
+        url = f'/products/{self.product.pk}/'
+        first = self.client.get(url)
+        self.assertNotIn('Last-Modified', first)
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(app_queries(queries), [])
+
+        self.product.stock = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+
+    def test_process_local_catalog_version_falls_back_to_row_validators(self):
+        url = f'/products/{self.product.pk}/'
+        # Signed in, past the response cache and its own expiry.
+        self.client.force_login(self.user)
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            first = self.client.get(url)
+            self.assertIn('Last-Modified', first)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+                status.HTTP_304_NOT_MODIFIED)
+
+            # Changed by another process, whose version bump this one
+            # never sees.
+            Product.objects.filter(pk=self.product.pk).update(
+                stock=2, updated_at=timezone.now() + timedelta(seconds=1))
+            changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(changed.status_code, status.HTTP_200_OK)
+            self.assertEqual(changed.json()['stock'], 2)
+
+    def test_missing_product_is_still_404(self):
+        response = self.client.get('/products/999/', HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_orders_change_validator_when_an_order_is_updated(self):
+        order = Order.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        first = self.client.get('/orders/')
+        detail = self.client.get(f'/orders/{order.order_id}/')
+
+        self.assertEqual(self.client.get(
+            '/orders/', HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(f'/orders/{order.order_id}/', {'status': 'shipped'},
+                          content_type='application/json')
+        self.assertEqual(self.client.get(
+            '/orders/', HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            status.HTTP_200_OK)
+        self.assertEqual(self.client.get(
+            f'/orders/{order.order_id}/', HTTP_IF_NONE_MATCH=detail['ETag']).status_code,
+            status.HTTP_200_OK)
+
+    def test_stock_reservations_touch_updated_at(self):
+        before = self.product.updated_at
+        self.client.force_login(self.user)
+        self.client.post(
+            '/orders/', {'items': [{'product': self.product.pk, 'quantity': 1}]},
+            content_type='application/json')
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+
+
+class FullTextSearchTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.lamp = Product.objects.create(
+            name='Desk Lamp', description='Adjustable arm', price=Decimal('30.00'), stock=3)
+        self.bulb = Product.objects.create(
+            name='Bulb', description='Fits any lamp socket', price=Decimal('3.00'), stock=9)
+        self.chair = Product.objects.create(
+            name='Office Chair', description='Ergonomic', price=Decimal('99.00'), stock=2)
+
+    def search(self, query, **params):
+        response = self.client.get('/products/', {'search': query, **params})
+        return [p['name'] for p in response.json()['results']]
+
+    def test_results_are_ranked_with_name_matches_first(self):
+        self.assertEqual(self.search('lamp'), ['Desk Lamp', 'Bulb'])
+
+    def test_terms_match_as_prefixes_and_must_all_match(self):
+        self.assertEqual(self.search('ergo'), ['Office Chair'])
+        self.assertEqual(self.search('lamp sock'), ['Bulb'])
+        self.assertEqual(self.search('--'), ['Desk Lamp', 'Bulb', 'Office Chair'])
+
+    def test_explicit_ordering_overrides_relevance(self):
+        self.assertEqual(self.search('lamp', ordering='-price'), ['Desk Lamp', 'Bulb'])
+        self.assertEqual(self.search('lamp', ordering='price'), ['Bulb', 'Desk Lamp'])
+
+    def test_index_follows_product_saves_and_deletes(self):
+        self.chair.name = 'Office Stool'
+        self.chair.save()
+        self.assertEqual(self.search('stool'), ['Office Stool'])
+        self.assertEqual(self.search('chair'), [])
+
+        self.bulb.delete()
+        self.assertEqual(self.search('socket'), [])
+
+    @mock.patch.object(KeysetPagination, 'page_size', 1)
+    def test_ranked_results_page_with_cursors(self):
+        first = self.client.get('/products/', {'search': 'lamp'}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [first['results'][0]['name'], second['results'][0]['name']],
+            ['Desk Lamp', 'Bulb'])
+        self.assertIsNone(second['next'])
+
+    def test_rebuild_picks_up_bulk_created_products(self):
+        Product.objects.bulk_create([Product(
+            name='Sofa', description='', price=Decimal('500.00'), stock=1)])
+        self.assertEqual(self.search('sofa'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        get_response_cache().clear()
+        self.assertEqual(self.search('sofa'), ['Sofa'])
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Every supported filter combination must be answered from an index, not
+    a full scan of the table.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='test')
+
+    def assert_uses_index(self, queryset, table):
+        plan = query_plan(queryset)
+        self.assertNotRegex(plan, rf'SCAN {table}(?! USING)', plan)
+        self.assertRegex(plan, rf'(SEARCH|SCAN) {table} USING (COVERING )?INDEX', plan)
+
+    def test_order_filters_use_indexes(self):
+        own_orders = Order.objects.filter(user=self.user)
+        combinations = [
+            (own_orders, {}),
+            (own_orders, {'status': 'shipped'}),
+            (own_orders, {'status': 'shipped', 'created_at': '2024-05-01'}),
+            (own_orders, {'created_at__gt': '2024-05-01T00:00:00Z'}),
+            (own_orders, {'created_at__range': '2024-05-01T00:00:00Z,2024-06-01T00:00:00Z'}),
+            (Order.objects.all(), {'created_at': '2024-05-01'}),
+            (Order.objects.all(), {'created_at__lt': '2024-05-01T00:00:00Z'}),
+            (Order.objects.all(), {'user': self.user.pk, 'status': 'pending'}),
+        ]
+        for queryset, params in combinations:
+            with self.subTest(params=params, own=queryset is own_orders):
+                filtered = OrderFilter(params, queryset=queryset).qs
+                self.assert_uses_index(filtered, 'api_order')
+
+    def test_date_filter_is_a_half_open_range(self):
+        sql = str(OrderFilter({'created_at': '2024-05-01'},
+                              queryset=Order.objects.all()).qs.query)
+        self.assertNotIn('django_datetime_cast_date', sql)
+        self.assertIn('"api_order"."created_at" >= 2024-05-01 00:00:00', sql)
+        self.assertIn('"api_order"."created_at" < 2024-05-02 00:00:00', sql)
+
+    def test_date_filter_includes_the_whole_day(self):
+        inside = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=inside.pk).update(
+            created_at=datetime(2024, 5, 1, 23, 59, 59, tzinfo=dt_timezone.utc))
+        outside = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=outside.pk).update(
+            created_at=datetime(2024, 5, 2, tzinfo=dt_timezone.utc))
+
+        filtered = OrderFilter({'created_at': '2024-05-01'},
+                               queryset=Order.objects.all()).qs
+        self.assertEqual(list(filtered), [inside])
+
+    def test_order_items_are_looked_up_by_index(self):
+        order = Order.objects.create(user=self.user)
+        self.assert_uses_index(
+            OrderItem.objects.filter(order=order, product_id=1), 'api_orderitem')
+
+    def test_in_stock_price_filters_use_an_index(self):
+        for params in [{'price__gt': '10'}, {'price__lt': '10'},
+                       {'price__range': '5,10'}]:
+            with self.subTest(params=params):
+                filtered = ProductFilter(params, queryset=Product.objects.all()).qs
+                self.assert_uses_index(filtered.filter(stock__gt=0), 'api_product')
+
+
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        registry.reset()
+        self.user = User.objects.create_user(username='budget', password='test')
+        products = [
+            Product.objects.create(
+                name=f'Budget {i}', description='', price=Decimal('1.00'), stock=50)
+            for i in range(8)
+        ]
+        for _ in range(6):
+            order = Order.objects.create(user=self.user)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1)
+        self.product = products[0]
+        self.order = order
+
+    def assert_within_budget(self, response):
+        metrics = response.query_metrics
+        self.assertIsNotNone(metrics.budget, f'{metrics.view} declares no budget')
+        self.assertLessEqual(
+            metrics.count, metrics.budget,
+            f'{metrics.method} {metrics.view} ran {metrics.count} queries')
+        self.assertEqual(metrics.repeated, {}, metrics.view)
+
+    def test_read_endpoints_stay_within_their_budgets(self):
+        anonymous = ['/products/', '/products/?count=1&ordering=price',
+                     f'/products/{self.product.pk}/', '/products/info/', '/users/']
+        authenticated = ['/orders/', '/orders/?count=1&status=pending',
+                         f'/orders/{self.order.order_id}/', reverse('user-orders'),
+                         '/products/']
+        for url in anonymous:
+            with self.subTest(url=url):
+                self.assert_within_budget(self.client.get(url))
+        self.client.force_login(self.user)
+        for url in authenticated:
+            with self.subTest(url=url, user=True):
+                self.assert_within_budget(self.client.get(url))
+
+    def test_repeated_query_shapes_are_flagged(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            # OrderItem.__str__ loads its product and order one row at a time
+            [str(item) for item in OrderItem.objects.all()[:6]]
+        self.assertEqual(recorder.count, 13)
+        self.assertEqual(len(recorder.repeated_shapes(5)), 2)
+
+    def test_in_lists_of_any_length_share_a_shape(self):
+        self.assertEqual(
+            query_shape('SELECT 1 WHERE id IN (%s, %s)'),
+            query_shape('SELECT 1 WHERE id IN (%s, %s, %s, %s)'))
+
+    def test_metrics_are_exported_in_prometheus_format(self):
+        self.client.get('/products/')
+        admin = User.objects.create_user(
+            username='ops', password='test', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE api_db_queries_total counter', body)
+        self.assertIn(
+            'api_requests_total{view="ProductListCreateAPIView",method="GET"} 1', body)
+        self.assertIn('api_response_cache_misses_total 1', body)
+
+
+@override_settings(API_PROFILING={
+    'ENABLED': True, 'RATE': 0, 'SLOW_REQUEST_MS': None,
+    'ALLOW_PATHS': [], 'DENY_PATHS': ['/metrics/'],
+})
+class SamplingProfilerTestCase(TestCase):
+    databases = {'default', 'silk'}
+
+    def setUp(self):
+        get_response_cache().clear()
+        Product.objects.create(
+            name='Sampled', description='', price=Decimal('1.00'), stock=1)
+        self.buffer = ProfileBuffer(background=False)
+        patcher = mock.patch('api.profiling.buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def profiling(self, **options):
+        return override_settings(
+            API_PROFILING={**settings.API_PROFILING, **options})
+
+    def test_unsampled_fast_requests_are_not_recorded(self):
+        self.client.get('/products/')
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_sampled_requests_are_written_in_one_batch(self):
+        with self.profiling(RATE=1):
+            self.client.get('/products/')
+            self.client.get('/products/info/')
+            self.assertEqual(len(self.buffer), 2)
+            with CaptureQueriesContext(connections['silk']) as captured:
+                self.buffer.flush()
+
+        inserts = [q for q in captured if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(SilkRequest.objects.count(), 2)
+        profile = SilkRequest.objects.get(path='/products/')
+        self.assertEqual(profile.response.status_code, 200)
+        self.assertGreater(profile.num_sql_queries, 0)
+        self.assertEqual(profile.queries.count(), profile.num_sql_queries)
+
+    def test_slow_requests_are_always_recorded_without_sql(self):
+        with self.profiling(SLOW_REQUEST_MS=0):
+            self.client.get('/products/')
+            self.buffer.flush()
+        profile = SilkRequest.objects.get()
+        self.assertGreater(profile.num_sql_queries, 0)
+        self.assertEqual(profile.queries.count(), 0)
+
+    def test_allow_and_deny_lists_filter_paths(self):
+        with self.profiling(RATE=1, ALLOW_PATHS=['/orders/']):
+            self.client.get('/products/')
+        with self.profiling(RATE=1):
+            self.client.get('/metrics/')
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_buffer_drops_oldest_profiles_when_full(self):
+        with self.profiling(RATE=1, MAX_BUFFERED=2):
+            for _ in range(3):
+                self.client.get('/products/')
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.dropped, 1)
+
+    def test_silk_tables_live_on_the_profiling_database(self):
+        self.assertEqual(ProfilingRouter().db_for_write(SilkRequest), 'silk')
+        self.assertNotIn('silk_request', connection.introspection.table_names())
+
+
+class BenchmarkAPICommandTestCase(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create([
+            Product(name=f'Bench Lamp {i}', description='', price=Decimal('2.00'), stock=100)
+            for i in range(5)
+        ])
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.output = output.name
+        self.addCleanup(os.remove, self.output)
+
+    def benchmark(self, *args):
+        call_command(
+            'benchmark_api', '--concurrency', '1', '--requests', '3',
+            '--warmup', '0', *args, stdout=io.StringIO())
+
+    def test_results_are_written_as_json(self):
+        self.benchmark('--output', self.output)
+        with open(self.output, encoding='utf-8') as file:
+            results = json.load(file)
+
+        self.assertEqual(
+            sorted(results['workloads']),
+            ['browse', 'order_create', 'order_list', 'search'])
+        for name, result in results['workloads'].items():
+            with self.subTest(workload=name):
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['queries_per_request'], 0)
+                self.assertLessEqual(
+                    result['latency_ms']['p50'], result['latency_ms']['p99'])
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_regressions_against_the_baseline_fail(self):
+        self.benchmark('--workload', 'browse', '--output', self.output)
+        with open(self.output, encoding='utf-8') as file:
+            baseline = json.load(file)
+        baseline['workloads']['browse']['queries_per_request'] = 0.5
+        with open(self.output, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file)
+
+        with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+            self.benchmark(
+                '--workload', 'browse', '--baseline', self.output,
+                '--tolerance', '1000')
+
+
+class PopulateDBCommandTestCase(TestCase):
+    def populate(self, *args):
+        call_command(
+            'populate_db', '--users', '5', '--products', '12', '--orders', '30',
+            '--batch-size', '7', '--seed', '4', *args, stdout=io.StringIO())
+
+    def test_rows_are_created_in_batches_with_consistent_totals(self):
+        self.populate()
+
+        self.assertEqual(Product.objects.count(), 12)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith='customer').count(), 5)
+        for order in Order.objects.prefetch_related('items'):
+            items = list(order.items.all())
+            self.assertEqual(order.item_count, len(items))
+            self.assertEqual(
+                order.total_price, sum(item.item_subtotal for item in items))
+
+    def test_the_same_seed_generates_the_same_orders(self):
+        self.populate()
+        first = set(Order.objects.values_list('order_id', flat=True))
+        self.populate()
+        self.assertEqual(set(Order.objects.values_list('order_id', flat=True)), first)
+        self.populate('--seed', '5')
+        self.assertFalse(first & set(Order.objects.values_list('order_id', flat=True)))
+
+    def test_hot_products_appear_in_most_orders(self):
+        self.populate('--hot-products', '0.1', '--hot-share', '0.9')
+        lines = OrderItem.objects.values('product').annotate(n=Count('pk'))
+        busiest = max(row['n'] for row in lines)
+        self.assertGreater(busiest, Order.objects.count() * 2 / 3)
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='async', password='test')
+        products = [
+            Product.objects.create(
+                name=f'Async Lamp {i}', description='desk lamp',
+                price=Decimal(f'{i + 1}.50'), stock=10 * i)
+            for i in range(25)
+        ]
+        for product in products[:3]:
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.create(order=order, product=product, quantity=2)
+        self.product = products[4]
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'Authorization': f'Bearer {token}'}
+
+    def get_both(self, path, **kwargs):
+        sync = self.client.get(path, **kwargs)
+        asynchronous = async_to_sync(self.async_client.get)(f'/async{path}', **kwargs)
+        return sync, asynchronous
+
+    def assert_same_page(self, path):
+        sync, asynchronous = self.get_both(path)
+        self.assertEqual(asynchronous.status_code, status.HTTP_200_OK)
+        sync_data, async_data = sync.json(), asynchronous.json()
+        self.assertEqual(async_data['results'], sync_data['results'])
+        self.assertEqual(
+            parse_qs(urlparse(async_data['next']).query),
+            parse_qs(urlparse(sync_data['next']).query))
+        return async_data
+
+    def test_product_list_matches_the_sync_view(self):
+        self.assert_same_page('/products/')
+        self.assert_same_page('/products/?ordering=-price&price__gt=3&count=1')
+        data = self.assert_same_page('/products/?search=lamp')
+        next_path = urlparse(data['next'])
+        self.assert_same_page(f'/products/?{next_path.query}')
+
+    def test_product_detail_and_info_match_the_sync_views(self):
+        sync, asynchronous = self.get_both(f'/products/{self.product.pk}/')
+        self.assertEqual(asynchronous.json(), sync.json())
+
+        sync, asynchronous = self.get_both('/products/999999/')
+        self.assertEqual(asynchronous.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(asynchronous.json(), sync.json())
+
+        sync, asynchronous = self.get_both('/products/info/')
+        sync_data, async_data = sync.json(), asynchronous.json()
+        for data in (sync_data, async_data):
+            data.pop('next')
+        self.assertEqual(async_data, sync_data)
+
+    def test_user_orders_need_a_jwt_and_match_the_sync_view(self):
+        sync, asynchronous = self.get_both('/user-orders/')
+        self.assertEqual(asynchronous.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(asynchronous.json(), sync.json())
+        self.assertEqual(asynchronous['WWW-Authenticate'], sync['WWW-Authenticate'])
+
+        sync, asynchronous = self.get_both('/user-orders/', headers=self.auth)
+        self.assertEqual(asynchronous.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(asynchronous.json()), 3)
+        self.assertEqual(asynchronous.json(), sync.json())
+
+    def test_queries_are_counted_on_the_async_path(self):
+        response = async_to_sync(self.async_client.get)(
+            '/async/user-orders/', headers=self.auth)
+        self.assertEqual(response.query_metrics.view, 'AsyncUserOrdersView')
+        # user, orders, items
+        self.assertEqual(response.query_metrics.count, 3)
+
+
+class CompiledSerializerParityTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='parity', password='test', is_staff=True, first_name='Zoë')
+        prices = ['0.10', '1.00', '19.99', '12345678.90', '7.05']
+        products = [
+            Product.objects.create(
+                name=name, description=description, price=Decimal(price), stock=stock)
+            for name, description, price, stock in zip(
+                ['Lamp', 'Chaise "longue"', 'Ünïcode ☃', 'Desk', 'Pen'],
+                ['', 'multi\nline', 'émoji 🎉', 'x' * 300, 'plain'],
+                prices, [0, 1, 5, 100, 7])
+        ]
+        for status_value, chosen in [
+            (Order.StatusChoices.PENDING, products[3:0:-1]),
+            (Order.StatusChoices.CANCELLED, products),
+            (Order.StatusChoices.SHIPPED, []),
+        ]:
+            order = Order.objects.create(user=self.user, status=status_value)
+            for quantity, product in enumerate(chosen, start=1):
+                OrderItem.objects.create(order=order, product=product, quantity=quantity)
+            order.recalculate_totals()
+        self.client.force_login(self.user)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_compiled_plans_render_the_same_json(self):
+        cases = [
+            (ProductSerializer, Product.objects.all()),
+            (OrderSerializer, Order.objects.prefetch_items()),
+            (OrderItemSerializer, OrderItem.objects.select_related('product')),
+            (UserSerializer, User.objects.all()),
+        ]
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer=serializer_class.__name__):
+                compiled = compiled_serializer(serializer_class)
+                self.assertEqual(
+                    self.render(compiled.many(queryset)),
+                    self.render(serializer_class(queryset, many=True).data))
+                instance = queryset.first()
+                self.assertEqual(
+                    self.render(compiled.to_representation(instance)),
+                    self.render(serializer_class(instance).data))
+
+    def test_endpoints_render_the_same_bytes_either_way(self):
+        order = Order.objects.filter(status='pending').get()
+        urls = [
+            '/products/', '/products/?ordering=-price', '/products/?search=lamp',
+            f'/products/{Product.objects.first().pk}/',
+            '/orders/', '/orders/?status=cancelled', f'/orders/{order.order_id}/',
+            '/orders/user-orders/', reverse('user-orders'),
+            '/products/?format=ndjson', '/orders/?format=csv', '/users/?format=ndjson',
+            '/async/products/', '/async/user-orders/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with override_settings(API_COMPILED_SERIALIZERS=False):
+                    expected = self.client.get(url)
+                actual = self.client.get(url)
+                self.assertEqual(actual.status_code, status.HTTP_200_OK)
+                self.assertEqual(b''.join(actual), b''.join(expected))
+
+    def test_request_dependent_fields_are_not_compiled(self):
+        class ProductImageSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Product
+                fields = ('id', 'image')
+
+        with self.assertRaises(ImproperlyConfigured):
+            compiled_serializer(ProductImageSerializer)
+
+
+class FastJSONRendererTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='renderer', password='test')
+        product = Product.objects.create(
+            name='Lamp\u2028', description='☃', price=Decimal('19.99'), stock=3)
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=product, quantity=3)
+        order.recalculate_totals()
+        self.client.force_login(self.user)
+
+    def payload(self):
+        return {
+            'price': Decimal('19.99'),
+            'total': Decimal('12345678.90'),
+            'order_id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'utc': datetime(2024, 5, 1, 12, 30, 15, 120000, tzinfo=dt_timezone.utc),
+            'offset': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=5, minutes=30))),
+            'naive': datetime(2024, 5, 1, 12, 30),
+            'day': date(2024, 5, 1),
+            'lazy': gettext_lazy('Not found.'),
+            'error': ErrorDetail('Invalid', code='invalid'),
+            'text': 'Zoë \u2028 \u2029 "quoted" 🎉',
+            'nested': [{1: 0.1, 'ok': True, 'none': None, 'items': (1, 2)}],
+        }
+
+    def test_encoders_match_drf_bytes(self):
+        expected = JSONRenderer().render(self.payload())
+        encoders = {
+            'python': renderers.python_dumps,
+            'renderer': FastJSONRenderer().render,
+        }
+        if renderers.orjson is not None:
+            encoders['orjson'] = renderers.orjson_dumps
+        for name, encode in encoders.items():
+            with self.subTest(encoder=name):
+                output = encode(self.payload())
+                if name != 'renderer':
+                    # The raw encoders leave U+2028/U+2029 to the renderer.
+                    output = output.replace('\u2028'.encode(), b'\\u2028') \
+                        .replace('\u2029'.encode(), b'\\u2029')
+                self.assertEqual(output, expected)
+
+    @unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_python_fallback_when_orjson_is_missing(self):
+        with mock.patch.object(FastJSONRenderer, 'encode',
+                               staticmethod(renderers.python_dumps)):
+            self.assertEqual(FastJSONRenderer().render(self.payload()),
+                             JSONRenderer().render(self.payload()))
+
+    def test_api_responses_use_the_fast_renderer(self):
+        for url in ['/orders/', '/products/', reverse('user-orders'), '/async/user-orders/']:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_ACCEPT='application/json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    response.content, JSONRenderer().render(response.json()))
+                if hasattr(response, 'accepted_renderer'):
+                    self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+
+    def test_indented_output_is_left_to_drf(self):
+        response = self.client.get(
+            '/orders/', HTTP_ACCEPT='application/json; indent=2')
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(response.json(), 'application/json; indent=2'))
+        self.assertIn(b'\n  ', response.content)
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sparse', password='test')
+        products = [
+            Product.objects.create(
+                name=f'Product {i}', description='long text ' * 50,
+                price=Decimal(f'{i}.50'), stock=10)
+            for i in range(1, 4)
+        ]
+        for _ in range(3):
+            order = Order.objects.create(user=self.user)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=2)
+            order.recalculate_totals()
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.json(), app_queries(captured)
+
+    def test_fields_prune_columns_and_prefetch(self):
+        data, queries = self.get('/orders/?fields=order_id,status,created_at')
+        for order in data['results']:
+            self.assertEqual(list(order), ['order_id', 'created_at', 'status'])
+        self.assertFalse(any('api_orderitem' in q['sql'] for q in queries))
+        page_query = queries[-1]['sql']
+        self.assertIn('"api_order"."status"', page_query)
+        self.assertNotIn('"api_order"."total_price"', page_query)
+
+    def test_expand_items_brings_back_the_prefetch(self):
+        data, queries = self.get('/orders/?fields=order_id,total_price&expand=items')
+        order = data['results'][0]
+        self.assertEqual(list(order), ['order_id', 'items', 'total_price'])
+        self.assertEqual(len(order['items']), 3)
+        self.assertEqual(order['total_price'], 15.0)
+        self.assertEqual(
+            sum('api_orderitem' in q['sql'] for q in queries), 1)
+
+    def test_sparse_output_matches_full_output(self):
+        full, _ = self.get(reverse('user-orders'))
+        for compiled in (True, False):
+            with self.subTest(compiled=compiled), \
+                    override_settings(API_COMPILED_SERIALIZERS=compiled):
+                sparse, _ = self.get(f"{reverse('user-orders')}?fields=order_id,items,item_count")
+                self.assertEqual(sparse, [
+                    {name: order[name] for name in ('order_id', 'items', 'item_count')}
+                    for order in full
+                ])
+
+    def test_products_keep_keyset_cursors_without_extra_queries(self):
+        Product.objects.bulk_create([
+            Product(name=f'Filler {i}', description='', price=Decimal('9.99'), stock=1)
+            for i in range(25)
+        ])
+        data, queries = self.get('/products/?fields=name&ordering=-price')
+        self.assertEqual(list(data['results'][0]), ['name'])
+        self.assertNotIn('"description"', queries[-1]['sql'])
+        # Session, user, conditional GET validators and the page: the price
+        # the cursor needs is not read row by row.
+        self.assertEqual(len(queries), 4)
+        second, _ = self.get(data['next'])
+        self.assertEqual(len(data['results']) + len(second['results']), 28)
+
+    def test_unknown_fields_are_rejected(self):
+        for url in ['/orders/?fields=order_id,secret', '/orders/?expand=user',
+                    '/products/?fields=cost']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductBulkAPITestCase(TestCase):
+    url = '/products/bulk/'
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='feed', password='test', is_staff=True)
+        self.lamp = Product.objects.create(
+            name='Lamp', description='desk lamp', price=Decimal('10.00'), stock=5)
+        self.chair = Product.objects.create(
+            name='Chair', description='', price=Decimal('30.00'), stock=2)
+        self.client.force_login(self.admin)
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post(self.url, body, content_type=content_type)
+
+    def test_json_array_creates_updates_and_deletes(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([
+                {'name': 'Desk', 'description': 'oak', 'price': '99.00', 'stock': 3},
+                {'id': self.lamp.pk, 'price': '12.50'},
+                {'id': self.chair.pk, 'op': 'delete'},
+                {'name': 'Free', 'description': 'gift', 'price': '0.00', 'stock': 1},
+                {'id': 999999, 'stock': 1},
+                'not a row',
+            ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.json()
+        self.assertEqual(
+            (report['created'], report['updated'], report['deleted'], report['errors']),
+            (1, 1, 1, 3))
+        self.assertEqual(
+            [result['status'] for result in report['results']],
+            ['created', 'updated', 'deleted', 'error', 'error', 'error'])
+        self.assertIn('price', report['results'][3]['errors'])
+        self.assertEqual(
+            report['results'][0]['id'], Product.objects.get(name='Desk').pk)
+
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.price, self.lamp.stock), (Decimal('12.50'), 5))
+        self.assertFalse(Product.objects.filter(pk=self.chair.pk).exists())
+        self.assertFalse(Product.objects.filter(name='Free').exists())
+        # One bump for the whole request, not one per row.
+        self.assertEqual(get_catalog_version(), version + 1)
+        search = self.client.get('/products/?search=desk')
+        self.assertEqual(
+            [p['name'] for p in search.json()['results']], ['Desk', 'Lamp'])
+
+    def test_updates_only_write_the_columns_they_send(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.post([{'id': self.lamp.pk, 'price': '11.00'},
+                       {'id': self.chair.pk, 'price': '31.00'}])
+        # executemany is logged as "<n> times: UPDATE ...".
+        updates = [q['sql'] for q in captured.captured_queries
+                   if 'UPDATE "api_product"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"price"', updates[0])
+        self.assertNotIn('"stock"', updates[0])
+
+    def test_ndjson_stream_in_chunks_reports_bad_lines(self):
+        lines = [
+            json.dumps({'name': f'Item {i}', 'description': 'bulk', 'price': '1.00', 'stock': i})
+            for i in range(5)
+        ]
+        lines.insert(2, '{broken')
+        body = '\n'.join(lines) + '\n\n'
+        with mock.patch.object(api_bulk.ProductBulkWriter, 'chunk_size', 2):
+            response = self.post(body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.json()
+        self.assertEqual((report['created'], report['errors']), (5, 1))
+        self.assertEqual([r['index'] for r in report['results']], list(range(6)))
+        self.assertIn('Line 3', report['results'][2]['errors']['non_field_errors'][0])
+        self.assertEqual(Product.objects.filter(name__startswith='Item').count(), 5)
+
+    def test_requires_admin_and_a_list(self):
+        self.assertEqual(self.post({'name': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_login(User.objects.create_user(username='shopper'))
+        self.assertEqual(self.post([]).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(username='cached', password='secret-pass')
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.authentication = CachedJWTAuthentication()
+
+    def test_warm_cache_authenticates_without_queries(self):
+        user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(0):
+            cached, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(cached, self.user)
+        # Each request gets its own copy.
+        cached.first_name = 'changed'
+        self.assertEqual(
+            self.authentication.authenticate(self.request)[0].first_name, '')
+
+    def test_saving_the_user_invalidates_it(self):
+        self.authentication.authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_blacklisted_tokens_are_rejected(self):
+        jti = self.token['jti']
+        with mock.patch.object(auth.TokenBlacklist, 'refresh_if_stale'), \
+                mock.patch.object(auth.blacklist, '_jtis', frozenset({jti})):
+            with self.assertRaises(InvalidToken):
+                self.authentication.authenticate(self.request)
+
+    def test_orders_endpoint_and_async_view_use_the_cache(self):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        self.client.get('/user-orders/', **headers)
+        for url in ['/user-orders/', '/async/user-orders/']:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url, **headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(any(
+                    '"api_user"' in q['sql'] for q in captured.captured_queries))
+
+    def test_last_login_writes_are_coalesced(self):
+        buffer = auth.LastLoginBuffer(background=False)
+        with mock.patch.object(auth, 'last_logins', buffer):
+            for _ in range(3):
+                response = self.client.post(
+                    '/api/token/', {'username': 'cached', 'password': 'secret-pass'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.user.refresh_from_db()
+            self.assertIsNone(self.user.last_login)
+            self.assertEqual(len(buffer), 1)
+            with self.assertNumQueries(1):
+                buffer.flush()
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_schema_declares_the_bearer_scheme(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        self.assertIn('jwtAuth', schema['components']['securitySchemes'])
+        self.assertIn(
+            {'jwtAuth': []}, schema['paths']['/products/']['post']['security'])
+        self.assertIn(
+            'access', schema['components']['schemas']['TokenObtainPair']['properties'])
+
+
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    Routes reads between the test database and a second SQLite file
+    standing in for a replica, which holds different rows so the tests can
+    tell where each read went.
+    """
+    replica = 'test_replica'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        cls.replica_file.close()
+        connections.settings[cls.replica] = {
+            **connections['default'].settings_dict,
+            'NAME': cls.replica_file.name,
+        }
+        # Added after the runner has checked ``databases`` against settings.
+        cls.databases = cls.databases | {cls.replica}
+        call_command('migrate', database=cls.replica, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        os.remove(cls.replica_file.name)
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().clear()
+        get_response_cache().clear()
+        overrides = override_settings(
+            API_DATABASE_REPLICAS={'REPLICAS': [self.replica]})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        Product.objects.using(self.replica).create(  # pylint: disable=no-member
+            name='Replica only', description='Only on the replica',
+            price=Decimal('1.00'), stock=1)
+        Product.objects.create(  # pylint: disable=no-member
+            name='Primary only', description='Only on the primary',
+            price=Decimal('2.00'), stock=2)
+        self.admin = User.objects.create_superuser(
+            username='admin', password='secret-pass')
+        self.user = User.objects.create_user(
+            username='reader', password='secret-pass')
+
+    def client_for(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return self.client_class(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    @staticmethod
+    def names(response):
+        return {product['name'] for product in response.json()['results']}
+
+    def test_safe_requests_read_from_the_replica(self):
+        response = self.client_for(self.user).get('/products/')
+        self.assertEqual(self.names(response), {'Replica only'})
+
+    def test_shared_caches_are_filled_from_the_primary(self):
+        response = self.client.get('/products/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.names(response), {'Primary only'})
+        info = self.client_for(self.user).get('/products/info/').json()
+        self.assertEqual(info['count'], 1)
+        self.assertEqual(info['max_price'], 2.0)
+
+    def test_catalog_versioned_responses_are_read_from_the_primary(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        reader = self.client_for(self.user)
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory.name}}):
+            # The ETag names the current catalog version; so must the body.
+            response = reader.get('/products/')
+            self.assertEqual(self.names(response), {'Primary only'})
+            self.assertNotIn('Last-Modified', response)
+
+    def test_async_views_read_from_the_replica(self):
+        response = self.client_for(self.user).get('/async/products/')
+        self.assertEqual(self.names(response), {'Replica only'})
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        writer = self.client_for(self.admin)
+        response = writer.post('/products/', {
+            'name': 'Written', 'description': 'Just written',
+            'price': '3.00', 'stock': 3})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.names(writer.get('/products/')), {'Primary only', 'Written'})
+        # Other clients are not pinned.
+        self.assertEqual(
+            self.names(self.client_for(self.user).get('/products/')),
+            {'Replica only'})
+
+    def test_router_keeps_writes_and_transactions_on_the_primary(self):
+        token = replica_reads.set(True)
+        self.addCleanup(replica_reads.reset, token)
+        self.assertEqual(router.db_for_read(Product), self.replica)
+        # Users are not in MODELS.
+        self.assertEqual(router.db_for_read(User), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertEqual(router.db_for_read(Product), self.replica)
+        with primary_reads():
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertFalse(router.allow_migrate(self.replica, 'api'))
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(
+            list(Product.objects.values_list('name', flat=True)),  # pylint: disable=no-member
+            ['Primary only'])
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='outbox', password='test', email='outbox@example.com')
+        self.mug = Product.objects.create(
+            name='Mug', description='', price=Decimal('8.00'), stock=5)
+        self.client.force_login(self.user)
+        self.handled = []
+
+    def place_order(self, quantity=1):
+        return self.client.post(
+            '/orders/', {'items': [{'product': self.mug.pk, 'quantity': quantity}]},
+            content_type='application/json')
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list(
+            'event_type', flat=True))
+
+    def record(self, event):
+        self.handled.append((event.order_id, event.event_type))
+
+    def dispatcher(self, handler=None):
+        handlers = {'order.created': [handler or self.record],
+                    'order.shipped': [self.record]}
+        return OutboxDispatcher(handlers=handlers, workers=1)
+
+    def make_order(self, *event_types):
+        with transaction.atomic():
+            order = Order.objects.create(user=self.user)
+            for event_type in event_types:
+                record_event(order, event_type)
+        return order
+
+    def test_checkout_writes_the_event_with_the_order(self):
+        response = self.place_order(2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.event_type, 'order.created')
+        self.assertEqual(str(event.order_id), response.json()['order_id'])
+        self.assertEqual(event.payload['items'], [
+            {'product': self.mug.pk, 'quantity': 2, 'unit_price': '8.00'}])
+        # A rejected order leaves no event behind.
+        self.assertEqual(self.place_order(10).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_status_transitions_write_events(self):
+        order_id = self.place_order().json()['order_id']
+        for new_status in ['confirmed', 'shipped', 'shipped', 'cancelled']:
+            self.client.patch(f'/orders/{order_id}/', {'status': new_status},
+                              content_type='application/json')
+        self.assertEqual(
+            self.events(), ['order.created', 'order.shipped', 'order.cancelled'])
+        self.assertEqual(
+            OutboxEvent.objects.last().payload['previous_status'], 'shipped')
+
+    def test_dispatch_delivers_each_order_in_sequence(self):
+        first = self.make_order('order.created', 'order.shipped')
+        second = self.make_order('order.created')
+        self.assertEqual(self.dispatcher().dispatch_batch(), {'dispatched': 3})
+        self.assertEqual(self.handled, [
+            (first.pk, 'order.created'), (first.pk, 'order.shipped'),
+            (second.pk, 'order.created')])
+        self.assertFalse(OutboxEvent.objects.exclude(
+            status=OutboxEvent.StatusChoices.DISPATCHED).exists())
+        self.assertEqual(self.dispatcher().dispatch_batch(), {})
+
+    def test_failures_are_retried_ahead_of_later_events(self):
+        order = self.make_order('order.created', 'order.shipped')
+        other = self.make_order('order.created')
+
+        def flaky(event):
+            if event.order_id == order.pk and not self.handled:
+                self.handled.append(None)
+                raise ConnectionError('ERP unavailable')
+            self.record(event)
+
+        dispatcher = self.dispatcher(flaky)
+        with self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(dispatcher.dispatch_batch(),
+                             {'retried': 1, 'dispatched': 1})
+        self.assertEqual(self.handled, [None, (other.pk, 'order.created')])
+        failed = OutboxEvent.objects.filter(order_id=order.pk).first()
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('ERP unavailable', failed.last_error)
+        # The shipped event waits behind the failed one.
+        self.assertEqual(dispatcher.dispatch_batch(), {})
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.assertEqual(dispatcher.dispatch_batch(), {'dispatched': 2})
+        self.assertEqual(self.handled[2:], [
+            (order.pk, 'order.created'), (order.pk, 'order.shipped')])
+
+    def test_events_out_of_attempts_are_marked_failed(self):
+        self.make_order('order.created', 'order.shipped')
+
+        def broken(event):
+            raise ValueError('bad payload')
+
+        with override_settings(API_OUTBOX={'MAX_ATTEMPTS': 1}), \
+                self.assertLogs('api.outbox', 'ERROR'):
+            outcomes = self.dispatcher(broken).dispatch_batch()
+        self.assertEqual(outcomes, {'failed': 1, 'dispatched': 1})
+        self.assertEqual(
+            OutboxEvent.objects.get(event_type='order.created').status,
+            OutboxEvent.StatusChoices.FAILED)
+
+    def test_command_drains_the_outbox_with_the_configured_handlers(self):
+        self.place_order()
+        out = io.StringIO()
+        with self.assertLogs('api.inventory', 'WARNING') as logs:
+            call_command('dispatch_outbox', '--once', '--workers', '1', stdout=out)
+        self.assertIn('1 dispatched, 0 to retry, 0 failed', out.getvalue())
+        # The stock recount flags the mug, down to 4.
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('(Mug) is down to 4 in stock', logs.output[0])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['outbox@example.com'])
+        self.assertEqual(mail.outbox[0].subject, 'Your order has been created')
+
+
+class OutboxWorkerPoolTestCase(TransactionTestCase):
+    def test_workers_keep_each_orders_events_in_sequence(self):
+        user = User.objects.create_user(username='pool', password='test')
+        orders = []
+        for _ in range(6):
+            with transaction.atomic():
+                order = Order.objects.create(user=user)
+                for event_type in ['order.created', 'order.shipped',
+                                   'order.delivered']:
+                    record_event(order, event_type)
+            orders.append(order.pk)
+        handled = []
+        handlers = dict.fromkeys(
+            ['order.created', 'order.shipped', 'order.delivered'],
+            [lambda event: handled.append((event.order_id, event.event_type))])
+
+        outcomes = OutboxDispatcher(handlers=handlers, workers=4).dispatch_batch()
+        self.assertEqual(outcomes, {'dispatched': 18})
+        for order_id in orders:
+            self.assertEqual(
+                [event_type for pk, event_type in handled if pk == order_id],
+                ['order.created', 'order.shipped', 'order.delivered'])
+
+
+class SalesRollupTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='finance', password='test')
+        self.mug = Product.objects.create(
+            name='Mug', description='', price=Decimal('8.00'), stock=50)
+        self.cup = Product.objects.create(
+            name='Cup', description='', price=Decimal('4.50'), stock=50)
+        self.client.force_login(self.admin)
+        self.today = timezone.localdate()
+
+    def place_order(self, *lines):
+        response = self.client.post(
+            '/orders/',
+            {'items': [{'product': p.pk, 'quantity': q} for p, q in lines]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()['order_id']
+
+    def rollups(self):
+        return {
+            (row.product_id, row.status): (row.revenue, row.units)
+            for row in DailySales.objects.filter(units__gt=0)
+        }
+
+    def assert_rollups_match_rebuild(self):
+        kept = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(kept, self.rollups())
+
+    def test_order_writes_keep_the_rollups_current(self):
+        first = self.place_order((self.mug, 2), (self.cup, 1))
+        self.place_order((self.mug, 1))
+        self.assertEqual(self.rollups(), {
+            (self.mug.pk, 'pending'): (Decimal('24.00'), 3),
+            (self.cup.pk, 'pending'): (Decimal('4.50'), 1),
+        })
+
+        self.client.patch(f'/orders/{first}/', {'status': 'shipped'},
+                          content_type='application/json')
+        self.client.put(f'/orders/{first}/', {'items': [
+            {'product': self.cup.pk, 'quantity': 4}]},
+            content_type='application/json')
+        self.assertEqual(self.rollups(), {
+            (self.mug.pk, 'pending'): (Decimal('8.00'), 1),
+            (self.cup.pk, 'shipped'): (Decimal('18.00'), 4),
+        })
+        self.assert_rollups_match_rebuild()
+
+        self.client.delete(f'/orders/{first}/')
+        self.assertEqual(self.rollups(), {
+            (self.mug.pk, 'pending'): (Decimal('8.00'), 1)})
+        self.assert_rollups_match_rebuild()
+
+    def test_every_order_deletion_updates_the_rollups(self):
+        customer = User.objects.create_user(username='leaving', password='test')
+        self.place_order((self.mug, 1))
+        self.client.force_login(customer)
+        self.place_order((self.mug, 2), (self.cup, 1))
+        self.place_order((self.cup, 3))
+        self.assertEqual(self.rollups(), {
+            (self.mug.pk, 'pending'): (Decimal('24.00'), 3),
+            (self.cup.pk, 'pending'): (Decimal('18.00'), 4),
+        })
+
+        # The user's orders go by cascade, not through the API or admin.
+        customer.delete()
+        self.assertEqual(self.rollups(), {
+            (self.mug.pk, 'pending'): (Decimal('8.00'), 1)})
+        self.assert_rollups_match_rebuild()
+
+    def test_bulk_order_deletes_update_the_rollups_at_once(self):
+        for quantity in range(1, 9):
+            self.place_order((self.mug, quantity), (self.cup, 1))
+        self.place_order((self.cup, 2))
+        orders = Order.objects.filter(items__product=self.mug)
+        # Savepoint, grouped sales read, rollup upsert, the collector's
+        # read, two deletes and release, whatever the number of orders.
+        with self.assertNumQueries(7):
+            orders.delete()
+        self.assertEqual(self.rollups(), {
+            (self.cup.pk, 'pending'): (Decimal('9.00'), 2)})
+        self.assert_rollups_match_rebuild()
+
+    def test_rebuild_processes_history_in_chunks(self):
+        self.place_order((self.mug, 1))
+        old = Order.objects.create(
+            user=self.admin, status=Order.StatusChoices.DELIVERED)
+        OrderItem.objects.create(
+            order=old, product=self.cup, quantity=2, unit_price=Decimal('4.00'))
+        Order.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=40))
+        DailySales.objects.create(
+            date=self.today - timedelta(days=400), product=self.mug,
+            status='pending', revenue=Decimal('1.00'), units=1)
+
+        out = io.StringIO()
+        call_command('rebuild_sales_rollups', '--days', '7', stdout=out)
+        self.assertIn('in 6 chunk(s)', out.getvalue())
+        self.assertEqual(
+            set(DailySales.objects.values_list('date', 'product', 'status', 'units')),
+            {(self.today, self.mug.pk, 'pending', 1),
+             (self.today - timedelta(days=40), self.cup.pk, 'delivered', 2)})
+
+    def test_analytics_endpoint_reads_only_the_rollups(self):
+        self.place_order((self.mug, 2), (self.cup, 1))
+        order = self.place_order((self.mug, 1))
+        self.client.patch(f'/orders/{order}/', {'status': 'cancelled'},
+                          content_type='application/json')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/analytics/sales/', {
+                'created_at__range': f'{self.today},{self.today}',
+                'product__in': f'{self.mug.pk},{self.cup.pk}',
+                'group_by': 'product',
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'group_by': ['product'],
+            'totals': {'revenue': '28.50', 'units': 4},
+            'results': [
+                {'product': self.mug.pk, 'revenue': '24.00', 'units': 3},
+                {'product': self.cup.pk, 'revenue': '4.50', 'units': 1},
+            ],
+        })
+        tables = {'api_order"', 'api_orderitem"', 'api_product"'}
+        self.assertFalse([q for q in app_queries(queries)
+                          if any(table in q['sql'] for table in tables)])
+
+        response = self.client.get('/analytics/sales/', {
+            'status': 'cancelled', 'created_at__lt': str(self.today)})
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get('/analytics/sales/', {'status': 'cancelled'})
+        self.assertEqual(response.json()['results'], [{
+            'date': str(self.today), 'product': self.mug.pk,
+            'status': 'cancelled', 'revenue': '8.00', 'units': 1}])
+
+        self.assertEqual(
+            self.client.get('/analytics/sales/', {'group_by': 'user'}).status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.client.force_login(User.objects.create_user(username='shopper'))
+        self.assertEqual(self.client.get('/analytics/sales/').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+
+def image_bytes(color, size=(1200, 900), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class ImageRenditionTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.queue = images.RenditionQueue(background=False)
+        patcher = mock.patch.object(images, 'renditions', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(
+            User.objects.create_superuser(username='images', password='test'))
+
+    def upload(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/products/', {
+                'name': name, 'description': 'Pictured', 'price': '5.00',
+                'stock': 1, 'image': SimpleUploadedFile(f'{name}.png', data),
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()
+
+    def product_images(self, pk):
+        return self.client.get(f'/products/{pk}/').json()['images']
+
+    def test_uploads_are_rendered_off_the_request(self):
+        created = self.upload('Lamp', image_bytes('red'))
+        self.assertIsNone(created['images'])
+        self.assertNotIn('image', created)
+        self.assertEqual(len(self.queue), 1)
+
+        self.assertEqual(self.queue.flush(), {'rendered': 1})
+        urls = self.product_images(created['id'])
+        self.assertEqual(set(urls), {'thumb', 'thumb_webp', 'medium', 'medium_webp'})
+        digest = Product.objects.get(pk=created['id']).image_digest
+        self.assertEqual(urls['thumb'], f'/media/renditions/{digest[:2]}/{digest}/thumb.jpg')
+        for name, path in images.rendition_paths(digest).items():
+            with default_storage.open(path) as file, Image.open(file) as rendition:
+                self.assertEqual(rendition.format,
+                                 'WEBP' if name.endswith('_webp') else 'JPEG')
+                self.assertEqual(max(rendition.size),
+                                 160 if name.startswith('thumb') else 800)
+
+    def test_only_admins_create_products(self):
+        data = {'name': 'Lamp', 'description': '', 'price': '5.00', 'stock': 1,
+                'image': SimpleUploadedFile('lamp.png', image_bytes('red'))}
+        self.client.logout()
+        self.assertEqual(self.client.post('/products/', data).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.client.force_login(
+            User.objects.create_user(username='shopper', password='test'))
+        data['image'].seek(0)
+        self.assertEqual(self.client.post('/products/', data).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(self.queue), 0)
+        self.assertFalse(Product.objects.exists())
+
+    def test_duplicate_uploads_share_renditions(self):
+        first = self.upload('Lamp', image_bytes('red'))
+        self.queue.flush()
+        stored = sorted(default_storage.listdir('renditions')[0])
+
+        second = self.upload('Lamp again', image_bytes('red'))
+        self.assertEqual(self.queue.flush(), {'deduplicated': 1})
+        self.assertEqual(self.product_images(second['id']),
+                         self.product_images(first['id']))
+        self.assertEqual(sorted(default_storage.listdir('renditions')[0]), stored)
+
+    def test_single_uploads_are_rendered_in_the_pool(self):
+        created = self.upload('Lamp', image_bytes('red'))
+        builder = images.RenditionBuilder(workers=2)
+        self.queue._builder = builder  # pylint: disable=protected-access
+        with ThreadPoolExecutor(max_workers=1) as pool, \
+                mock.patch.object(builder, 'pool', return_value=pool) as get_pool:
+            self.assertEqual(self.queue.flush(), {'rendered': 1})
+        get_pool.assert_called_once_with()
+        self.assertEqual(len(self.product_images(created['id'])), 4)
+
+    def test_backfill_command_builds_the_catalog_in_parallel(self):
+        for index, color in enumerate(['red', 'green', 'blue', 'red']):
+            path = default_storage.save(
+                f'products/{index}.jpg', ContentFile(image_bytes(color, image_format='JPEG')))
+            Product.objects.create(
+                name=f'Backfilled {index}', description='', price=Decimal('1.00'),
+                stock=1, image=path)
+        default_storage.save('products/broken.jpg', ContentFile(b'not an image'))
+        Product.objects.create(name='Broken', description='', price=Decimal('1.00'),
+                               stock=1, image='products/broken.jpg')
+        Product.objects.create(name='Bare', description='', price=Decimal('1.00'), stock=1)
+        self.assertEqual(len(self.queue), 0)
+
+        out = io.StringIO()
+        with self.assertLogs('api.images', 'ERROR'):
+            call_command('build_image_renditions', '--workers', '2', stdout=out)
+        self.assertIn('3 rendered, 1 deduplicated, 0 unchanged, 1 failed', out.getvalue())
+        self.assertEqual(
+            Product.objects.exclude(image_digest='').values('image_digest')
+            .distinct().count(), 3)
+
+        out = io.StringIO()
+        with self.assertLogs('api.images', 'ERROR'):
+            call_command('build_image_renditions', '--missing', '--workers', '1',
+                         stdout=out)
+        self.assertIn('0 rendered, 0 deduplicated, 0 unchanged, 1 failed', out.getvalue())
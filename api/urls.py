@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 from rest_framework.routers import DefaultRouter
 
 
@@ -10,6 +10,16 @@ router.register(r'orders', views.OrderViewSet, basename='order')
 urlpatterns = [
     path('products/', views.ProductListCreateAPIView.as_view()),
     path('products/info/', views.ProductInfoAPIView.as_view()),
+    path('products/bulk/', views.ProductBulkAPIView.as_view()),
+    path('products/cache-stats/', views.CatalogCacheStatsAPIView.as_view()),
     path('products/<int:pk>/', views.ProductDetailAPIView.as_view()),
     path('users/', views.UserListAPIView.as_view()),
+    path('metrics/', views.QueryMetricsAPIView.as_view()),
+    path('user-orders/', views.UserOrdersAPIView.as_view(), name='user-orders'),
+    path('analytics/sales/', views.SalesAnalyticsAPIView.as_view()),
+    # Async (ASGI-native) versions of the read endpoints above
+    path('async/products/', async_views.AsyncProductListView.as_view()),
+    path('async/products/info/', async_views.AsyncProductInfoView.as_view()),
+    path('async/products/<int:pk>/', async_views.AsyncProductDetailView.as_view()),
+    path('async/user-orders/', async_views.AsyncUserOrdersView.as_view()),
 ] + router.urls
@@ -1,35 +1,61 @@
-from django.db.models import Max
+from collections.abc import Iterator
+
+from django.db import transaction
+from django.db.models import Sum
+from django.http import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, generics, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.filters import InStockFilterBackend, OrderFilter, ProductFilter
-from api.models import Order, Product, User
+from api.bulk import ProductBulkWriter
+from api.catalog import get_product_summary
+from api.filters import (InStockFilterBackend, OrderFilter, ProductFilter,
+                         SalesFilter)
+from api.inventory import (rebalance, released_quantities,
+                           reserved_quantities)
+from api.cache import get_response_cache
+from api.mixins import (CatalogCacheMixin, CompiledReadMixin,
+                        ConditionalGetMixin, SparseFieldsMixin,
+                        StreamingExportMixin)
+from api.metrics import registry
+from api.models import DailySales, Order, Product, User
+from api.pagination import KeysetPagination, ProductCursorPagination
+from api.parsers import NDJSONParser
+from api.search import FullTextSearchFilter
 from api.serializers import (OrderCreateSerializer, OrderSerializer,
                              ProductInfoSerializer, ProductSerializer,
-                             UserSerializer)
+                             SalesSerializer, UserSerializer)
 
 
 # All of this Generic API Views are Read-Only views.
-class ProductListCreateAPIView(generics.ListCreateAPIView):
+class ProductListCreateAPIView(ConditionalGetMixin, CatalogCacheMixin,
+                               StreamingExportMixin, SparseFieldsMixin,
+                               CompiledReadMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all()  # pylint: disable=no-member
     serializer_class = ProductSerializer
     filterset_class = ProductFilter
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        FullTextSearchFilter,
         filters.OrderingFilter,
         InStockFilterBackend
     ]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'stock']
+    pagination_class = KeysetPagination
+    query_budget = {'GET': 5}
+    sparse_columns = {'images': ['image_digest']}
+    catalog_versioned = True
+    export_exclude_fields = {'csv': ['images']}
 
     def get_permissions(self):
         self.permission_classes = [AllowAny]
-        if self.request.method in ["PUT", "PATCH", "DELETE"]:
+        if self.request.method in ["POST", "PUT", "PATCH", "DELETE"]:
             self.permission_classes = [IsAdminUser]
         return super().get_permissions()
 
@@ -40,12 +66,17 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
     #     return Response(serializer.data)
 
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailAPIView(ConditionalGetMixin, CatalogCacheMixin,
+                           SparseFieldsMixin, CompiledReadMixin,
+                           generics.RetrieveUpdateDestroyAPIView):
     """
     This view is used to retrieve, update, and delete a product.
     """
     queryset = Product.objects.all()  # pylint: disable=no-member
     serializer_class = ProductSerializer
+    query_budget = {'GET': 4}
+    sparse_columns = {'images': ['image_digest']}
+    catalog_versioned = True
 
     def get_permissions(self):
         self.permission_classes = [AllowAny]
@@ -60,21 +91,53 @@ class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     #     return Response(serializer.data)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class ProductBulkAPIView(APIView):
+    """
+    Creates, updates and deletes products in bulk. The body is a JSON
+    array of rows or an NDJSON stream, one row per line, which is read as
+    it is applied. See ``api.bulk.ProductBulkWriter`` for the row format.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        """
+        Apply the rows and report a result for each one.
+        """
+        rows = request.data
+        if not isinstance(rows, (list, Iterator)):
+            raise ParseError('Expected a list of rows.')
+        return Response(ProductBulkWriter().apply(rows))
+
+
+class OrderViewSet(ConditionalGetMixin, StreamingExportMixin, SparseFieldsMixin,
+                   CompiledReadMixin, viewsets.ModelViewSet):
     """
     This viewset is used to create, retrieve, update, and delete orders.
     """
-    queryset = Order.objects.prefetch_related(  # pylint: disable=no-member
-        "items__product")
+    queryset = Order.objects.prefetch_items()  # pylint: disable=no-member
 
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     filterset_class = OrderFilter
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    ordering_fields = ['created_at', 'order_id']
+    ordering = ['-created_at']
+    pagination_class = KeysetPagination
+    query_budget = {'GET': 6}
+    expandable_fields = {'items': 'prefetch_items'}
+    sparse_columns = {'total_price': ['total_price']}
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            items = instance.items.all()
+            rebalance(reserved_quantities(instance.status, items),
+                      released_quantities(instance.status, items))
+            instance.delete()
+
     def get_serializer_class(self):
         # can also check for POST - self.request.method == 'POST'
         if self.action == 'create' or self.action == 'update':
@@ -105,8 +168,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         """
 
         orders = self.get_queryset().filter(user=request.user)
-        serializer = self.get_serializer(orders, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize(orders, many=True))
 
     # @api_view(["GET"])
     # def order_list(request):
@@ -115,11 +177,16 @@ class OrderViewSet(viewsets.ModelViewSet):
     #     return Response(serializer.data)
 
 
-class UserOrdersAPIView(generics.ListAPIView):
-    queryset = Order.objects.prefetch_related(  # pylint: disable=no-member
-        "items__product")  # pylint: disable=no-member
+class UserOrdersAPIView(SparseFieldsMixin, CompiledReadMixin,
+                        generics.ListAPIView):
+    queryset = Order.objects.prefetch_items()  # pylint: disable=no-member
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    # Mirrors OrderViewSet.user_orders, which returns a plain list.
+    pagination_class = None
+    query_budget = {'GET': 4}
+    expandable_fields = OrderViewSet.expandable_fields
+    sparse_columns = OrderViewSet.sparse_columns
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -130,32 +197,95 @@ class ProductInfoAPIView(APIView):
     """
     This view is used to get the product info.
     """
+    pagination_class = ProductCursorPagination
+    query_budget = {'GET': 4}
 
     def get(self, request):
         """
-        This view is used to get the product info.
+        Return the cached catalog summary along with one cursor page of
+        products.
         """
-        products = Product.objects.all()  # pylint: disable=no-member
+        paginator = self.pagination_class()
+        products = paginator.paginate_queryset(
+            Product.objects.all(), request, view=self)  # pylint: disable=no-member
         serializer = ProductInfoSerializer({
             "products": products,
-            "count": len(products),
-            "max_price": products.aggregate(max_price=Max('price'))['max_price']
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            **get_product_summary(),
         })
 
         return Response(serializer.data)
-        # @api_view(['GET'])
-        # def product_info(request):
-        #     products = Product.objects.all()
-        #     serializer = ProductInfoSerializer({
-        #         "products": products,
-        #         "count": len(products),
-        #         "max_price": products.aggregate(max_price=Max('price'))['max_price']
-        #     })
 
-        #     return Response(serializer.data)
+
+class CatalogCacheStatsAPIView(APIView):
+    """
+    Hit and miss counters of this process's catalog response cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_response_cache().stats())
+
+
+class QueryMetricsAPIView(APIView):
+    """
+    Per-view query metrics of this process in Prometheus text format.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render_prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SalesAnalyticsAPIView(generics.GenericAPIView):
+    """
+    Revenue and units sold, summed by ``group_by`` (any of date, product
+    and status; all three by default), with totals. Reads only the
+    ``DailySales`` rollups, never the order tables.
+    """
+    queryset = DailySales.objects.all()  # pylint: disable=no-member
+    serializer_class = SalesSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = SalesFilter
+    pagination_class = None
+    group_by_param = 'group_by'
+    dimensions = ('date', 'product', 'status')
+    query_budget = {'GET': 4}
+
+    def get(self, request):
+        group_by = self.get_group_by()
+        queryset = self.filter_queryset(self.get_queryset())
+        sums = {'revenue': Sum('revenue', default=0), 'units': Sum('units', default=0)}
+        rows = queryset.values(*group_by).annotate(**sums).order_by(*group_by)
+        return Response({
+            'group_by': group_by,
+            'totals': self.get_serializer(queryset.aggregate(**sums)).data,
+            'results': self.get_serializer(rows, many=True).data,
+        })
+
+    def get_group_by(self):
+        values = self.request.query_params.getlist(self.group_by_param)
+        names = [
+            name.strip() for value in values for name in value.split(',')
+            if name.strip()
+        ]
+        if not names:
+            return list(self.dimensions)
+        unknown = [name for name in names if name not in self.dimensions]
+        if unknown:
+            raise ValidationError({self.group_by_param: [
+                f'Unknown field(s): {", ".join(unknown)}. '
+                f'Choose from: {", ".join(self.dimensions)}.'
+            ]})
+        return [name for name in self.dimensions if name in names]
 
 
-class UserListAPIView(generics.ListAPIView):
+class UserListAPIView(StreamingExportMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = None
+    query_budget = {'GET': 3}
@@ -40,9 +40,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
+    'api.middleware.SamplingProfilerMiddleware',
+    'api.middleware.QueryMetricsMiddleware',
 
 ]
 
@@ -70,13 +72,53 @@ WSGI_APPLICATION = 'rest_ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# WAL lets readers run alongside the writer; IMMEDIATE transactions take
+# the write lock up front instead of failing to upgrade a read lock.
+SQLITE_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA cache_size=-20000'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read-only connection to the primary's file, standing in for a
+    # replica locally. Point it at a real replica in production.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only=1;PRAGMA cache_size=-20000',
+            'timeout': 20,
+        },
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Silk profiles, kept apart from application data. Create its tables
+    # with `python manage.py migrate --database silk`.
+    'silk': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'silk.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
 }
 
+DATABASE_ROUTERS = ['api.routers.ProfilingRouter', 'api.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -114,6 +156,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded product images and their renditions.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -123,7 +169,7 @@ AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
 
     ],
@@ -132,10 +178,65 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # Uses orjson when installed, plain json otherwise.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 
 }
 
+# Per-view SQL query counting (see api.middleware.QueryMetricsMiddleware).
+# A request that runs the same query shape this many times is reported as
+# a likely N+1.
+API_QUERY_METRICS = {
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+
+# Read-through cache for anonymous catalog GETs. Switch BACKEND to
+# 'api.cache.DjangoCacheBackend' (OPTIONS: {'alias': ...}) to share cached
+# responses between processes. Entries are keyed on the catalog version,
+# which lives in the default cache: that is the per-process LocMemCache
+# here, so with several worker processes configure a shared CACHES
+# 'default' (`check --deploy` warns otherwise, api.W001). Until then
+# product ETags come from the rows rather than the catalog version.
+API_RESPONSE_CACHE = {
+    'BACKEND': 'api.cache.LocMemLRUBackend',
+    'OPTIONS': {'max_entries': 1024},
+    'TIMEOUT': 300,
+}
+
+# Render read endpoints through precompiled serializer plans
+# (api.fast_serializers). Output is identical; turn off to compare.
+API_COMPILED_SERIALIZERS = True
+
+# Reads of safe requests that api.routers.ReplicaRouter may send to
+# replicas; see api.routers.REPLICA_DEFAULTS. The test suite turns this
+# off (api.tests.setUpModule): there the replica mirrors the primary's
+# test database.
+API_DATABASE_REPLICAS = {
+    'REPLICAS': ['replica'],
+    'PIN_SECONDS': 5,
+}
+
+# Sampled request profiling into Silk's tables (see
+# api.middleware.SamplingProfilerMiddleware). RATE is the fraction of
+# requests captured with their SQL; requests slower than SLOW_REQUEST_MS
+# are always captured. Captures are written in batches to DATABASE. Off in
+# the test suite.
+API_PROFILING = {
+    'ENABLED': True,
+    'RATE': 0.01,
+    'SLOW_REQUEST_MS': 500,
+    'ALLOW_PATHS': [],
+    'DENY_PATHS': ['/silk/', '/admin/', '/metrics/', '/static/'],
+    'DATABASE': 'silk',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 1.0,
+}
+SILKY_MIDDLEWARE_CLASS = 'api.middleware.SamplingProfilerMiddleware'
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Ecommerce API',
     'DESCRIPTION': 'Ecommerce API for managing products and orders',
@@ -165,4 +266,46 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Buffers UPDATE_LAST_LOGIN writes (see api.authentication).
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.TokenObtainPairSerializer',
+}
+
+# Users and the token blacklist kept in memory by
+# api.authentication.CachedJWTAuthentication.
+API_AUTH_CACHE = {
+    'USER_TTL': 60,
+    'MAX_USERS': 10000,
+    'BLACKLIST_REFRESH_INTERVAL': 30,
+    'LAST_LOGIN_FLUSH_INTERVAL': 10,
 }
+
+# Order events (api.outbox), written with the order and delivered by
+# `python manage.py dispatch_outbox`. Events that move stock also recount
+# it (api.inventory.recount_stock). ERP sync is not built in: add its
+# handler to HANDLERS. See api.outbox.DEFAULTS for the other keys.
+_ORDER_EVENT_HANDLERS = ['api.outbox.log_event', 'api.outbox.email_customer']
+API_OUTBOX = {
+    'HANDLERS': {
+        'order.created': [*_ORDER_EVENT_HANDLERS, 'api.inventory.recount_stock'],
+        'order.shipped': _ORDER_EVENT_HANDLERS,
+        'order.delivered': _ORDER_EVENT_HANDLERS,
+        'order.cancelled': [*_ORDER_EVENT_HANDLERS, 'api.inventory.recount_stock'],
+    },
+    'BATCH_SIZE': 100,
+    'WORKERS': 4,
+    'MAX_ATTEMPTS': 8,
+}
+
+# Stock level at or below which api.inventory.recount_stock warns.
+API_LOW_STOCK_THRESHOLD = 5
+
+# Renditions of product images (api.images), built off the request in a
+# process pool and stored under MEDIA_ROOT by content hash.
+API_IMAGES = {
+    'SIZES': {'thumb': 160, 'medium': 800},
+    'QUALITY': 82,
+    'WORKERS': None,
+}
+
+# Outbox emails go to the console locally; configure SMTP in production.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
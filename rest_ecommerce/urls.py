@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
@@ -22,3 +24,6 @@ urlpatterns = [
     path('api/schema/redoc/',
          SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 ]
+
+# Uploaded media; static() only adds this with DEBUG on.
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)